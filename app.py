@@ -1,25 +1,20 @@
 # app.py
 import argparse
-import os, json
 from datetime import datetime, timezone, timedelta
 from typing import List, Tuple
 
 from menu_item import Food, Drink, Dessert
-from menu_io import load_menus, save_menus
+from menu_io import load_menus, load_catalog
+from menu_repo import get_menu_repository
+from order_ids import new_order_id
+from order_store import get_order_store, record_time
+from totals import summarize
 
-HISTORY_FILE = os.path.join("data", "orders.json")
 JST = timezone(timedelta(hours=9))
 
 def build_catalog():
-    foods, drinks, desserts = load_menus()
-    catalog = []
-    for x in foods:
-        catalog.append(("Food", x))
-    for x in drinks:
-        catalog.append(("Drink", x))
-    for x in desserts:
-        catalog.append(("Dessert", x))
-    return catalog
+    # 番号 → 商品 はリストの添字で引く（Catalog はキャッシュ済みなので毎回読み直さない）
+    return [(item.CATEGORY, item) for item in load_catalog()]
 
 def show_menu(catalog):
     print("メニュー（番号で選択 / m=編集モード / q=終了）")
@@ -28,42 +23,19 @@ def show_menu(catalog):
         print(f"{i:>2} .[{cat}] {item.info()}")
     print("_" * 50)
 
-def summarize(selected_items):
-    total_price   = sum(getattr(it, "price", 0) for it in selected_items)
-    total_calorie = sum(getattr(it, "calorie", 0) for it in selected_items)
-    total_volume  = sum(getattr(it, "volume_ml", 0) for it in selected_items)
-    total_sugar   = sum(getattr(it, "sugar_g", 0) for it in selected_items)
-    return total_price, total_calorie, total_volume, total_sugar
-
-def _load_history_safely() -> list:
-    os.makedirs("data", exist_ok=True)
-    if not os.path.exists(HISTORY_FILE):
-        return []
-    try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data if isinstance(data, list) else []
-    except Exception:
-        try:
-            os.replace(HISTORY_FILE, HISTORY_FILE + ".broken")
-        except Exception:
-            pass
-        return []
-
 def save_order(order: List[Tuple[object, int]]):
     if not order:
         print("（空の注文は保存しませんでした）")
         return
 
-    history = _load_history_safely()
+    store = get_order_store()
     record = {
+        "id": new_order_id(),
         "timestamp": datetime.now(JST).isoformat(timespec="seconds"),
         "items":[{"name":it.name,"qty":qty,"price":getattr(it,"price",0)} for it,qty in order]
     }
-    history.append(record)
-    with open(HISTORY_FILE,"w",encoding="utf-8") as f:
-        json.dump(history,f,ensure_ascii=False,indent=2)
-    print(f"📝 注文履歴を保存しました → {HISTORY_FILE}")
+    store.append(record)
+    print(f"📝 注文履歴を保存しました → {store.location}")
 
 def print_receipt(order: List[Tuple[object, int]]):
     if not order:
@@ -72,18 +44,16 @@ def print_receipt(order: List[Tuple[object, int]]):
     from collections import OrderedDict
     grouped = OrderedDict()
     for item,qty in order:
-        grouped.setdefault(item.name, {"item":item,"qty":0})
-        grouped[item.name]["qty"] += qty
+        grouped.setdefault(item.id, {"item":item,"qty":0})
+        grouped[item.id]["qty"] += qty
 
     print("\n  最終注文内容")
-    for name, rec in grouped.items():
+    for rec in grouped.values():
         item = rec["item"]; qty = rec["qty"]
         print(f"- {item.info()}  × {qty}")
 
-    total_price   = sum(getattr(r["item"],"price",0)*r["qty"] for r in grouped.values())
-    total_calorie = sum(getattr(r["item"],"calorie",0)*r["qty"] for r in grouped.values())
-    total_volume  = sum(getattr(r["item"],"volume_ml",0)*r["qty"] for r in grouped.values())
-    total_sugar   = sum(getattr(r["item"],"sugar_g",0)*r["qty"] for r in grouped.values())
+    total_price, total_calorie, total_volume, total_sugar = summarize(
+        (r["item"], r["qty"]) for r in grouped.values())
 
     print("\n====== 合計 ======")
     print(f"金額: {total_price} 円")
@@ -92,22 +62,20 @@ def print_receipt(order: List[Tuple[object, int]]):
     if total_sugar:   print(f"糖質: {total_sugar} g")
 
 def show_history():
-    history = _load_history_safely()
+    history = get_order_store().latest(1)
     if not history:
         print("注文履歴はまだありません")
         return
     latest = history[-1]
     print("\n 最新の注文履歴")
-    print(f"日時: {latest.get('timestamp','-')}")
+    print(f"日時: {record_time(latest)}")
     for item in latest.get("items",[]):
         print(f"{item.get('name','?')} × {item.get('qty','?')} (¥{item.get('price','?')})")
     print("_"*50)
 
 def _print_subtotal(order: List[Tuple[object,int]]):
     if not order: return
-    items=[]
-    for it,qty in order: items.extend([it]*qty)
-    p,k,v,s = summarize(items)
+    p,k,v,s = summarize(order)
     line = f"— 小計 — 金額: {p} 円"
     if k: line += f" / {k} kcal"
     if v: line += f" / {v} ml"
@@ -160,15 +128,14 @@ def add_menu_item():
     volume   = _opt_int("容量(ml)［任意/Drink向け］: ")
     sugar    = _opt_int("糖質(g)［任意］: ")
 
-    foods, drinks, desserts = load_menus()
     if cat == "Food":
-        foods.append(Food(name=name, price=price, calorie=calorie or 0))
+        item = Food(name=name, price=price, calorie=calorie or 0)
     elif cat == "Drink":
-        drinks.append(Drink(name=name, price=price, volume_ml=volume or 0, sugar_g=sugar or 0))
+        item = Drink(name=name, price=price, volume_ml=volume or 0, sugar_g=sugar or 0)
     else:
-        desserts.append(Dessert(name=name, price=price, calorie=calorie or 0, sugar_g=sugar or 0))
-
-    save_menus(foods, drinks, desserts)
+        item = Dessert(name=name, price=price, calorie=calorie or 0, sugar_g=sugar or 0)
+    # menus.json は書き直さず、変更を1件だけ記録する（他プロセスの編集とも重ならない）
+    get_menu_repository().add(item)
     print(f"✅ 追加しました: [{cat}] {name}（¥{price}）")
 
 def delete_menu_item():
@@ -188,14 +155,50 @@ def delete_menu_item():
     idx = int(idx_s)
     if not (1 <= idx <= len(target)):
         print("範囲外です。"); return
-    removed = target.pop(idx-1)
-    save_menus(foods, drinks, desserts)
-    print(f"🗑️ 削除しました: {removed.name}")
+    chosen = target[idx-1]
+    # ID で消すので、入力待ちの間に他で編集されていても別の商品を消すことはない
+    try:
+        get_menu_repository().delete(chosen.id)
+    except KeyError:
+        print("その項目はすでに削除されています。"); return
+    print(f"🗑️ 削除しました: {chosen.name}")
 
 # ===== メイン =====
+def cmd_stats(args):
+    import sales_report
+    rollup = sales_report.update_rollup(rebuild=args.rebuild)
+    sales_report.print_report(rollup, top=args.top, days=args.days)
+
+def cmd_import_orders(args):
+    from order_import import import_orders
+    result = import_orders(args.file, fmt=args.format, workers=args.workers, rejected_path=args.rejected,
+                           source=args.source, dry_run=args.dry_run)
+    sec = result["seconds"]
+    verb = "検証しました（保存していません）" if args.dry_run else "取り込みました"
+    print(f"{result['imported']} 件を{verb}（{sec:.2f}s, {result['imported'] / max(sec, 1e-9):,.0f} 件/s）")
+    if result["rejected"]:
+        print(f"⚠️ {result['rejected']} 行を取り込めませんでした → {result['rejected_path']}")
+
 def main():
     parser = argparse.ArgumentParser(description="メニュー注文アプリ")
-    parser.parse_args()
+    sub = parser.add_subparsers(dest="cmd")
+    p_stats = sub.add_parser("stats", help="売上レポートを表示")
+    p_stats.add_argument("--top", type=int, default=10, help="売上上位の表示件数")
+    p_stats.add_argument("--days", type=int, default=14, help="日別の表示日数")
+    p_stats.add_argument("--rebuild", action="store_true", help="集計を最初から作り直す")
+    p_import = sub.add_parser("import-orders", help="CSV / JSONL の注文ファイルを一括で取り込む")
+    p_import.add_argument("file", help="注文ファイル（.csv / .jsonl）")
+    p_import.add_argument("--format", choices=("csv", "jsonl"), help="省略時は拡張子で判断")
+    p_import.add_argument("--workers", type=int, help="並列に処理するプロセス数（省略時は CPU 数）")
+    p_import.add_argument("--rejected", help="取り込めなかった行の出力先（省略時は <file>.rejected.jsonl）")
+    p_import.add_argument("--source", help="注文に残す取り込み元の名前（省略時はファイル名）")
+    p_import.add_argument("--dry-run", action="store_true", help="検証だけして保存しない")
+    args = parser.parse_args()
+
+    if args.cmd == "stats":
+        cmd_stats(args); return
+    if args.cmd == "import-orders":
+        cmd_import_orders(args); return
 
     order: List[Tuple[object,int]] = []
 
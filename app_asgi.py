@@ -0,0 +1,277 @@
+# app_asgi.py
+# app_web.py と同じ画面を非同期（ASGI）で動かす版。同時接続が多いとき・本番向け
+#
+#   pip install quart uvicorn
+#   python app_asgi.py                                   # uvicorn で起動（MENU_APP_WEB_HOST / PORT / WORKERS）
+#   uvicorn app_asgi:app --port 5001 --workers 4         # uvicorn を直接使う場合
+#
+# - ルート（/, /add, /cart, /checkout, /admin, /admin/stats, /kitchen, /metrics）とテンプレートは app_web.py と同じ。
+#   セッションの cookie も同じ secret_key で署名するので、どちらで動かしてもカートはそのまま
+# - ストレージの読み書き（カート / 注文の書き込み / メニュー編集 / 集計）は io() でスレッドプールに回し、
+#   イベントループを止めない
+# - メニューページは版ごとに描画済みの HTML をメモリに置き、リクエストではディスクにもスレッドにも触れない
+# - ワーカーを 2 以上にするときは MENU_APP_CART_STORE=sqlite（カートをワーカー間で共有）と
+#   MENU_APP_KITCHEN_SOURCE=store（キッチン表示に全ワーカーの注文を出す）にすること
+import sys, asyncio, hashlib, secrets, contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, Response, g, render_template, request, redirect, url_for, session, flash, make_response
+
+import config
+import metrics
+import app_web
+from app_web import (get_catalog, resolve_cart, new_order, apply_admin_form, stats_context, sse_event,
+                     arg_number, form_qty, QTY_ERROR, is_admin, ADMIN_ONLY, run_profile, PROFILE_BUSY)
+from menu_io import load_catalog
+from menu_watch import get_menu_watcher, current_catalog
+from order_writer import get_order_writer
+from cart_store import get_cart_store
+from kitchen import get_kitchen_broker, replay
+from totals import summarize_lines
+
+app = Quart(__name__)
+app.secret_key = app_web.app.secret_key
+metrics.time_templates(app.jinja_env)
+
+_io_pool = ThreadPoolExecutor(config.WEB_IO_THREADS, thread_name_prefix="web-io")
+
+
+async def io(fn, *args):
+    """ブロックする処理をスレッドプールで実行して待つ（計測のルート名も引き継ぐ）"""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_io_pool, ctx.run, fn, *args)
+
+
+@app.before_request
+async def begin_metrics():
+    g.metrics = metrics.begin_request(request.url_rule.rule if request.url_rule else "unmatched")
+
+
+@app.after_request
+async def end_metrics(resp):
+    if "metrics" in g:
+        metrics.end_request(g.pop("metrics"), request.method, resp.status_code)
+    return resp
+
+
+@app.before_serving
+async def startup():
+    # 最初のリクエストで読み込みを待たせないよう、起動時にメニューと書き込みスレッドを用意する
+    await io(get_menu_watcher)
+    await io(get_order_writer)
+    await io(get_cart_store)
+
+
+def cart_id():
+    # セッションに入れるのはカート ID だけ（中身は cart_store に置く）
+    if "cart_id" not in session:
+        session["cart_id"] = secrets.token_urlsafe(16)
+    return session["cart_id"]
+
+
+# 描画済みメニューページ: (メニューの版, HTML, ETag)
+_menu_page = (None, None, None)
+
+
+async def render_menu_page():
+    """メニューの版が変わったときだけ menu.html を描画し直す"""
+    global _menu_page
+    # メモリ上の Catalog を見るだけ（版の確認は menu_watch の監視スレッド、
+    # 自分の編集の反映は /admin の io() の中で済ませている）
+    catalog = current_catalog()
+    version = catalog.version
+    if _menu_page[0] != version:
+        metrics.inc("menu_page_cache", result="miss")
+        html = await render_template("menu.html", catalog=get_catalog(catalog))
+        etag = hashlib.sha1(html.encode("utf-8")).hexdigest()
+        _menu_page = (version, html, etag)
+    else:
+        metrics.inc("menu_page_cache", result="hit")
+    return _menu_page[1], _menu_page[2]
+
+
+@app.route("/", methods=["GET"])
+async def show_menu():
+    if session.get("_flashes"):
+        # フラッシュメッセージ付きはその人専用なのでキャッシュしない
+        return await render_template("menu.html", catalog=get_catalog())
+    html, etag = await render_menu_page()
+    resp = await make_response(html)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"  # 毎回 ETag で再検証させる
+    return await resp.make_conditional(request)
+
+
+async def drop_missing(carts, missing):
+    cid = cart_id()
+    for item_id in missing:
+        await io(carts.remove, cid, item_id)
+    if missing:
+        await flash("メニューから無くなった商品をカートから外しました。")
+
+
+@app.route("/add", methods=["POST"])
+async def add_to_cart():
+    form = await request.form
+    # 名前や価格はフォームから受け取らず、カタログで引き直す（改ざんされた値を信用しない）
+    item = current_catalog().get(form.get("id"))
+    qty = form_qty(form)
+    if item is None:
+        await flash("その商品は見つかりませんでした。"); return redirect(url_for("show_menu"))
+    if qty is None:
+        await flash(QTY_ERROR); return redirect(url_for("show_menu"))
+    await io(get_cart_store().add, cart_id(), item.id, qty)
+    await flash(f"{item.name} をカートに追加しました。")
+    return redirect(url_for("show_menu"))
+
+
+@app.route("/cart", methods=["GET", "POST"])
+async def view_cart():
+    carts = get_cart_store()
+    if request.method == "POST":
+        form = await request.form
+        action = form.get("action")
+        item_id = form.get("id")
+        if action == "update":
+            qty = form_qty(form)
+            if qty is None:
+                await flash(QTY_ERROR)
+            else:
+                await io(carts.set_qty, cart_id(), item_id, qty)
+        elif action == "remove":
+            await io(carts.remove, cart_id(), item_id)
+        return redirect(url_for("view_cart"))
+    catalog = current_catalog()
+    cart, missing = resolve_cart(await io(carts.items, cart_id()), catalog)
+    await drop_missing(carts, missing)
+    return await render_template("cart.html", cart=cart, totals=summarize_lines(cart, catalog))
+
+
+@app.route("/checkout", methods=["POST"])
+async def checkout():
+    carts = get_cart_store()
+    catalog = current_catalog()
+    cart, missing = resolve_cart(await io(carts.items, cart_id()), catalog)
+    if missing:
+        # 中身が変わったので、確定せずにカートを見直してもらう
+        await drop_missing(carts, missing)
+        return redirect(url_for("view_cart"))
+    if not cart:
+        await flash("カートが空です。"); return redirect(url_for("show_menu"))
+    order = new_order(cart, catalog)
+    # fsync モードでは書き込みまで待つが、待つのはプールのスレッドでイベントループは止まらない
+    await io(get_order_writer().submit, order)
+    await io(carts.clear, cart_id())
+    return await render_template("order_complete.html", order=order)
+
+
+def _apply_admin_form(form):
+    message = apply_admin_form(form)
+    # 自分の編集をここ（プールのスレッド）で Catalog に反映しておき、
+    # 以降のリクエストの current_catalog() がイベントループ上で読み直さないようにする
+    current_catalog()
+    return message
+
+
+@app.route("/admin", methods=["GET", "POST"])
+async def admin():
+    if not is_admin(request, session):
+        return ADMIN_ONLY
+    if request.method == "POST":
+        await flash(await io(_apply_admin_form, await request.form))
+        return redirect(url_for("admin"))
+
+    # 管理ページは編集の直後に開くので、監視を待たずに最新を読む
+    catalog = await io(load_catalog)
+    menus = {"foods": catalog.category("Food"), "drinks": catalog.category("Drink"),
+             "desserts": catalog.category("Dessert")}
+    return await render_template("admin.html", menus=menus, version=catalog.revision)
+
+
+@app.route("/admin/stats", methods=["GET"])
+async def admin_stats():
+    if not is_admin(request, session):
+        return ADMIN_ONLY
+    context = await io(stats_context, arg_number(request.args, "top", 10, 1, 100))
+    return await render_template("stats.html", **context)
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics_page():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/profile", methods=["GET"])
+async def admin_profile():
+    if not is_admin(request, session):
+        return ADMIN_ONLY
+    seconds = arg_number(request.args, "seconds", 10.0, 1, config.PROFILE_MAX_SECONDS, cast=float)
+    folded = await io(run_profile, seconds)
+    if folded is None:
+        return PROFILE_BUSY
+    return Response(folded, mimetype="text/plain",
+                    headers={"Content-Disposition": "attachment; filename=profile.folded"})
+
+
+@app.route("/kitchen", methods=["GET"])
+async def kitchen_page():
+    return await render_template("kitchen.html", title="キッチン")
+
+
+@app.route("/kitchen/stream", methods=["GET"])
+async def kitchen_stream():
+    broker = await io(get_kitchen_broker)
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def wakeup():
+        # 書き込みスレッドから呼ばれるので、イベントループに頼んで起こしてもらう
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(ready.set)
+
+    # 取り直しより先に受け口を作る（その間に入った注文を取りこぼさない）
+    sub = broker.subscribe(wakeup=wakeup)
+
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            sent = set()
+            for order in await io(replay, last_id):
+                sent.add(order.get("id"))
+                yield sse_event(order).encode("utf-8")
+            while True:
+                ready.clear()
+                order = sub.get_nowait()
+                if order is None:
+                    if sub.closed:
+                        # 追いつけずに切られた。ブラウザが Last-Event-ID 付きでつなぎ直す
+                        return
+                    try:
+                        await asyncio.wait_for(ready.wait(), config.KITCHEN_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield b": keep-alive\n\n"
+                    continue
+                if order.get("id") in sent:
+                    continue
+                yield sse_event(order).encode("utf-8")
+        finally:
+            broker.unsubscribe(sub)
+
+    resp = Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    resp.timeout = None   # 接続している間はずっと流す
+    return resp
+
+
+def main():
+    import uvicorn
+    if config.WEB_WORKERS > 1 and config.CART_STORE == "memory":
+        print("[app_asgi] ワーカーが複数のときは MENU_APP_CART_STORE=sqlite にしてください"
+              "（カートがワーカーごとに分かれます）", file=sys.stderr)
+    uvicorn.run("app_asgi:app", host=config.WEB_HOST, port=config.WEB_PORT,
+                workers=config.WEB_WORKERS, access_log=False, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
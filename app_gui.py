@@ -1,65 +1,117 @@
 # app_gui.py
-import os
-import json
+import queue
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox, simpledialog
 from datetime import datetime, timezone, timedelta
 
 # 依存:
 # - menu_item.py : Food / Drink / Dessert クラス
-# - menu_io.py   : load_menus(), save_menus()
+# - menu_repo.py : get_menu_repository()（1品ずつの追加・削除）
+# - menu_watch.py: get_menu_watcher()（他のプロセスでの編集を自動で取り込む）
+# - catalog.py   : Catalog（ID / 名前 / カテゴリで引けるメニュー）
+# - order_store.py : get_order_store()（注文履歴の保存先）
+# - totals.py    : RunningTotals（カートの合計を変更の差分だけで更新する）
+# - menu_search.py : get_search_index()（メニュー検索の索引。Catalog が変わったときだけ作り直す）
+# - virtual_list.py : VirtualList（見えている行だけを描くメニュー一覧。何万件でも軽い）
 # 既存のCLI版(app.py)と同じ data/ フォルダを利用します。
+# ファイルの読み書き（メニューの読み込み・編集、注文の保存、履歴）は BackgroundIO でワーカースレッドに回し、
+# 結果は after() で Tk のスレッドに戻してから画面に反映します（大きなファイルでも画面が固まらない）。
 
 from menu_item import Food, Drink, Dessert
-from menu_io import load_menus, save_menus
+from menu_repo import get_menu_repository
+from menu_watch import get_menu_watcher
+from order_ids import new_order_id
+from order_store import get_order_store, record_time
+from totals import RunningTotals
+from catalog import Catalog
+from menu_search import get_search_index
+from virtual_list import VirtualList
 
-# 共通保存先
-DATA_DIR = "data"
-HISTORY_FILE = os.path.join(DATA_DIR, "orders.json")
 JST = timezone(timedelta(hours=9))
-
-def ensure_data_dir():
-    os.makedirs(DATA_DIR, exist_ok=True)
-
-def load_history_safely() -> list:
-    ensure_data_dir()
-    if not os.path.exists(HISTORY_FILE):
-        return []
-    try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data if isinstance(data, list) else []
-    except Exception:
-        try:
-            os.replace(HISTORY_FILE, HISTORY_FILE + ".broken")
-        except Exception:
-            pass
-        return []
+SEARCH_DELAY_MS = 150   # 検索欄の入力が止まってから探すまでの時間
+POLL_MS = 50            # バックグラウンドの結果を拾いに行く間隔（処理中だけ）
 
 def save_order_record(order_items):
     """order_items: list of (item_obj, qty)"""
     if not order_items:
         return False
-    history = load_history_safely()
     record = {
+        "id": new_order_id(),
         "timestamp": datetime.now(JST).isoformat(timespec="seconds"),
         "items": [
             {"name": it.name, "qty": qty, "price": getattr(it, "price", 0)}
             for it, qty in order_items
         ],
     }
-    history.append(record)
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+    get_order_store().append(record)
     return True
 
-def summarize(items):
-    """items: list of item_obj（qtyぶん展開済みでOK）"""
-    total_price   = sum(getattr(it, "price", 0) for it in items)
-    total_calorie = sum(getattr(it, "calorie", 0) for it in items)
-    total_volume  = sum(getattr(it, "volume_ml", 0) for it in items)
-    total_sugar   = sum(getattr(it, "sugar_g", 0) for it in items)
-    return total_price, total_calorie, total_volume, total_sugar
+class BackgroundIO:
+    """ストレージの読み書きをワーカースレッド1本で順に実行し、結果を after() で Tk のスレッドに返す
+
+    io.submit(fn, *args, on_done=cb, label="保存中")   # cb(result) は Tk のスレッドで呼ばれる
+    on_error を省くと例外はエラーダイアログで出す。quiet=True は処理中の表示を出さない（定期的な確認用）。
+    ワーカーは1本なので、送った順に実行される（保存 → 再読み込み の順序が入れ替わらない）。
+    ウィジェットにはワーカーから触れず、終わった処理はキューに積んで Tk のスレッドが after() で拾う。
+    """
+    def __init__(self, root, on_busy=None):
+        self.root = root
+        self.on_busy = on_busy          # on_busy(処理中の件数, 今の処理の label)
+        self._pool = ThreadPoolExecutor(1, thread_name_prefix="gui-io")
+        self._results = queue.SimpleQueue()
+        self._pending = 0
+        self._labels = []               # 処理中の表示用（quiet でないもの）
+        self._polling = False
+
+    def submit(self, fn, *args, on_done=None, on_error=None, label="", quiet=False):
+        self._pending += 1
+        if not quiet:
+            self._labels.append(label)
+            self._notify()
+        fut = self._pool.submit(fn, *args)
+        fut.add_done_callback(lambda f: self._results.put((f, on_done, on_error, label, quiet)))
+        if not self._polling:
+            self._polling = True
+            self.root.after(POLL_MS, self._poll)
+        return fut
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._labels)
+
+    def _poll(self):
+        while True:
+            try:
+                fut, on_done, on_error, label, quiet = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if not quiet:
+                self._labels.remove(label)
+                self._notify()
+            err = fut.exception()
+            try:
+                if err is None:
+                    if on_done is not None:
+                        on_done(fut.result())
+                elif on_error is not None:
+                    on_error(err)
+                else:
+                    messagebox.showerror("エラー", f"{label or '処理'}に失敗しました。\n{err}")
+            except Exception as e:
+                messagebox.showerror("エラー", f"画面の更新に失敗しました。\n{e!r}")
+        if self._pending:
+            self.root.after(POLL_MS, self._poll)
+        else:
+            self._polling = False
+
+    def _notify(self):
+        if self.on_busy is not None:
+            self.on_busy(len(self._labels), self._labels[0] if self._labels else "")
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
 
 class App(tk.Tk):
     def __init__(self):
@@ -67,20 +119,21 @@ class App(tk.Tk):
         self.title("メニュー注文アプリ（GUI）")
         self.geometry("900x600")
 
-        # データ
-        self.foods, self.drinks, self.desserts = load_menus()
-        self.catalog = {
-            "Food": self.foods,
-            "Drink": self.drinks,
-            "Dessert": self.desserts,
-        }
-        self.cart = []  # list of (item, qty)
+        # データ（メニューは起動後にバックグラウンドで読む。読み終わるまでは空の一覧）
+        self.catalog = Catalog()
+        self.cart = {}  # item.id -> (item, qty)（追加順を保持。Treeview の行の iid も item.id）
+        self.running = RunningTotals()
+        self._search_job = None
+        self._checking_catalog = False
 
         # UI 構成
         self._build_menu_bar()
         self._build_main_panes()
+        self.io = BackgroundIO(self, on_busy=self._show_busy)
         self._refresh_menu_list()
         self._update_totals()
+        self.io.submit(self._load_catalog, on_done=self._on_catalog_loaded, label="メニューを読み込み中")
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
 
     # ========= Menubar =========
     def _build_menu_bar(self):
@@ -125,12 +178,12 @@ class App(tk.Tk):
         ent = ttk.Entry(srch_row, textvariable=self.search_var)
         ent.pack(side="left", fill="x", expand=True, padx=6)
         ttk.Button(srch_row, text="クリア", command=lambda: (self.search_var.set(""), self._refresh_menu_list())).pack(side="left")
-        self.search_var.trace_add("write", lambda *a: self._refresh_menu_list())
+        # 打つたびには探さず、入力が SEARCH_DELAY_MS 止まってから探す
+        self.search_var.trace_add("write", lambda *a: self._schedule_search())
 
         # メニュー一覧
-        self.menu_list = tk.Listbox(left, height=18)
+        self.menu_list = VirtualList(left, on_activate=lambda item: self._add_selected_item())
         self.menu_list.pack(fill="both", expand=True)
-        self.menu_list.bind("<Double-Button-1>", lambda e: self._add_selected_item())
 
         # 数量 + 追加ボタン
         qty_row = ttk.Frame(left)
@@ -156,61 +209,87 @@ class App(tk.Tk):
         btn_row.pack(fill="x", pady=(6,0))
         ttk.Button(btn_row, text="選択行を削除", command=self.cmd_remove_selected).pack(side="left")
         ttk.Button(btn_row, text="カートを空にする", command=self.cmd_clear_cart).pack(side="left", padx=6)
-        ttk.Button(btn_row, text="注文を保存", command=self.cmd_save_order).pack(side="right")
+        self.save_btn = ttk.Button(btn_row, text="注文を保存", command=self.cmd_save_order)
+        self.save_btn.pack(side="right")
 
-        # ステータス(合計)
+        # ステータス(合計) + 処理中の表示
+        status_row = ttk.Frame(self)
+        status_row.pack(fill="x", padx=10, pady=10)
         self.status_var = tk.StringVar()
-        bar = ttk.Label(self, textvariable=self.status_var, anchor="w", relief="groove")
-        bar.pack(fill="x", padx=10, pady=10)
+        bar = ttk.Label(status_row, textvariable=self.status_var, anchor="w", relief="groove")
+        bar.pack(side="left", fill="x", expand=True)
+        self.busy_var = tk.StringVar()
+        self.busy_bar = ttk.Progressbar(status_row, mode="indeterminate", length=120)
+        ttk.Label(status_row, textvariable=self.busy_var, anchor="e").pack(side="left", padx=(8,4))
+        self.busy_bar.pack(side="left")
 
     # ========= Helpers =========
     def _filtered_items(self):
-        cat = self.category_var.get()
-        items = self.catalog.get(cat, [])
-        q = self.search_var.get().strip()
-        if not q:
-            return items
-        ql = q.lower()
-        return [it for it in items if ql in it.name.lower() or ql in it.info().lower()]
+        # 索引は Catalog が入れ替わったときだけ作り直される。打ち足した検索語は索引が直前の結果から絞り込む
+        return get_search_index(self.catalog).search(self.category_var.get(), self.search_var.get())
+
+    def _schedule_search(self):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DELAY_MS, self._refresh_menu_list)
 
     def _refresh_menu_list(self):
-        self.menu_list.delete(0, "end")
-        for it in self._filtered_items():
-            self.menu_list.insert("end", it.info())
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+            self._search_job = None
+        # 一覧には絞り込んだ商品のリストを渡すだけ（表示文字列は見えている行のぶんだけ引く）
+        self.menu_list.set_items(self._filtered_items(), label=get_search_index(self.catalog).label)
 
     def _add_selected_item(self):
-        sel = self.menu_list.curselection()
-        if not sel:
+        # 選択は商品 ID で持っているので、検索し直さずにそのまま引ける
+        item = self.menu_list.selected_item()
+        if item is None:
             messagebox.showinfo("情報", "メニューを選択してください。")
             return
-        idx = sel[0]
-        item = self._filtered_items()[idx]
         qty = self.qty_var.get()
         if qty <= 0:
             messagebox.showerror("エラー", "数量は1以上で入力してください。")
             return
-        # 既存エントリ更新 or 追加
-        for i, (it, q) in enumerate(self.cart):
-            if it.name == item.name:
-                self.cart[i] = (it, q + qty)
-                break
-        else:
-            self.cart.append((item, qty))
-        self._refresh_cart_view()
+        # 既存エントリ更新 or 追加（ID で O(1)）
+        _, q = self.cart.get(item.id, (item, 0))
+        self._set_cart_line(item, q + qty)
         self._update_totals()
 
-    def _refresh_cart_view(self):
+    # カートの変更は行ごとの差分（追加 / 数量のセルの更新 / 削除）だけを Treeview に当て、
+    # 合計も RunningTotals に増減ぶんだけ足し引きする（カートの大きさに関係なく1操作 O(1)）
+    @staticmethod
+    def _row_values(it, qty):
+        price = getattr(it, "price", 0)
+        return (it.name, price, qty, price * qty)
+
+    def _set_cart_line(self, item, qty):
+        old = self.cart.get(item.id)
+        if old is not None:
+            self.running.add(old[0], -old[1])
+        self.cart[item.id] = (item, qty)
+        self.running.add(item, qty)
+        if old is None:
+            # 行の iid を商品 ID にしておくと、選択行から商品を直接引ける
+            self.cart_tv.insert("", "end", iid=item.id, values=self._row_values(item, qty))
+        elif old[0] is item:
+            self.cart_tv.set(item.id, "qty", qty)
+            self.cart_tv.set(item.id, "subtotal", getattr(item, "price", 0) * qty)
+        else:
+            self.cart_tv.item(item.id, values=self._row_values(item, qty))
+
+    def _remove_cart_line(self, item_id):
+        line = self.cart.pop(item_id, None)
+        if line is not None:
+            self.running.add(line[0], -line[1])
+            self.cart_tv.delete(item_id)
+
+    def _clear_cart_lines(self):
+        self.cart.clear()
+        self.running.clear()
         self.cart_tv.delete(*self.cart_tv.get_children())
-        for it, qty in self.cart:
-            price = getattr(it, "price", 0)
-            subtotal = price * qty
-            self.cart_tv.insert("", "end", values=(it.name, price, qty, subtotal))
 
     def _update_totals(self):
-        expanded = []
-        for it, qty in self.cart:
-            expanded.extend([it] * qty)
-        price, cal, vol, sug = summarize(expanded)
+        price, cal, vol, sug = self.running.totals
         parts = [f"合計 金額: {price} 円"]
         if cal: parts.append(f"カロリー: {cal} kcal")
         if vol: parts.append(f"ドリンク量: {vol} ml")
@@ -222,64 +301,114 @@ class App(tk.Tk):
         sel = self.cart_tv.selection()
         if not sel:
             return
-        names = []
+        # iid = 商品 ID
         for iid in sel:
-            vals = self.cart_tv.item(iid, "values")
-            if not vals:
-                continue
-            names.append(vals[0])
-        if not names:
-            return
-        # remove from cart by name
-        new_cart = []
-        for it, qty in self.cart:
-            if it.name not in names:
-                new_cart.append((it, qty))
-        self.cart = new_cart
-        self._refresh_cart_view()
+            self._remove_cart_line(iid)
         self._update_totals()
 
     def cmd_clear_cart(self):
         if not self.cart:
             return
         if messagebox.askyesno("確認", "カートを空にしますか？"):
-            self.cart.clear()
-            self._refresh_cart_view()
+            self._clear_cart_lines()
             self._update_totals()
 
     def cmd_save_order(self):
         if not self.cart:
             messagebox.showinfo("情報", "カートが空です。")
             return
-        if save_order_record(self.cart):
-            messagebox.showinfo("保存", f"注文を保存しました。\n→ {HISTORY_FILE}")
-            self.cart.clear()
-            self._refresh_cart_view()
+        order = list(self.cart.values())
+        self.save_btn.state(["disabled"])   # 保存が終わるまで二重に押せないように
+
+        def saved(ok):
+            self.save_btn.state(["!disabled"])
+            if not ok:
+                messagebox.showerror("エラー", "保存に失敗しました。")
+                return
+            # 保存している間にカートを触っていても、保存したぶんだけを減らす
+            for it, qty in order:
+                line = self.cart.get(it.id)
+                if line is None:
+                    continue
+                if line[1] <= qty:
+                    self._remove_cart_line(it.id)
+                else:
+                    self._set_cart_line(line[0], line[1] - qty)
             self._update_totals()
-        else:
-            messagebox.showerror("エラー", "保存に失敗しました。")
+            messagebox.showinfo("保存", f"注文を保存しました。\n→ {get_order_store().location}")
+
+        def failed(err):
+            self.save_btn.state(["!disabled"])
+            messagebox.showerror("エラー", f"保存に失敗しました。\n{err}")
+
+        self.io.submit(save_order_record, order, on_done=saved, on_error=failed, label="注文を保存中")
 
     def cmd_show_latest_history(self):
-        history = load_history_safely()
+        self.io.submit(lambda: get_order_store().latest(1), on_done=self._show_latest_history,
+                       label="履歴を読み込み中")
+
+    def _show_latest_history(self, history):
         if not history:
             messagebox.showinfo("履歴", "注文履歴はまだありません。")
             return
         latest = history[-1]
-        ts = latest.get("timestamp", "-")
+        ts = record_time(latest)
         lines = [f"日時: {ts}"]
         for it in latest.get("items", []):
             lines.append(f"{it.get('name','?')} × {it.get('qty','?')} (¥{it.get('price','?')})")
         messagebox.showinfo("最新の注文履歴", "\n".join(lines))
 
-    def cmd_reload_menus(self):
-        self.foods, self.drinks, self.desserts = load_menus()
-        self.catalog = {
-            "Food": self.foods,
-            "Drink": self.drinks,
-            "Dessert": self.desserts,
-        }
+    # ----- メニューの読み込み（ワーカースレッドで読み、検索の索引も作ってから Tk のスレッドで差し替える）
+    @staticmethod
+    def _prepare(catalog):
+        get_search_index(catalog)
+        return catalog
+
+    def _load_catalog(self):
+        return self._prepare(get_menu_watcher().current())
+
+    def _on_catalog_loaded(self, catalog):
+        self._swap_catalog(catalog)
+        self._poll_catalog()
+
+    def _reload(self):
+        return self._prepare(get_menu_watcher().refresh())
+
+    def _reloaded(self, catalog, message=None):
+        self._swap_catalog(catalog)
+        if message:
+            messagebox.showinfo(*message)
+
+    def cmd_reload_menus(self, message=("情報", "メニューを再読み込みしました。")):
+        self.io.submit(self._reload, on_done=lambda c: self._reloaded(c, message), label="メニューを再読み込み中")
+
+    def _poll_catalog(self):
+        # 監視スレッドが入れ替えた Catalog を拾う。current() は自分の編集があると読み直すので、
+        # 確かめるのもワーカーで行い、差し替えだけを Tk のスレッドで行う（ウィジェットは別スレッドから触れない）
+        if not self._checking_catalog:
+            self._checking_catalog = True
+
+            def done(catalog):
+                self._checking_catalog = False
+                self._swap_catalog(catalog)
+
+            def failed(err):
+                self._checking_catalog = False
+
+            self.io.submit(self._load_catalog, on_done=done, on_error=failed, quiet=True)
+        self.after(500, self._poll_catalog)
+
+    def _swap_catalog(self, catalog):
+        if catalog is self.catalog:
+            return
+        self.catalog = catalog
+        # カートの商品も新しい価格・名前に差し替える（変わった行だけ。メニューから消えた商品はそのまま残す）
+        for iid, (it, qty) in list(self.cart.items()):
+            new = catalog.get(iid)
+            if new is not None and new is not it:
+                self._set_cart_line(new, qty)
         self._refresh_menu_list()
-        messagebox.showinfo("情報", "メニューを再読み込みしました。")
+        self._update_totals()
 
     def cmd_add_item(self):
         # カテゴリ選択
@@ -297,22 +426,24 @@ class App(tk.Tk):
         volume  = self._ask_opt_int("容量(ml)［任意/Drink向け］:")
         sugar   = self._ask_opt_int("糖質(g)［任意］:")
 
-        foods, drinks, desserts = self.foods, self.drinks, self.desserts
         if cat == "Food":
-            foods.append(Food(name=name, price=price, calorie=calorie or 0))
+            item = Food(name=name, price=price, calorie=calorie or 0)
         elif cat == "Drink":
-            drinks.append(Drink(name=name, price=price, volume_ml=volume or 0, sugar_g=sugar or 0))
+            item = Drink(name=name, price=price, volume_ml=volume or 0, sugar_g=sugar or 0)
         else:
-            desserts.append(Dessert(name=name, price=price, calorie=calorie or 0, sugar_g=sugar or 0))
-
-        save_menus(foods, drinks, desserts)
-        self.cmd_reload_menus()
+            item = Dessert(name=name, price=price, calorie=calorie or 0, sugar_g=sugar or 0)
+        # 1件だけ記録する（menus.json を書き直さないので他のプロセスの編集を消さない）
+        def add():
+            get_menu_repository().add(item)
+            return self._reload()
+        self.io.submit(add, on_done=lambda c: self._reloaded(c, ("追加", f"追加しました: [{cat}] {name}")),
+                       label="メニューに追加中")
 
     def cmd_delete_item(self):
         cat = self._ask_category()
         if not cat:
             return
-        items = self.catalog.get(cat, [])
+        items = self.catalog.category(cat)
         if not items:
             messagebox.showinfo("情報", "このカテゴリには項目がありません。")
             return
@@ -321,10 +452,32 @@ class App(tk.Tk):
         idx = self._ask_from_list("削除する項目を選択", names)
         if idx is None:
             return
-        removed = items.pop(idx)
-        save_menus(self.foods, self.drinks, self.desserts)
-        messagebox.showinfo("削除", f"削除しました: [{cat}] {removed.name}")
-        self.cmd_reload_menus()
+        removed = items[idx]
+
+        def delete():
+            try:
+                get_menu_repository().delete(removed.id)
+            except KeyError:
+                return self._reload(), ("情報", "その項目はすでに削除されています。")
+            return self._reload(), ("削除", f"削除しました: [{cat}] {removed.name}")
+        self.io.submit(delete, on_done=lambda res: self._reloaded(*res), label="メニューから削除中")
+
+    # ========= Busy =========
+    def _show_busy(self, n, label):
+        if n:
+            self.busy_var.set(label + "…" + (f"（ほか {n - 1} 件）" if n > 1 else ""))
+            self.busy_bar.start(15)
+        else:
+            self.busy_var.set("")
+            self.busy_bar.stop()
+
+    def _on_close(self):
+        # 書き込みの途中で終わらせない（保存中なら終わるのを待つ）
+        if self.io.busy:
+            self.busy_var.set("保存が終わるのを待っています…")
+            self.update_idletasks()
+        self.io.shutdown()
+        self.destroy()
 
     # ========= Input helpers =========
     def _ask_category(self):
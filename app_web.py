@@ -1,135 +1,359 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Response, g, render_template, request, redirect, url_for, session, flash, make_response
 from datetime import datetime
-import os, json
-from menu_io import load_menus  # 既存関数を利用
+import os, json, math, hashlib, secrets, threading
+import config
+import metrics
+from menu_io import load_catalog  # 既存関数を利用
+from menu_watch import current_catalog
+from menu_repo import get_menu_repository, VersionConflict
+from menu_item import Food, Drink, Dessert
+from order_store import get_order_store
+from order_writer import get_order_writer, exit_on_sigterm
+from order_ids import new_order_id
+from cart_store import get_cart_store
+from kitchen import get_kitchen_broker, replay
+from totals import summarize_lines
 
 app = Flask(__name__)
 app.secret_key = "change-this-in-prod"  # セッションキー（とりあえず固定）
+metrics.time_templates(app.jinja_env)
 
 DATA_DIR = "data"
-ORDERS_FILE = os.path.join(DATA_DIR, "orders.json")
+
+@app.before_request
+def begin_metrics():
+    # ルート名はパターン（/cart など）で数える。実際の URL で分けると種類が増えすぎる
+    g.metrics = metrics.begin_request(request.url_rule.rule if request.url_rule else "unmatched")
+
+@app.after_request
+def end_metrics(resp):
+    if "metrics" in g:
+        metrics.end_request(g.pop("metrics"), request.method, resp.status_code)
+    return resp
 
 def ensure_files():
+    # 注文履歴のファイルは order_store が必要になった時点で作る
     os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(ORDERS_FILE):
-        with open(ORDERS_FILE, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
-
-def get_catalog():
-    foods, drinks, desserts = load_menus()
-    catalog = []
-    idx = 1
-    for x in foods:
-        catalog.append({"id": f"F{idx}", "cat": "Food", "name": x.name, "price": x.price, "extra": getattr(x, "calorie", None)}); idx += 1
-    idx = 1
-    for x in drinks:
-        catalog.append({"id": f"D{idx}", "cat": "Drink", "name": x.name, "price": x.price, "extra": getattr(x, "volume_ml", None)}); idx += 1
-    idx = 1
-    for x in desserts:
-        catalog.append({"id": f"S{idx}", "cat": "Dessert", "name": x.name, "price": x.price, "extra": getattr(x, "calorie", None)}); idx += 1
-    return catalog
-
-def cart_init():
-    if "cart" not in session:
-        session["cart"] = []
-        session.modified = True
+
+def get_catalog(catalog=None):
+    # id は menus.json に保存された商品の固定 ID（並び順が変わってもカートの中身がずれない）
+    extra_attr = {"Food": "calorie", "Drink": "volume_ml", "Dessert": "calorie"}
+    return [
+        {"id": x.id, "cat": x.CATEGORY, "name": x.name, "price": x.price,
+         "extra": getattr(x, extra_attr[x.CATEGORY], None)}
+        for x in (catalog or current_catalog())
+    ]
+
+def cart_id():
+    # セッションに入れるのはカート ID だけ（中身は cart_store に置く）
+    if "cart_id" not in session:
+        session["cart_id"] = secrets.token_urlsafe(16)
+    return session["cart_id"]
+
+# 描画済みメニューページ: (メニューの版, HTML, ETag)
+_menu_page = (None, None, None)
+
+def render_menu_page():
+    """メニューの版が変わったときだけ menu.html を描画し直す"""
+    global _menu_page
+    # 版の確認は menu_watch の監視スレッドに任せる（リクエストごとに stat しない）
+    catalog = current_catalog()
+    version = catalog.version
+    if _menu_page[0] != version:
+        metrics.inc("menu_page_cache", result="miss")
+        html = render_template("menu.html", catalog=get_catalog(catalog))
+        etag = hashlib.sha1(html.encode("utf-8")).hexdigest()
+        _menu_page = (version, html, etag)
+    else:
+        metrics.inc("menu_page_cache", result="hit")
+    return _menu_page[1], _menu_page[2]
 
 @app.route("/", methods=["GET"])
 def show_menu():
-    ensure_files(); cart_init()
-    catalog = get_catalog()
-    return render_template("menu.html", catalog=catalog)
+    ensure_files()
+    if session.get("_flashes"):
+        # フラッシュメッセージ付きはその人専用なのでキャッシュしない
+        return render_template("menu.html", catalog=get_catalog())
+    html, etag = render_menu_page()
+    resp = make_response(html)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"  # 毎回 ETag で再検証させる
+    return resp.make_conditional(request)
+
+def resolve_cart(lines, catalog):
+    """カート（商品 ID と数量）を今のメニューで明細にする。メニューから消えた商品の ID は別に返す"""
+    items, missing = [], []
+    for line in lines:
+        x = catalog.get(line["id"])
+        if x is None:
+            missing.append(line["id"])
+            continue
+        items.append({"id": x.id, "name": x.name, "price": x.price, "qty": line["qty"], "cat": x.CATEGORY})
+    return items, missing
+
+MAX_QTY = 1000   # 1商品あたりの数量の上限（order_import と同じ）
+
+def form_qty(form):
+    """フォームの数量（1..MAX_QTY の整数）。読めない・範囲外なら None（app_asgi と共通）"""
+    try:
+        qty = int(form.get("qty", "1"))
+    except (TypeError, ValueError):
+        return None
+    return qty if 1 <= qty <= MAX_QTY else None
+
+QTY_ERROR = f"数量は1〜{MAX_QTY}の整数で指定してください。"
+
+def drop_missing(carts, missing):
+    for item_id in missing:
+        carts.remove(cart_id(), item_id)
+    if missing:
+        flash("メニューから無くなった商品をカートから外しました。")
 
 @app.route("/add", methods=["POST"])
 def add_to_cart():
-    cart_init()
-    item_id = request.form.get("id")
-    name = request.form.get("name")
-    price = int(request.form.get("price", "0"))
-    qty = int(request.form.get("qty", "1"))
-    cat = request.form.get("cat")
-    if qty <= 0:
-        flash("数量は1以上を指定してください。"); return redirect(url_for("show_menu"))
-    for it in session["cart"]:
-        if it["id"] == item_id:
-            it["qty"] += qty; break
-    else:
-        session["cart"].append({"id": item_id, "name": name, "price": price, "qty": qty, "cat": cat})
-    session.modified = True
-    flash(f"{name} をカートに追加しました。")
+    # 名前や価格はフォームから受け取らず、カタログで引き直す（改ざんされた値を信用しない）
+    item = current_catalog().get(request.form.get("id"))
+    qty = form_qty(request.form)
+    if item is None:
+        flash("その商品は見つかりませんでした。"); return redirect(url_for("show_menu"))
+    if qty is None:
+        flash(QTY_ERROR); return redirect(url_for("show_menu"))
+    get_cart_store().add(cart_id(), item.id, qty)
+    flash(f"{item.name} をカートに追加しました。")
     return redirect(url_for("show_menu"))
 
 @app.route("/cart", methods=["GET", "POST"])
 def view_cart():
-    cart_init()
+    carts = get_cart_store()
     if request.method == "POST":
         action = request.form.get("action")
         item_id = request.form.get("id")
         if action == "update":
-            qty = int(request.form.get("qty", "1"))
-            for it in session["cart"]:
-                if it["id"] == item_id:
-                    it["qty"] = max(1, qty); break
+            qty = form_qty(request.form)
+            if qty is None:
+                flash(QTY_ERROR)
+            else:
+                carts.set_qty(cart_id(), item_id, qty)
         elif action == "remove":
-            session["cart"] = [it for it in session["cart"] if it["id"] != item_id]
-        session.modified = True
+            carts.remove(cart_id(), item_id)
         return redirect(url_for("view_cart"))
-    total = sum(it["price"] * it["qty"] for it in session["cart"])
-    return render_template("cart.html", cart=session["cart"], total=total)
+    catalog = current_catalog()
+    cart, missing = resolve_cart(carts.items(cart_id()), catalog)
+    drop_missing(carts, missing)
+    return render_template("cart.html", cart=cart, totals=summarize_lines(cart, catalog))
+
+def new_order(cart, catalog) -> dict:
+    return {
+        "id": new_order_id(),  # 書き込みより先に決める（完了画面にすぐ出せる）
+        "items": cart,
+        "total": sum(it["price"] * it["qty"] for it in cart),
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "menu_version": catalog.version,  # どの版の価格で計算したか
+    }
 
 @app.route("/checkout", methods=["POST"])
 def checkout():
-    cart_init()
-    if not session["cart"]:
+    carts = get_cart_store()
+    catalog = current_catalog()
+    cart, missing = resolve_cart(carts.items(cart_id()), catalog)
+    if missing:
+        # 中身が変わったので、確定せずにカートを見直してもらう
+        drop_missing(carts, missing)
+        return redirect(url_for("view_cart"))
+    if not cart:
         flash("カートが空です。"); return redirect(url_for("show_menu"))
-    order = {
-        "id": datetime.now().strftime("%Y%m%d-%H%M%S"),
-        "items": session["cart"],
-        "total": sum(it["price"] * it["qty"] for it in session["cart"]),
-        "ts": datetime.now().isoformat(timespec="seconds")
-    }
-    with open(ORDERS_FILE, "r", encoding="utf-8") as f:
-        arr = json.load(f)
-    arr.append(order)
-    with open(ORDERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(arr, f, ensure_ascii=False, indent=2)
-    session["cart"] = []; session.modified = True
+    order = new_order(cart, catalog)
+    # 書き込みは order_writer のスレッドがまとめて行う（履歴の大きさに関係なく待ち時間は一定）
+    get_order_writer().submit(order)
+    carts.clear(cart_id())
     return render_template("order_complete.html", order=order)
 
+def apply_admin_form(form) -> str:
+    """管理ページのフォーム（追加・変更・削除）をメニューに反映し、表示するメッセージを返す（app_asgi と共通）"""
+    repo = get_menu_repository()
+    action = form.get("action", "add")
+    item_id = form.get("id")
+    try:
+        if action == "add":
+            category = form.get("category")
+            name = form.get("name")
+            price = int(form.get("price", 0))
+            extra = int(form.get("extra", 0) or 0)
+            if not name or price <= 0:
+                return "商品名と価格は必須です。"
+            # カテゴリに応じて追加先を決める（デザートの extra は糖質として扱う）
+            if category == "Food":
+                item = Food(name, price, extra)
+            elif category == "Drink":
+                item = Drink(name, price, extra)
+            elif category == "Dessert":
+                item = Dessert(name, price, extra)
+            else:
+                return "カテゴリを選んでください。"
+            # 追加は他の人の編集とぶつからないので版は確かめない
+            repo.add(item)
+            return f"{category} に {name} を追加しました！"
+        elif action == "update":
+            name = form.get("name")
+            price = int(form.get("price", 0))
+            if not name or price <= 0:
+                return "商品名と価格は必須です。"
+            try:
+                expected = int(form.get("version", ""))
+            except ValueError:
+                # いつ開いた画面か分からない送信は、他の人の編集を消すかもしれないので上書きしない
+                return "メニューの版が分かりません。ページを開き直してから、もう一度操作してください。"
+            # 画面を開いたときの版を渡し、その後に誰かが編集していたら上書きしない
+            repo.update(item_id, expected_version=expected, name=name, price=price)
+            return f"{name} を更新しました。"
+        elif action == "delete":
+            repo.delete(item_id)
+            return "削除しました。"
+        return "不明な操作です。"
+    except VersionConflict:
+        return "他の人が先にメニューを変更しました。最新の内容を確認して、もう一度操作してください。"
+    except KeyError:
+        return "その商品はすでに削除されています。"
+    except ValueError:
+        return "価格などの数値の欄は整数で入力してください。"
+
+def is_admin(req, sess) -> bool:
+    """管理ページを使ってよいか（app_asgi と共通）
+
+    config.ADMIN_TOKEN があれば ?token= で一度合わせたセッションだけ（セッションにはトークンのハッシュを置く。
+    署名の鍵が漏れてもトークンを知らなければ作れない）。無ければこのマシンからの接続だけ。
+    """
+    token = config.ADMIN_TOKEN
+    if not token:
+        return req.remote_addr in ("127.0.0.1", "::1")
+    digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    given = req.args.get("token")
+    if given is not None and secrets.compare_digest(given.encode("utf-8"), token.encode("utf-8")):
+        sess["admin"] = digest
+    return secrets.compare_digest(sess.get("admin", ""), digest)
+
+ADMIN_ONLY = ("管理者のみ使えます。", 403, {"Content-Type": "text/plain; charset=utf-8"})
+
 @app.route("/admin", methods=["GET", "POST"])
 def admin():
+    if not is_admin(request, session):
+        return ADMIN_ONLY
     ensure_files()
-    menus_path = os.path.join(DATA_DIR, "menus.json")
-
-    # メニューを読み込む
-    with open(menus_path, "r", encoding="utf-8") as f:
-        menus = json.load(f)
 
     if request.method == "POST":
-        category = request.form.get("category")
-        name = request.form.get("name")
-        price = int(request.form.get("price", 0))
-        extra = int(request.form.get("extra", 0))
-
-        if not name or price <= 0:
-            flash("商品名と価格は必須です。")
-            return redirect(url_for("admin"))
-
-        # カテゴリに応じてキーを決める
-        if category == "Food":
-            menus["foods"].append({"name": name, "price": price, "calorie": extra})
-        elif category == "Drink":
-            menus["drinks"].append({"name": name, "price": price, "volume_ml": extra})
-        elif category == "Dessert":
-            menus["desserts"].append({"name": name, "price": price, "calorie": extra})
-
-        # JSONへ保存
-        with open(menus_path, "w", encoding="utf-8") as f:
-            json.dump(menus, f, ensure_ascii=False, indent=2)
-
-        flash(f"{category} に {name} を追加しました！")
+        flash(apply_admin_form(request.form))
+        # このワーカーには次のリクエストから反映される（他のワーカーは menu_watch の次の確認で入れ替わる）
         return redirect(url_for("admin"))
 
-    return render_template("admin.html", menus=menus)
+    # 管理ページは編集の直後に開くので、監視を待たずに最新を読む
+    catalog = load_catalog()
+    menus = {"foods": catalog.category("Food"), "drinks": catalog.category("Drink"),
+             "desserts": catalog.category("Dessert")}
+    return render_template("admin.html", menus=menus, version=catalog.revision)
+
+def arg_number(args, name, default, lo, hi, cast=int):
+    """クエリの数値を lo..hi に収めて返す（読めない値は default。app_asgi と共通）"""
+    try:
+        value = cast(args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+    if isinstance(value, float) and not math.isfinite(value):   # nan / inf
+        return default
+    return min(max(value, lo), hi)
+
+@app.route("/admin/stats", methods=["GET"])
+def admin_stats():
+    if not is_admin(request, session):
+        return ADMIN_ONLY
+    return render_template("stats.html", **stats_context(arg_number(request.args, "top", 10, 1, 100)))
+
+def stats_context(top: int) -> dict:
+    """stats.html に渡す集計（app_asgi と共通）"""
+    import sales_report
+    rollup = sales_report.update_rollup()
+    hours = sales_report.hourly(rollup)
+    peak = max((rev for _, _, rev in hours), default=0) or 1
+    return dict(rollup=rollup, top=sales_report.top_items(rollup, top),
+                hours=hours, peak=peak, days=sales_report.daily(rollup, 14))
+
+@app.route("/metrics", methods=["GET"])
+def metrics_page():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+
+def profile_path():
+    return os.path.join(PROFILE_DIR, datetime.now().strftime("profile-%Y%m%d-%H%M%S.folded"))
+
+_profile_lock = threading.Lock()
+
+def run_profile(seconds: float):
+    """プロファイルを取って collapsed 形式を返す。取っている最中なら None（app_asgi と共通）
+
+    取っている間はワーカーのスレッドを1つ占有するので、プロセスで同時に1つだけにする
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        return metrics.profile_for(seconds, profile_path())
+    finally:
+        _profile_lock.release()
+
+PROFILE_BUSY = ("プロファイルを取っている最中です。終わってからもう一度試してください。", 409,
+                {"Content-Type": "text/plain; charset=utf-8"})
+
+@app.route("/admin/profile", methods=["GET"])
+def admin_profile():
+    if not is_admin(request, session):
+        return ADMIN_ONLY
+    # 指定秒数だけ今の処理をサンプリングし、collapsed 形式（flamegraph.pl / speedscope 用）で返す
+    seconds = arg_number(request.args, "seconds", 10.0, 1, config.PROFILE_MAX_SECONDS, cast=float)
+    folded = run_profile(seconds)
+    if folded is None:
+        return PROFILE_BUSY
+    return Response(folded, mimetype="text/plain",
+                    headers={"Content-Disposition": "attachment; filename=profile.folded"})
+
+@app.route("/kitchen", methods=["GET"])
+def kitchen_page():
+    return render_template("kitchen.html", title="キッチン")
+
+def sse_event(order):
+    # id は注文番号（時刻順に並ぶ）。再接続時の Last-Event-ID にそのまま使う
+    data = json.dumps(order, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {order.get('id', '')}\nevent: order\ndata: {data}\n\n"
+
+@app.route("/kitchen/stream", methods=["GET"])
+def kitchen_stream():
+    broker = get_kitchen_broker()
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    # 取り直しより先に受け口を作る（その間に入った注文を取りこぼさない）
+    sub = broker.subscribe()
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            sent = set()
+            for order in replay(last_id):
+                sent.add(order.get("id"))
+                yield sse_event(order)
+            while True:
+                order = sub.get(timeout=config.KITCHEN_HEARTBEAT_SECONDS)
+                if order is None:
+                    if sub.closed:
+                        # 追いつけずに切られた。ブラウザが Last-Event-ID 付きでつなぎ直す
+                        return
+                    yield ": keep-alive\n\n"   # 切れた接続を見つける / プロキシに切られないため
+                    continue
+                if order.get("id") in sent:
+                    continue
+                yield sse_event(order)
+        finally:
+            broker.unsubscribe(sub)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
+    exit_on_sigterm()
     app.run(debug=True,port=5001)
\ No newline at end of file
@@ -0,0 +1,74 @@
+# benchmarks/bench_history.py
+# orders.json の読み方ごとの時間とピークメモリを比べる
+#
+#   python benchmarks/bench_history.py                 # 1GB の履歴を生成して計測
+#   python benchmarks/bench_history.py --size-mb 100
+#   python benchmarks/bench_history.py --file data/orders.json
+#
+# 計測はそれぞれ別プロセスで行い、ピークメモリは ru_maxrss（Unix のみ）で測る。
+import argparse, json, os, resource, subprocess, sys, tempfile, textwrap, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from datagen import write_orders_json
+
+METHODS = {
+    # 従来: 全件を json.load して最後の1件を見る
+    "json.load + [-1]": "import json; h = json.load(open(PATH, encoding='utf-8')); r = h[-1]",
+    # 先頭から1件ずつ（件数を数えるだけ）
+    "iter_json_array": "from json_stream import iter_json_array; r = sum(1 for _ in iter_json_array(PATH))",
+    # 末尾から最新1件 / 20件
+    "tail_json_array(1)": "from json_stream import tail_json_array; r = tail_json_array(PATH, 1)",
+    "tail_json_array(20)": "from json_stream import tail_json_array; r = tail_json_array(PATH, 20)",
+}
+
+
+def run_one(stmt: str, path: str):
+    code = textwrap.dedent(f"""
+        import resource, sys, time, json
+        sys.path.insert(0, {ROOT!r})
+        PATH = {path!r}
+        t0 = time.perf_counter()
+        {stmt}
+        dt = time.perf_counter() - t0
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(json.dumps({{"seconds": dt, "maxrss": rss}}))
+    """)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    res = json.loads(out.stdout)
+    # Linux は KB、macOS は byte 単位
+    res["peak_mb"] = res["maxrss"] / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="注文履歴の読み込みベンチマーク")
+    parser.add_argument("--size-mb", type=int, default=1024, help="生成する orders.json の大きさ")
+    parser.add_argument("--file", help="既存の orders.json を使う（生成しない）")
+    parser.add_argument("--skip", nargs="*", default=[], help="飛ばす計測（例: 'json.load + [-1]'）")
+    args = parser.parse_args()
+
+    tmpdir = None
+    path = args.file
+    if not path:
+        tmpdir = tempfile.mkdtemp(prefix="menu-bench-")
+        path = os.path.join(tmpdir, "orders.json")
+        t0 = time.perf_counter()
+        n = write_orders_json(path, size_bytes=args.size_mb * 1024 * 1024)
+        print(f"生成: {n} 件 / {os.path.getsize(path) / 1e6:.0f} MB ({time.perf_counter() - t0:.1f}s)")
+    try:
+        print(f"{'method':<22}{'time [s]':>12}{'peak RSS [MB]':>16}")
+        for name, stmt in METHODS.items():
+            if name in args.skip:
+                continue
+            res = run_one(stmt, path)
+            print(f"{name:<22}{res['seconds']:>12.3f}{res['peak_mb']:>16.1f}")
+    finally:
+        if tmpdir:
+            os.remove(path)
+            os.rmdir(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/compare.py
+# benchmarks/run.py の結果2つを並べて比べる
+#
+#   python benchmarks/compare.py before.json after.json
+#   python benchmarks/compare.py before.json after.json --threshold 20 --fail
+#
+# p50 / p99 / ピークメモリが threshold % 以上悪くなったケースに印を付ける。
+# --fail を付けると、悪化が1つでもあれば終了コード 1（CI 用）。
+import argparse, json, sys
+
+METRICS = (
+    # (キー, 表示名, 大きいほど悪いか)
+    ("p50_ms", "p50 [ms]", True),
+    ("p99_ms", "p99 [ms]", True),
+    ("ops_per_s", "ops/s", False),
+    ("peak_mb", "peak MB", True),
+)
+
+
+def load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("meta", {}), {(r["case"], r["size"]): r for r in data["results"]}
+
+
+def change(old, new):
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク結果の比較")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="悪化とみなす変化率（%%）")
+    parser.add_argument("--fail", action="store_true", help="悪化があれば終了コード 1")
+    args = parser.parse_args()
+
+    meta_a, a = load(args.before)
+    meta_b, b = load(args.after)
+    for label, meta in (("before", meta_a), ("after", meta_b)):
+        print(f"{label:<7}{meta.get('time', '?')}  git {meta.get('git') or '?'}  "
+              f"{meta.get('backend', '?')}/{meta.get('order_store', '?')}  Python {meta.get('python', '?')}")
+    print()
+
+    header = f"{'case':<18}{'size':>10}"
+    for _, name, _ in METRICS:
+        header += f"{name:>22}"
+    print(header)
+
+    regressions = 0
+    for key in sorted(a.keys() & b.keys(), key=lambda k: (k[0], k[1])):
+        row = f"{key[0]:<18}{key[1]:>10}"
+        for metric, _, higher_is_worse in METRICS:
+            old, new = a[key][metric], b[key][metric]
+            pct = change(old, new)
+            worse = pct > args.threshold if higher_is_worse else pct < -args.threshold
+            mark = "!" if worse else " "
+            regressions += worse
+            row += f"{new:>12.2f} ({pct:+6.1f}%){mark}"
+        print(row)
+
+    for key in sorted(a.keys() - b.keys()):
+        print(f"{key[0]:<18}{key[1]:>10}  （after に無し）")
+    for key in sorted(b.keys() - a.keys()):
+        print(f"{key[0]:<18}{key[1]:>10}  （before に無し）")
+
+    print(f"\n悪化（±{args.threshold:g}% 超）: {regressions} 項目")
+    if args.fail and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
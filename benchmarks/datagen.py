@@ -0,0 +1,105 @@
+# benchmarks/datagen.py
+# ベンチマーク用の menus.json / orders.json を作る
+#
+#   python benchmarks/datagen.py menus  --items 100000 -o /tmp/menus.json
+#   python benchmarks/datagen.py orders --orders 1000000 -o /tmp/orders.json
+#
+# 同じ引数なら毎回同じ内容になる（乱数は使わず通し番号から決める）。
+import argparse, json, os, sys, textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from menu_item import make_item_id
+
+FOOD_NAMES = ["カレー", "からあげ定食", "ラーメン", "うどん", "オムライス", "ハンバーグ", "親子丼", "焼きそば"]
+DRINK_NAMES = ["コーラ", "アイスコーヒー", "紅茶", "オレンジジュース", "緑茶", "カフェラテ"]
+DESSERT_NAMES = ["プリン", "チーズケーキ", "パフェ", "アイス", "どら焼き"]
+
+# 件数の配分（フード:ドリンク:デザート = 5:3:2）
+SHARES = (("Food", 0.5), ("Drink", 0.3), ("Dessert", 0.2))
+
+
+def menu_items(n_items: int) -> dict:
+    """menus.json と同じ形の dict。名前は「カレー #12」のように番号付きで重ならない"""
+    data = {"foods": [], "drinks": [], "desserts": []}
+    counts = [int(n_items * share) for _, share in SHARES]
+    counts[0] += n_items - sum(counts)
+    for (cat, _), count in zip(SHARES, counts):
+        for i in range(count):
+            if cat == "Food":
+                name = f"{FOOD_NAMES[i % len(FOOD_NAMES)]} #{i}"
+                d = {"name": name, "price": 500 + (i % 20) * 50, "calorie": 300 + (i % 40) * 20}
+                data["foods"].append(d)
+            elif cat == "Drink":
+                name = f"{DRINK_NAMES[i % len(DRINK_NAMES)]} #{i}"
+                d = {"name": name, "price": 150 + (i % 10) * 30, "volume_ml": 200 + (i % 4) * 100,
+                     "sugar_g": i % 30}
+                data["drinks"].append(d)
+            else:
+                name = f"{DESSERT_NAMES[i % len(DESSERT_NAMES)]} #{i}"
+                d = {"name": name, "price": 250 + (i % 12) * 40, "sugar_g": 10 + i % 40,
+                     "calorie": 150 + (i % 30) * 10}
+                data["desserts"].append(d)
+            d["id"] = make_item_id(cat, name)
+    return data
+
+
+def write_menus_json(path: str, n_items: int) -> int:
+    data = menu_items(n_items)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return n_items
+
+
+def order_record(i: int) -> dict:
+    """i 番目の注文。CLI 形式（timestamp）と Web 形式（id, total, ts）を交互に作る"""
+    names = FOOD_NAMES + DRINK_NAMES + DESSERT_NAMES
+    items = [{"name": f"{names[(i + k) % len(names)]} #{k}", "qty": 1 + k, "price": 100 * (k + 3)}
+             for k in range(1 + i % 3)]
+    day = 1 + (i // 1440) % 28
+    hh, mm = divmod(i % 1440, 60)
+    if i % 2:
+        return {"timestamp": f"2025-10-{day:02d}T{hh:02d}:{mm:02d}:00+09:00", "items": items}
+    return {"id": f"202510{day:02d}-{i:08d}", "items": items,
+            "total": sum(it["qty"] * it["price"] for it in items), "ts": f"2025-10-{day:02d}T{hh:02d}:{mm:02d}:00"}
+
+
+def write_orders_json(path: str, n_orders: int | None = None, size_bytes: int | None = None) -> int:
+    """indent=2 の orders.json を件数（n_orders）か大きさ（size_bytes）で作り、書いた件数を返す"""
+    if n_orders is None and size_bytes is None:
+        raise ValueError("n_orders か size_bytes を指定してください")
+    written = 0
+    i = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        while (n_orders is None or i < n_orders) and (size_bytes is None or written < size_bytes):
+            chunk = ("\n" if i == 0 else ",\n") + textwrap.indent(
+                json.dumps(order_record(i), ensure_ascii=False, indent=2), "  ")
+            f.write(chunk)
+            written += len(chunk.encode("utf-8"))
+            i += 1
+        f.write("\n]")
+    return i
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用データの生成")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("menus", help="menus.json を作る")
+    m.add_argument("--items", type=int, default=1000)
+    m.add_argument("-o", "--output", required=True)
+    o = sub.add_parser("orders", help="orders.json を作る")
+    o.add_argument("--orders", type=int, default=100000)
+    o.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+
+    if args.cmd == "menus":
+        n = write_menus_json(args.output, args.items)
+    else:
+        n = write_orders_json(args.output, args.orders)
+    print(f"{args.output}: {n} 件")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# benchmarks/run.py
+# I/O の多い処理のベンチマーク一式
+#
+#   python benchmarks/run.py                              # 既定の規模
+#   python benchmarks/run.py --full                       # メニュー10万件 / 注文1000万件まで
+#   python benchmarks/run.py --menus 10 1000 --orders 1000 --only load_menus checkout
+#   python benchmarks/run.py -o before.json               # 結果を保存して
+#   python benchmarks/compare.py before.json after.json   # 2回分を比べる
+#
+# - メニュー件数ごと: load_menus（キャッシュ無し/有り）, save_menus, get_catalog, build_catalog
+# - 注文件数ごと    : checkout（Flask テストクライアント経由）, 履歴の最新20件, 履歴の全件走査
+# - 1ケース=1プロセスで測り、ピークメモリは ru_maxrss（Unix のみ）
+# - 保存先は環境変数の設定に従う（例: MENU_APP_BACKEND=sqlite python benchmarks/run.py）
+#
+# --data-dir を指定すると生成したデータを残し、次回はそれを使い回す（1000万件の生成は数分かかる）。
+# checkout を測るたびに注文が増えるので、使い回すと履歴はその分だけ大きくなる。
+import argparse, json, os, platform, resource, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from datagen import write_menus_json, write_orders_json
+
+MENU_CASES = ("load_menus", "load_menus_cached", "save_menus", "get_catalog", "build_catalog")
+ORDER_CASES = ("checkout", "history_latest", "history_scan")
+ORDER_CASE_MENU_ITEMS = 100   # 注文系のケースで使うメニューの件数
+
+DEFAULT_MENUS = (10, 1000, 100000)
+DEFAULT_ORDERS = (1000, 100000)
+FULL_MENUS = (10, 1000, 10000, 100000)
+FULL_ORDERS = (1000, 100000, 1000000, 10000000)
+
+# 最低でもこの回数は測る（重いケースは少なめ）
+MIN_ITERS = {"history_scan": 1, "save_menus": 3}
+
+
+# ========= 子プロセス側: 1ケースを測る =========
+def _setup(case):
+    """計測対象の関数（引数なし）を返す。ここでの準備時間は計測に含めない"""
+    import config
+    if config.STORAGE_BACKEND == "sqlite" and not os.path.exists(config.SQLITE_PATH):
+        import sqlite_store
+        sqlite_store.import_json(os.path.join("data", "menus.json"), [os.path.join("data", "orders.json")])
+
+    import menu_io
+    if case == "load_menus":
+        def run():
+            menu_io.invalidate_menu_cache()
+            menu_io.load_menus()
+        return run
+    if case == "load_menus_cached":
+        menu_io.load_menus()
+        return menu_io.load_menus
+    if case == "save_menus":
+        menus = menu_io.load_menus()
+        return lambda: menu_io.save_menus(*menus)
+    if case == "get_catalog":
+        import app_web
+        app_web.get_catalog()
+        return app_web.get_catalog
+    if case == "build_catalog":
+        import app
+        app.build_catalog()
+        return app.build_catalog
+
+    from order_store import get_order_store
+    store = get_order_store()   # 追記ログなら、ここで orders.json の移行が済む
+    if case == "checkout":
+        import app_web
+        client = app_web.app.test_client()
+        item_id = app_web.get_catalog()[0]["id"]
+
+        def run():
+            client.post("/add", data={"id": item_id, "qty": "1"})
+            resp = client.post("/checkout")
+            if resp.status_code != 200:
+                raise RuntimeError(f"checkout failed: {resp.status_code}")
+        return run
+    if case == "history_latest":
+        return lambda: store.latest(20)
+    if case == "history_scan":
+        return lambda: sum(1 for _ in store.iter_records())
+    raise ValueError(f"unknown case: {case}")
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def run_case(case, min_time, max_iters):
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    fn = _setup(case)
+    setup_seconds = time.perf_counter() - t0
+
+    min_iters = MIN_ITERS.get(case, 5)
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_iters:
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+        if len(latencies) >= min_iters and time.perf_counter() - started >= min_time:
+            break
+    total = sum(latencies)
+    latencies.sort()
+    # Linux は KB、macOS は byte 単位
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "iters": len(latencies),
+        "setup_s": setup_seconds,
+        "ops_per_s": len(latencies) / total if total else 0.0,
+        "mean_ms": total / len(latencies) * 1000,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "base_mb": base_rss / unit,
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+    }
+
+
+# ========= 親プロセス側: データを作って各ケースを子プロセスで回す =========
+def _prepare(data_dir, kind, size):
+    """kind="menus"/"orders" 用の作業ディレクトリ（中に data/）を用意して返す"""
+    workdir = os.path.join(data_dir, f"{kind}-{size}")
+    data = os.path.join(workdir, "data")
+    menus = os.path.join(data, "menus.json")
+    orders = os.path.join(data, "orders.json")
+    os.makedirs(data, exist_ok=True)
+    if not os.path.exists(menus):
+        write_menus_json(menus, size if kind == "menus" else ORDER_CASE_MENU_ITEMS)
+    if kind == "orders" and not (os.path.exists(orders) or os.path.exists(orders + ".migrated")):
+        t0 = time.perf_counter()
+        n = write_orders_json(orders, size)
+        print(f"  生成: 注文 {n} 件 / {os.path.getsize(orders) / 1e6:.0f} MB ({time.perf_counter() - t0:.1f}s)",
+              flush=True)
+    return workdir
+
+
+def _spawn(case, workdir, args):
+    cmd = [sys.executable, os.path.abspath(__file__), "--case", case,
+           "--min-time", str(args.min_time), "--max-iters", str(args.max_iters)]
+    out = subprocess.run(cmd, cwd=workdir, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f"{case} が失敗しました:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _meta():
+    import config
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git": rev,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": config.STORAGE_BACKEND,
+        "order_store": config.ORDER_STORE,
+        "cart_store": config.CART_STORE,
+    }
+
+
+def print_row(r):
+    print(f"{r['case']:<18}{r['size']:>10}{r['iters']:>7}{r['ops_per_s']:>12.1f}"
+          f"{r['p50_ms']:>11.3f}{r['p99_ms']:>11.3f}{r['peak_mb']:>10.1f}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="I/O まわりのベンチマーク")
+    parser.add_argument("--menus", type=int, nargs="*", help=f"メニュー件数（既定 {DEFAULT_MENUS}）")
+    parser.add_argument("--orders", type=int, nargs="*", help=f"注文件数（既定 {DEFAULT_ORDERS}）")
+    parser.add_argument("--full", action="store_true", help=f"メニュー {FULL_MENUS} / 注文 {FULL_ORDERS}")
+    parser.add_argument("--only", nargs="*", help="測るケース名")
+    parser.add_argument("--min-time", type=float, default=1.0, help="1ケースあたりの最低計測時間（秒）")
+    parser.add_argument("--max-iters", type=int, default=2000)
+    parser.add_argument("--data-dir", help="生成データの置き場所（指定すると残して使い回す）")
+    parser.add_argument("-o", "--output", help="結果の JSON（既定 benchmarks/results/<日時>.json）")
+    parser.add_argument("--case", help=argparse.SUPPRESS)   # 子プロセス用
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.min_time, args.max_iters)))
+        return
+
+    menu_sizes = args.menus if args.menus is not None else (FULL_MENUS if args.full else DEFAULT_MENUS)
+    order_sizes = args.orders if args.orders is not None else (FULL_ORDERS if args.full else DEFAULT_ORDERS)
+    only = set(args.only) if args.only else None
+    unknown = (only or set()) - set(MENU_CASES) - set(ORDER_CASES)
+    if unknown:
+        parser.error(f"未知のケース: {', '.join(sorted(unknown))}（{', '.join(MENU_CASES + ORDER_CASES)}）")
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="menu-bench-")
+    results = []
+    print(f"{'case':<18}{'size':>10}{'iters':>7}{'ops/s':>12}{'p50 [ms]':>11}{'p99 [ms]':>11}{'peak MB':>10}")
+    try:
+        for kind, sizes, cases in (("menus", menu_sizes, MENU_CASES), ("orders", order_sizes, ORDER_CASES)):
+            cases = [c for c in cases if only is None or c in only]
+            if not cases:
+                continue
+            for size in sizes:
+                workdir = _prepare(data_dir, kind, size)
+                for case in cases:
+                    r = {"case": case, "size": size, **_spawn(case, workdir, args)}
+                    results.append(r)
+                    print_row(r)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": _meta(), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"\n結果: {output}")
+
+
+if __name__ == "__main__":
+    main()
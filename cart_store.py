@@ -0,0 +1,209 @@
+# cart_store.py
+# Web アプリのカートをサーバー側に置くストア
+#
+# セッション（クッキー）にはカート ID だけを入れ、中身はここに保存する。
+# カートは「商品 ID -> 数量」だけを持つ。名前や価格は表示・注文確定のときにカタログから引く。
+# 追加・数量変更・削除は商品 ID 1つで引ける。
+#
+#   carts = get_cart_store()
+#   carts.add(cart_id, "F-1a2b3c4d", 2)
+#   carts.items(cart_id)   # [{"id": "F-1a2b3c4d", "qty": 2}, ...]（入れた順）
+#
+# バックエンドは config.CART_STORE で切り替える
+#   "memory" : プロセス内の LRU + 有効期限（ワーカー1つのとき向け）
+#   "sqlite" : data/carts.db（複数ワーカー / 再起動をまたいで共有する）
+import time, threading
+from collections import OrderedDict
+
+import config
+from metrics import span
+
+
+class CartStore:
+    """カートストアの共通インターフェース"""
+
+    def items(self, cart_id: str) -> list:
+        """カートの明細を入れた順で返す。無ければ空リスト"""
+        raise NotImplementedError
+
+    def add(self, cart_id: str, item_id: str, qty: int):
+        """商品を qty 個足す（既にあれば数量を加算）"""
+        raise NotImplementedError
+
+    def set_qty(self, cart_id: str, item_id: str, qty: int):
+        """数量を置き換える（カートに無い商品なら何もしない）"""
+        raise NotImplementedError
+
+    def remove(self, cart_id: str, item_id: str):
+        raise NotImplementedError
+
+    def clear(self, cart_id: str):
+        raise NotImplementedError
+
+
+class MemoryCartStore(CartStore):
+    """プロセス内の辞書に置くカート。最後に触ってから ttl 秒で消え、max_carts を超えたら古い順に捨てる"""
+
+    def __init__(self, max_carts: int | None = None, ttl: float | None = None):
+        self.max_carts = max_carts or config.CART_MAX
+        self.ttl = ttl if ttl is not None else config.CART_TTL_SECONDS
+        self._carts = OrderedDict()   # cart_id -> (最終アクセス時刻, {item_id: 数量})
+        self._lock = threading.Lock()
+
+    def _cart(self, cart_id, create=False):
+        # 呼び出し側で self._lock を取っていること
+        now = time.monotonic()
+        entry = self._carts.get(cart_id)
+        if entry is not None and now - entry[0] > self.ttl:
+            del self._carts[cart_id]
+            entry = None
+        if entry is None:
+            if not create:
+                return None
+            entry = (now, {})
+            self._evict(now)
+        else:
+            entry = (now, entry[1])
+        self._carts[cart_id] = entry
+        self._carts.move_to_end(cart_id)
+        return entry[1]
+
+    def _evict(self, now):
+        # 先頭ほど長く触られていないので、期限切れと上限超えを先頭から落とす
+        while self._carts:
+            oldest_id, (touched, _) = next(iter(self._carts.items()))
+            if len(self._carts) < self.max_carts and now - touched <= self.ttl:
+                break
+            del self._carts[oldest_id]
+
+    def items(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            return [{"id": item_id, "qty": qty} for item_id, qty in cart.items()] if cart else []
+
+    def add(self, cart_id, item_id, qty):
+        with self._lock:
+            cart = self._cart(cart_id, create=True)
+            cart[item_id] = cart.get(item_id, 0) + qty
+
+    def set_qty(self, cart_id, item_id, qty):
+        with self._lock:
+            cart = self._cart(cart_id)
+            if cart and item_id in cart:
+                cart[item_id] = qty
+
+    def remove(self, cart_id, item_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            if cart:
+                cart.pop(item_id, None)
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def __len__(self):
+        return len(self._carts)
+
+
+CART_SCHEMA = """
+CREATE TABLE IF NOT EXISTS carts (
+    cart_id TEXT PRIMARY KEY,
+    touched REAL NOT NULL          -- 最後に触った時刻（time.time()）
+);
+CREATE TABLE IF NOT EXISTS cart_items (
+    cart_id TEXT    NOT NULL,
+    item_id TEXT    NOT NULL,
+    qty     INTEGER NOT NULL,
+    PRIMARY KEY (cart_id, item_id)
+);
+CREATE INDEX IF NOT EXISTS idx_carts_touched ON carts(touched);
+"""
+
+
+class SqliteCartStore(CartStore):
+    """SQLite に置くカート。(cart_id, item_id) が主キーなので1行ずつ更新できる"""
+
+    PURGE_EVERY = 300   # 期限切れカートの掃除間隔（秒）
+
+    def __init__(self, path: str | None = None, ttl: float | None = None):
+        self.path = path or config.CART_DB_PATH
+        self.ttl = ttl if ttl is not None else config.CART_TTL_SECONDS
+        self._last_purge = 0.0
+
+    def _conn(self):
+        import sqlite_store
+        return sqlite_store.connect(self.path, schema=CART_SCHEMA)
+
+    def _touch(self, conn, cart_id, now):
+        # 書き込みは必ずここを通る。期限切れのカートは中身を捨ててから触る（MemoryCartStore と同じく空から始まる）
+        row = conn.execute("SELECT touched FROM carts WHERE cart_id = ?", (cart_id,)).fetchone()
+        if row is not None and now - row[0] > self.ttl:
+            conn.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
+        conn.execute(
+            "INSERT INTO carts (cart_id, touched) VALUES (?, ?)"
+            " ON CONFLICT(cart_id) DO UPDATE SET touched = excluded.touched", (cart_id, now))
+        if now - self._last_purge > self.PURGE_EVERY:
+            self._last_purge = now
+            self._purge(conn, now - self.ttl)
+
+    def _purge(self, conn, before):
+        conn.execute("DELETE FROM cart_items WHERE cart_id IN (SELECT cart_id FROM carts WHERE touched < ?)",
+                     (before,))
+        conn.execute("DELETE FROM carts WHERE touched < ?", (before,))
+
+    def items(self, cart_id):
+        conn = self._conn()
+        with span("storage_read"):
+            row = conn.execute("SELECT touched FROM carts WHERE cart_id = ?", (cart_id,)).fetchone()
+            if row is None or time.time() - row[0] > self.ttl:
+                return []
+            # 行の rowid は UPDATE では変わらないので、rowid 順 = 入れた順
+            return [{"id": item_id, "qty": qty} for item_id, qty in conn.execute(
+                "SELECT item_id, qty FROM cart_items WHERE cart_id = ? ORDER BY rowid", (cart_id,))]
+
+    def add(self, cart_id, item_id, qty):
+        conn = self._conn()
+        now = time.time()
+        with span("storage_write"), conn:
+            self._touch(conn, cart_id, now)
+            conn.execute(
+                "INSERT INTO cart_items (cart_id, item_id, qty) VALUES (?, ?, ?)"
+                " ON CONFLICT(cart_id, item_id) DO UPDATE SET qty = qty + excluded.qty",
+                (cart_id, item_id, qty))
+
+    def set_qty(self, cart_id, item_id, qty):
+        conn = self._conn()
+        with span("storage_write"), conn:
+            self._touch(conn, cart_id, time.time())
+            conn.execute("UPDATE cart_items SET qty = ? WHERE cart_id = ? AND item_id = ?", (qty, cart_id, item_id))
+
+    def remove(self, cart_id, item_id):
+        conn = self._conn()
+        with span("storage_write"), conn:
+            self._touch(conn, cart_id, time.time())
+            conn.execute("DELETE FROM cart_items WHERE cart_id = ? AND item_id = ?", (cart_id, item_id))
+
+    def clear(self, cart_id):
+        conn = self._conn()
+        with span("storage_write"), conn:
+            conn.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
+            conn.execute("DELETE FROM carts WHERE cart_id = ?", (cart_id,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cart_store() -> CartStore:
+    """設定に応じたカートストア（プロセス内で1つ）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if config.CART_STORE == "sqlite":
+                _store = SqliteCartStore()
+            elif config.CART_STORE == "memory":
+                _store = MemoryCartStore()
+            else:
+                raise ValueError(f"未対応の MENU_APP_CART_STORE: {config.CART_STORE}")
+        return _store
@@ -0,0 +1,148 @@
+# catalog.py
+# メニュー全体を ID / 名前 / カテゴリで引けるようにしたコンテナ
+#
+#   catalog = load_catalog()      # menu_io からキャッシュ付きで取得
+#   catalog.get("F-1a2b3c4d")     # ID で O(1)
+#   catalog.find("カレー")         # 名前で O(1)（名前の索引は初めて find() したときに作る）
+#   catalog.category("Drink")     # カテゴリの一覧（並び順は menus.json のまま）
+#   catalog.apply(changes)        # menu_repo の変更を当てた新しい Catalog（元は変えない）
+#
+# ID の索引は dict ではなく array のハッシュ表（開番地法）。入れるのは商品の通し番号だけなので、
+# 1件あたり数バイトで済む（dict だとキーの ID 文字列と合わせて1件 100 バイト近くになる）。
+# 同じ ID が重なったら最初の1件を引く。重ならない ID は保存するとき（menu_io / menu_repo）に付ける。
+from array import array
+
+CATEGORIES = ("Food", "Drink", "Dessert")
+
+
+class Catalog:
+    __slots__ = ("by_category", "by_name", "_hashes", "_table", "version", "revision")
+
+    def __init__(self, foods=(), drinks=(), desserts=(), version=None, revision=0, _hashes=None):
+        self.by_category = {cat: list(items) for cat, items in zip(CATEGORIES, (foods, drinks, desserts))}
+        # hash(item.id) を商品と同じ並びで持つ（apply() で作り直すときに ID を計算し直さない）
+        self._hashes = _hashes or {cat: array("q", [it.id_hash() for it in self.by_category[cat]])
+                                   for cat in CATEGORIES}
+        self.by_name = None      # find() で初めて作る（使わないプロセスでは持たない）
+        self.version = version   # menu_io.menu_version() と同じ文字列（注文に価格の版として残す）
+        self.revision = revision # menu_repo の版番号（編集のたびに1つ進む）
+        self._build_table()
+
+    def _build_table(self):
+        # 表の大きさは2の累乗で、埋まるのは 2/3 まで（dict と同じ）。値は通し番号 + 1（0 は空き）
+        size = 8
+        while size * 2 < len(self) * 3:
+            size *= 2
+        mask = size - 1
+        table = array("i", bytes(4 * size))
+        pos = 0
+        for cat in CATEGORIES:
+            items = self.by_category[cat]
+            for i, h in enumerate(self._hashes[cat]):
+                slot = h & mask
+                while table[slot]:
+                    other = table[slot] - 1
+                    if self._hash_at(other) == h and self._at(other).id == items[i].id:
+                        break   # 同じ ID は最初の1件だけ引けるようにする
+                    slot = (slot + 1) & mask
+                else:
+                    table[slot] = pos + 1
+                pos += 1
+        self._table = table
+
+    def _at(self, pos):
+        for cat in CATEGORIES:
+            items = self.by_category[cat]
+            if pos < len(items):
+                return items[pos]
+            pos -= len(items)
+        raise IndexError(pos)
+
+    def _hash_at(self, pos):
+        for cat in CATEGORIES:
+            hashes = self._hashes[cat]
+            if pos < len(hashes):
+                return hashes[pos]
+            pos -= len(hashes)
+        raise IndexError(pos)
+
+    def __len__(self):
+        return sum(map(len, self.by_category.values()))
+
+    def __iter__(self):
+        """Food → Drink → Dessert の順に商品を返す"""
+        for cat in CATEGORIES:
+            yield from self.by_category[cat]
+
+    def __contains__(self, item_id):
+        return self.get(item_id) is not None
+
+    def get(self, item_id):
+        if not isinstance(item_id, str):
+            return None
+        h = hash(item_id)
+        table = self._table
+        mask = len(table) - 1
+        slot = h & mask
+        while table[slot]:
+            pos = table[slot] - 1
+            if self._hash_at(pos) == h:
+                it = self._at(pos)
+                if it.id == item_id:
+                    return it
+            slot = (slot + 1) & mask
+        return None
+
+    def find(self, name):
+        """名前で引く（同名があれば最初の1件）"""
+        if self.by_name is None:
+            by_name = {}
+            for it in self:
+                by_name.setdefault(it.name, it)
+            self.by_name = by_name
+        return self.by_name.get(name)
+
+    def category(self, cat) -> list:
+        return self.by_category.get(cat, [])
+
+    def menus(self):
+        """(foods, drinks, desserts) のコピー（load_menus() と同じ形）"""
+        return tuple(list(self.by_category[cat]) for cat in CATEGORIES)
+
+    def apply(self, changes, version=None):
+        """変更 [{"v", "op", "cat", "item" または "id"}, ...] を順に当てた新しい Catalog を返す"""
+        items = {cat: list(self.by_category[cat]) for cat in CATEGORIES}
+        hashes = {cat: array("q", self._hashes[cat]) for cat in CATEGORIES}
+        revision = self.revision
+        for ch in changes:
+            cat = ch["cat"]
+            if ch["op"] == "delete":
+                i = _index_of(items[cat], hashes[cat], ch["id"])
+                if i is not None:
+                    del items[cat][i], hashes[cat][i]
+            else:
+                # add は末尾に、update は元の位置のまま置き換わる
+                item = ch["item"]
+                h = item.id_hash()
+                i = _index_of(items[cat], hashes[cat], item.id, h)
+                if i is None:
+                    items[cat].append(item)
+                    hashes[cat].append(h)
+                else:
+                    items[cat][i] = item
+            revision = ch["v"]
+        return Catalog(*(items[cat] for cat in CATEGORIES), version=version, revision=revision, _hashes=hashes)
+
+
+def _index_of(items, hashes, item_id, h=None):
+    """items の中で item_id の位置（hashes を C の速さで探し、当たったものだけ ID を比べる）"""
+    h = hash(item_id) if h is None else h
+    start = 0
+    while True:
+        try:
+            i = hashes.index(h, start)
+        except ValueError:
+            return None
+        if items[i].id == item_id:
+            return i
+        start = i + 1
@@ -0,0 +1,67 @@
+# config.py
+# 環境変数で切り替えられる設定をまとめる（未指定ならデフォルト値）
+import os
+
+# メニュー/注文の保存先
+#   "json"   : data/menus.json + 注文ストア（デフォルト）
+#   "sqlite" : data/menu_app.db（WALモード）。移行は python sqlite_store.py import
+STORAGE_BACKEND = os.environ.get("MENU_APP_BACKEND", "json")
+SQLITE_PATH     = os.environ.get("MENU_APP_SQLITE_PATH", os.path.join("data", "menu_app.db"))
+
+# 注文履歴の保存方式
+#   "log"    : data/orders/ に 1注文=1行 の追記型ログ（json バックエンドのデフォルト）
+#   "json"   : 従来どおり data/orders.json の配列を丸ごと書き直す
+#   "sqlite" : SQLite の orders / order_items テーブル（sqlite バックエンドのデフォルト）
+ORDER_STORE = os.environ.get("MENU_APP_ORDER_STORE", "sqlite" if STORAGE_BACKEND == "sqlite" else "log")
+
+# 追記ログの調整値
+ORDER_LOG_SEGMENT_BYTES = int(os.environ.get("MENU_APP_ORDER_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+ORDER_LOG_FSYNC_EVERY   = int(os.environ.get("MENU_APP_ORDER_LOG_FSYNC_EVERY", "32"))
+ORDER_LOG_FSYNC_SECONDS = float(os.environ.get("MENU_APP_ORDER_LOG_FSYNC_SECONDS", "1.0"))
+
+# Web のカートの置き場所（セッションにはカート ID だけを入れる）
+#   "memory" : プロセス内の LRU（デフォルト。ワーカーが1つのとき向け）
+#   "sqlite" : data/carts.db（gunicorn などで複数ワーカーにするときはこちら）
+CART_STORE        = os.environ.get("MENU_APP_CART_STORE", "memory")
+CART_DB_PATH      = os.environ.get("MENU_APP_CART_DB_PATH", os.path.join("data", "carts.db"))
+CART_TTL_SECONDS  = float(os.environ.get("MENU_APP_CART_TTL_SECONDS", str(6 * 60 * 60)))
+CART_MAX          = int(os.environ.get("MENU_APP_CART_MAX", "10000"))
+
+# Web のチェックアウトでの注文の書き込み（order_writer）
+#   "fsync"   : ディスクに書けてから完了画面を返す（デフォルト。SQLite は synchronous=FULL で開く）
+#   "enqueue" : 書き込み待ちの列に入れた時点で返す（速いが、落ちると直前の注文を失いうる）
+ORDER_DURABILITY = os.environ.get("MENU_APP_ORDER_DURABILITY", "fsync")
+ORDER_QUEUE_SIZE = int(os.environ.get("MENU_APP_ORDER_QUEUE_SIZE", "1000"))
+ORDER_BATCH_MAX  = int(os.environ.get("MENU_APP_ORDER_BATCH_MAX", "256"))
+
+# メニューの変更の監視（menu_watch）。Web のワーカーと GUI がこの間隔で版を確かめる
+MENU_POLL_SECONDS     = float(os.environ.get("MENU_APP_MENU_POLL_SECONDS", "1.0"))
+MENU_DEBOUNCE_SECONDS = float(os.environ.get("MENU_APP_MENU_DEBOUNCE_SECONDS", "0.3"))
+
+# キッチン表示（/kitchen/stream）。注文の入り方は kitchen.py を参照
+#   "writer" : このプロセスで書いた注文を配る（デフォルト。ワーカーが1つのとき向け）
+#   "store"  : 注文ストアを KITCHEN_POLL_SECONDS ごとに追いかける（複数ワーカーのとき）
+KITCHEN_SOURCE       = os.environ.get("MENU_APP_KITCHEN_SOURCE", "writer")
+KITCHEN_POLL_SECONDS = float(os.environ.get("MENU_APP_KITCHEN_POLL_SECONDS", "0.5"))
+KITCHEN_QUEUE_SIZE   = int(os.environ.get("MENU_APP_KITCHEN_QUEUE_SIZE", "256"))
+KITCHEN_REPLAY_MAX   = int(os.environ.get("MENU_APP_KITCHEN_REPLAY_MAX", "500"))
+KITCHEN_INITIAL      = int(os.environ.get("MENU_APP_KITCHEN_INITIAL", "20"))
+KITCHEN_HEARTBEAT_SECONDS = float(os.environ.get("MENU_APP_KITCHEN_HEARTBEAT_SECONDS", "15"))
+
+# 非同期サーバー（python app_asgi.py）
+#   ワーカーを 2 以上にするときは MENU_APP_CART_STORE=sqlite / MENU_APP_KITCHEN_SOURCE=store にすること
+WEB_HOST       = os.environ.get("MENU_APP_WEB_HOST", "127.0.0.1")
+WEB_PORT       = int(os.environ.get("MENU_APP_WEB_PORT", "5001"))
+WEB_WORKERS    = int(os.environ.get("MENU_APP_WEB_WORKERS", "1"))
+WEB_IO_THREADS = int(os.environ.get("MENU_APP_WEB_IO_THREADS", "32"))   # ストレージの読み書きに使うスレッド数
+
+# 管理ページ（/admin, /admin/stats, /admin/profile）
+#   MENU_APP_ADMIN_TOKEN を設定すると、/admin?token=... で一度合わせたブラウザだけが使える
+#   未設定なら、このマシン（127.0.0.1 / ::1）からの接続だけ
+ADMIN_TOKEN = os.environ.get("MENU_APP_ADMIN_TOKEN", "")
+
+# 計測（metrics.py）。/metrics は常に有効
+#   MENU_APP_PROFILE=パス を付けると起動から終了までサンプリングプロファイラを動かし、終了時にそこへ書く
+PROFILE_PATH     = os.environ.get("MENU_APP_PROFILE", "")
+PROFILE_INTERVAL = float(os.environ.get("MENU_APP_PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = float(os.environ.get("MENU_APP_PROFILE_MAX_SECONDS", "60"))   # /admin/profile の上限
@@ -0,0 +1,142 @@
+# json_stream.py
+# 大きな JSON 配列（orders.json）を丸ごと json.load せずに読むためのヘルパー
+#
+#   for rec in iter_json_array(path):   # 先頭から1件ずつ（メモリは一定）
+#       ...
+#   tail_json_array(path, 5)            # 末尾の5件だけ（後ろから読む）
+import os, json
+
+_WS = b" \t\r\n"
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16):
+    """JSON 配列の要素を1つずつ返す。形式が壊れていれば ValueError"""
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            # 読み足す。これ以上無ければ False
+            nonlocal buf, pos, eof
+            if eof:
+                return False
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+
+        def next_char():
+            # 空白を飛ばした次の1文字（位置は進めない）。終端なら ""
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                if not fill():
+                    return ""
+
+        if next_char() != "[":
+            raise ValueError(f"{path}: JSON 配列ではありません")
+        pos += 1
+        if next_char() == "]":
+            return
+        while True:
+            next_char()
+            while True:
+                try:
+                    obj, end = _decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    obj = end = None
+                # 数値などはバッファ末尾で切れても読めてしまうので、末尾ぴったりなら読み足す
+                if end is not None and (end < len(buf) or eof):
+                    break
+                if not fill():
+                    if end is not None:
+                        break
+                    # 要素の途中でファイルが終わっている
+                    raise ValueError(f"{path}: 途中で壊れています")
+            pos = end
+            yield obj
+            c = next_char()
+            if c == ",":
+                pos += 1
+            elif c == "]":
+                return
+            else:
+                raise ValueError(f"{path}: 要素の区切りが不正です")
+
+
+def tail_json_array(path: str, n: int, block: int = 1 << 16) -> list:
+    """JSON 配列（要素は dict）の末尾 n 件を古い順で返す。ファイル末尾から必要な分だけ読む"""
+    if n <= 0:
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        start = f.tell()   # buf[0] のファイル上の位置
+        buf = b""
+
+        def grow():
+            nonlocal start, buf
+            if start == 0:
+                return False
+            step = min(block, start)
+            start -= step
+            f.seek(start)
+            buf = f.read(step) + buf
+            return True
+
+        def prev_char(p):
+            # p より前の空白でない文字の位置（ファイル上の絶対位置）。無ければ -1
+            p -= 1
+            while True:
+                while p >= start and buf[p - start] in _WS:
+                    p -= 1
+                if p >= start:
+                    return p
+                if not grow():
+                    return -1
+
+        end = prev_char(start + len(buf))
+        if end < 0 or buf[end - start] != ord("]"):
+            raise ValueError(f"{path}: JSON 配列ではありません")
+
+        out = []
+        while len(out) < n:
+            last = prev_char(end)          # 直前の要素の最後の文字
+            if last < 0:
+                raise ValueError(f"{path}: JSON 配列ではありません")
+            if buf[last - start] == ord("["):
+                break                      # 先頭まで来た
+            stop = last + 1
+            # 後ろから '{' を探し、そこから stop までがちょうど1つの JSON になる位置が要素の先頭
+            p = last
+            while True:
+                i = buf.rfind(b"{", 0, p - start)
+                if i < 0:
+                    if not grow():
+                        raise ValueError(f"{path}: 要素の先頭が見つかりません")
+                    continue
+                p = start + i
+                try:
+                    obj = json.loads(buf[p - start:stop - start])
+                except ValueError:
+                    continue
+                if isinstance(obj, dict):
+                    break
+            out.append(obj)
+            sep = prev_char(p)
+            if sep < 0:
+                raise ValueError(f"{path}: JSON 配列ではありません")
+            if buf[sep - start] == ord("["):
+                break
+            if buf[sep - start] != ord(","):
+                raise ValueError(f"{path}: 要素の区切りが不正です")
+            end = sep
+    out.reverse()
+    return out
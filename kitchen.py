@@ -0,0 +1,158 @@
+# kitchen.py
+# キッチン表示（/kitchen, /kitchen/stream）に新しい注文を配る
+#
+#   broker = get_kitchen_broker()
+#   sub = broker.subscribe()      # 表示1台ぶんの受け口
+#   sub.get(timeout=15)           # 次の注文（無ければ None）。遅すぎて溢れたら Subscriber.closed
+#   broker.unsubscribe(sub)
+#   broker.subscribe(wakeup=fn)   # 非同期サーバー用: 注文が入るたびに fn() を呼ぶ（get_nowait() で取り出す）
+#   replay(last_id)               # 再接続時: last_id より後の注文を注文ストアから
+#
+# 注文の入り方は config.KITCHEN_SOURCE で選ぶ
+#   "writer" : このプロセスの order_writer が書き終えた注文をそのまま配る（デフォルト。ワーカー1つ向け）
+#   "store"  : 注文ストアを read_since() で追いかける（ワーカーが複数でも全部の注文が届く）。
+#              読むのはプロセスにつき1スレッドだけで、表示の台数には比例しない
+#
+# 配る側は待たない。表示側の列が KITCHEN_QUEUE_SIZE を超えたらその接続を切り、
+# ブラウザの再接続（Last-Event-ID 付き）で注文ストアから取り直してもらう。
+import sys, time, threading
+from collections import deque
+
+import config
+from order_store import get_order_store, CursorExpired
+
+
+class Subscriber:
+    """表示1台ぶんの受け口（上限付きの列）"""
+
+    def __init__(self, maxsize: int, wakeup=None):
+        self.maxsize = maxsize
+        self.wakeup = wakeup
+        self.closed = False
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def put(self, record) -> bool:
+        """溢れたら閉じて False（配る側は待たない）"""
+        with self._cond:
+            if self.closed:
+                return False
+            if len(self._queue) >= self.maxsize:
+                self.closed = True
+                self._queue.clear()
+            else:
+                self._queue.append(record)
+            self._cond.notify()
+        if self.wakeup is not None:
+            self.wakeup()
+        return not self.closed
+
+    def get(self, timeout: float | None = None):
+        """次の注文。timeout までに無ければ None。閉じられていれば None を返し closed が立つ"""
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            if self._queue:
+                return self._queue.popleft()
+            return None
+
+    def get_nowait(self):
+        """次の注文。無ければ（閉じられていても）None"""
+        with self._cond:
+            return self._queue.popleft() if self._queue else None
+
+    def close(self):
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._cond.notify()
+        if self.wakeup is not None:
+            self.wakeup()
+
+
+class KitchenBroker:
+    def __init__(self, queue_size: int | None = None):
+        self.queue_size = queue_size or config.KITCHEN_QUEUE_SIZE
+        self._subs = set()
+        self._lock = threading.Lock()
+        self._stats = {"published": 0, "dropped": 0}
+
+    def subscribe(self, wakeup=None) -> Subscriber:
+        sub = Subscriber(self.queue_size, wakeup)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            self._subs.discard(sub)
+        sub.close()
+
+    def publish_many(self, records):
+        with self._lock:
+            subs = list(self._subs)
+        for rec in records:
+            self._stats["published"] += 1
+            for sub in subs:
+                if not sub.closed and not sub.put(rec):
+                    # 追いつけない表示は切る（再接続で注文ストアから取り直す）
+                    self._stats["dropped"] += 1
+                    self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, subscribers=len(self._subs))
+
+
+def _follow_store(broker: KitchenBroker, interval: float):
+    # 今ある注文は再接続の取り直し（replay）に任せ、ここでは起動後の新着だけを配る
+    #（履歴を先頭から読み飛ばさず、末尾の位置から始める）
+    store = get_order_store()
+    cursor = store.end_cursor()
+    while True:
+        time.sleep(interval)
+        try:
+            batch = []
+            for rec, cursor in store.read_since(cursor):
+                batch.append(rec)
+            if batch:
+                broker.publish_many(batch)
+        except CursorExpired:
+            # コンパクションで位置が変わったので、末尾から追い直す
+            cursor = store.end_cursor()
+        except Exception as e:
+            print(f"[kitchen] 注文ストアを読めませんでした: {e!r}", file=sys.stderr)
+
+
+def replay(last_id: str | None, limit: int | None = None) -> list:
+    """last_id より後の注文（古い順）。last_id が無ければ直近の注文を返す（表示の初期状態）"""
+    if not last_id:
+        return get_order_store().latest(config.KITCHEN_INITIAL)
+    recent = get_order_store().latest(limit or config.KITCHEN_REPLAY_MAX)
+    for i, rec in enumerate(recent):
+        if rec.get("id") == last_id:
+            return recent[i + 1:]
+    # 範囲より前の ID なら、注文番号（時刻順に並ぶ）で後のものだけ
+    return [rec for rec in recent if rec.get("id") and rec["id"] > last_id]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_kitchen_broker() -> KitchenBroker:
+    """プロセス内で1つの KitchenBroker。初回に注文の入り口をつなぐ"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = KitchenBroker()
+            if config.KITCHEN_SOURCE == "store":
+                threading.Thread(target=_follow_store, args=(_broker, config.KITCHEN_POLL_SECONDS),
+                                 name="kitchen-follow", daemon=True).start()
+            elif config.KITCHEN_SOURCE == "writer":
+                from order_writer import get_order_writer
+                get_order_writer().add_listener(_broker.publish_many)
+            else:
+                raise ValueError(f"未対応の MENU_APP_KITCHEN_SOURCE: {config.KITCHEN_SOURCE}")
+        return _broker
@@ -1,64 +1,268 @@
 # menu_io.py
-import os, json
-from menu_item import Food, Drink, Dessert
+import os, json, threading
+import config
+from menu_item import Food, Drink, Dessert, unique_item_id
+from catalog import Catalog
+from storage import file_lock, atomic_write_json
+from metrics import span, inc
 
 DATA_DIR = "data"
 DATA_FILE = os.path.join(DATA_DIR, "menus.json")
 
+# 編集の差分（menu_repo が1行ずつ追記する。menus.json の "version" より後の分だけが有効）
+JOURNAL_FILE = os.path.join(DATA_DIR, "menus.journal.jsonl")
+
+# ---- プロセス内キャッシュ ----
+# menus.json の (mtime, size, inode) とジャーナルの長さ（sqlite なら meta の版）が変わったときだけ読み直す。
+# menus.json が同じでジャーナルだけ伸びたときは、増えた差分だけを Catalog に当てる。
+_cache_lock = threading.Lock()
+_cache = {"key": None, "catalog": None, "snap": None, "offset": 0}
+_stats = {"hits": 0, "misses": 0, "deltas": 0}
+# このプロセスでメニューを書いた回数（menu_watch が stat せずに自分の編集に気づくため）
+_local_edits = 0
+
 def _pick(d: dict, keys: list[str]) -> dict:
     """辞書 d から指定キーのみ拾って返す（存在するものだけ）"""
     return {k: d[k] for k in keys if k in d}
 
+def _file_key(path: str) -> str:
+    # 書き換え（os.replace）で mtime / サイズ / inode のどれかが変わる
+    st = os.stat(path)
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}-{st.st_ino:x}"
+
+def _journal_size() -> int:
+    try:
+        return os.stat(JOURNAL_FILE).st_size
+    except FileNotFoundError:
+        return 0
+
+def menu_version() -> str:
+    """メニューの版。menus.json が書き換わるか編集が入ると変わる（ETag やページキャッシュ用）"""
+    if config.STORAGE_BACKEND == "sqlite":
+        import sqlite_store
+        return sqlite_store.menu_version()
+    try:
+        return f"{_file_key(DATA_FILE)}-{_journal_size():x}"
+    except FileNotFoundError:
+        return "empty"
+
+def cache_stats() -> dict:
+    """キャッシュのヒット/ミス回数"""
+    with _cache_lock:
+        return dict(_stats)
+
+def invalidate_menu_cache():
+    """次の load_menus() で必ず読み直させる"""
+    with _cache_lock:
+        _cache.update(key=None, catalog=None, snap=None, offset=0)
+    note_local_edit()
+
+def note_local_edit():
+    global _local_edits
+    _local_edits += 1
+
+def local_edit_count() -> int:
+    return _local_edits
+
+def load_catalog() -> Catalog:
+    """メニュー全体の Catalog。変わっていなければキャッシュを返す（共有なので変更しないこと）"""
+    if config.STORAGE_BACKEND == "sqlite":
+        return _load_sqlite_catalog()
+    snap = _prepare_json_file()
+    if snap is None:
+        return Catalog(version="empty")
+    key = f"{snap}-{_journal_size():x}"
+
+    with _cache_lock:
+        if _cache["key"] == key:
+            _stats["hits"] += 1
+            return _cache["catalog"]
+        cached = _cache["catalog"]
+        if cached is not None and _cache["snap"] == snap:
+            # ジャーナルに追記された分だけを当てる
+            _stats["deltas"] += 1
+            changes, offset = read_journal(_cache["offset"], after=cached.revision)
+            with span("catalog_build"):
+                catalog = cached.apply(changes, version=f"{snap}-{offset:x}") if changes else cached
+        else:
+            _stats["misses"] += 1
+            menus, revision = _read_json_menus()
+            changes, offset = read_journal(0, after=revision)
+            with span("catalog_build"):
+                catalog = Catalog(*menus, version=f"{snap}-{offset:x}", revision=revision)
+                if changes:
+                    catalog = catalog.apply(changes, version=catalog.version)
+        _cache.update(key=catalog.version, catalog=catalog, snap=snap, offset=offset)
+        return catalog
+
+def _load_sqlite_catalog() -> Catalog:
+    import sqlite_store
+    revision = sqlite_store.menu_revision()
+    key = f"db-{revision}"
+    with _cache_lock:
+        if _cache["key"] == key:
+            _stats["hits"] += 1
+            return _cache["catalog"]
+        cached = _cache["catalog"]
+        changes = None
+        if cached is not None and _cache["snap"] == "db":
+            changes = sqlite_store.menu_changes_since(cached.revision, revision)
+        if changes is not None:
+            # 差分は「追加/更新後の商品で置き換え」「削除」なので、多めに当てても結果は変わらない
+            _stats["deltas"] += 1
+            with span("catalog_build"):
+                catalog = cached.apply(changes, version=key)
+        else:
+            _stats["misses"] += 1
+            with span("storage_read"):
+                menus = sqlite_store.load_menus()
+            with span("catalog_build"):
+                catalog = Catalog(*menus, version=key, revision=revision)
+        _cache.update(key=key, catalog=catalog, snap="db", offset=0)
+        return catalog
+
+def read_journal(offset: int = 0, after: int = 0):
+    """ジャーナルの offset バイト目以降で、版が after より後の変更と、読み終えた位置を返す"""
+    changes = []
+    try:
+        f = open(JOURNAL_FILE, "rb")
+    except FileNotFoundError:
+        return changes, 0
+    start = offset
+    with f, span("storage_read"):
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break   # 書きかけの行は次回に回す
+            offset += len(line)
+            try:
+                ch = json.loads(line)
+            except ValueError:
+                continue
+            if ch.get("v", 0) <= after:
+                continue
+            if ch["op"] != "delete":
+                ch["item"] = _parse_item(ch["cat"], ch["item"])
+            changes.append(ch)
+    inc("file_read_bytes", offset - start)
+    return changes, offset
+
 def load_menus():
+    """(foods, drinks, desserts) を返す。ファイルが変わっていなければキャッシュから"""
+    # 呼び出し側が append/pop してもキャッシュが壊れないようリストはコピーして返す
+    return load_catalog().menus()
+
+def _prepare_json_file():
+    """menus.json のキャッシュキー。ファイルが無ければ空で作って None"""
     os.makedirs(DATA_DIR, exist_ok=True)
     if not os.path.exists(DATA_FILE):
         # 初期ファイルが無ければ空を作る
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump({"foods": [], "drinks": [], "desserts": []}, f, ensure_ascii=False, indent=2)
-        return [], [], []
+        with file_lock(DATA_FILE):
+            if not os.path.exists(DATA_FILE):
+                atomic_write_json(DATA_FILE, {"foods": [], "drinks": [], "desserts": []})
+        invalidate_menu_cache()
+        return None
+    return _file_key(DATA_FILE)
+
+def _read_json_menus():
+    """((foods, drinks, desserts), menus.json の版)"""
+    with span("storage_read"):
+        with open(DATA_FILE, "rb") as f:
+            data = f.read()
+        inc("file_read_bytes", len(data))
+        raw = json.loads(data)
+    with span("catalog_build"):
+        return _parse_menus(raw), raw.get("version", 0)
 
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        raw = json.load(f)
+def _item_kwargs(d: dict, keys: list[str]) -> dict:
+    """_pick に加えて、保存されている id を item_id として渡す"""
+    kw = _pick(d, keys)
+    if d.get("id"):
+        kw["item_id"] = d["id"]
+    return kw
 
-    # --- foods ---
-    foods = [Food(**_pick(d, ["name", "price", "calorie"])) for d in raw.get("foods", [])]
+def _parse_item(cat: str, d: dict):
+    if cat == "Food":
+        return Food(**_item_kwargs(d, ["name", "price", "calorie"]))
 
-    # --- drinks ---
-    drinks = []
-    for d in raw.get("drinks", []):
-        dd = dict(d)
+    dd = dict(d)
+    if cat == "Drink":
         # 足りない場合のフォールバック（任意）
         if "sugar_g" not in dd and "sugar" in dd:
             dd["sugar_g"] = dd["sugar"]
-        drinks.append(Drink(**_pick(dd, ["name", "price", "volume_ml", "sugar_g"])))
+        return Drink(**_item_kwargs(dd, ["name", "price", "volume_ml", "sugar_g"]))
 
-    # --- desserts ---
-    desserts = []
-    for d in raw.get("desserts", []):
-        dd = dict(d)
-        # sugar_g が無い場合、calorie を代用（あなたの意図に合わせた仕様）
-        if "sugar_g" not in dd and "calorie" in dd:
-            dd["sugar_g"] = dd["calorie"]
-        desserts.append(Dessert(**_pick(dd, ["name", "price", "sugar_g"])))
+    # sugar_g が無い場合、calorie を代用（あなたの意図に合わせた仕様）
+    # calorie を保存するようになる前のデータなので、その値はカロリーとしては使わない
+    if "sugar_g" not in dd and "calorie" in dd:
+        dd["sugar_g"] = dd.pop("calorie")
+    return Dessert(**_item_kwargs(dd, ["name", "price", "sugar_g", "calorie"]))
 
+def _parse_menus(raw: dict):
+    foods    = [_parse_item("Food", d) for d in raw.get("foods", [])]
+    drinks   = [_parse_item("Drink", d) for d in raw.get("drinks", [])]
+    desserts = [_parse_item("Dessert", d) for d in raw.get("desserts", [])]
     return foods, drinks, desserts
 
+def _item_dict(it) -> dict:
+    """menus.json / ジャーナルに書く形"""
+    if it.CATEGORY == "Food":
+        return {"id": it.id, "name": it.name, "price": it.price, "calorie": getattr(it, "calorie", 0)}
+    if it.CATEGORY == "Drink":
+        return {"id": it.id, "name": it.name, "price": it.price, "volume_ml": getattr(it, "volume_ml", 0), "sugar_g": getattr(it, "sugar_g", 0)}
+    return {"id": it.id, "name": it.name, "price": it.price, "sugar_g": getattr(it, "sugar_g", 0), "calorie": getattr(it, "calorie", 0)}
+
 def save_menus(foods, drinks, desserts):
-    """現在のメニューを menus.json に保存"""
+    """メニューを丸ごと menus.json（sqlite バックエンドなら DB）に保存して版を1つ進める
+
+    1品だけの追加・変更・削除は menu_repo を使うこと（こちらは全件を書き直す）
+    """
+    if config.STORAGE_BACKEND == "sqlite":
+        import sqlite_store
+        sqlite_store.save_menus(*_unique_ids((foods, drinks, desserts)))
+        invalidate_menu_cache()
+        return
     os.makedirs(DATA_DIR, exist_ok=True)
+    with file_lock(DATA_FILE):
+        revision = load_catalog().revision if os.path.exists(DATA_FILE) else 0
+        _write_snapshot((foods, drinks, desserts), revision + 1)
+
+def _unique_ids(menus):
+    """同じ ID が重なる商品（同じカテゴリの同名など）の2件目以降に -2, -3 ... を付けた (foods, drinks, desserts)
+
+    保存するときに通すので、付けた ID はそのまま残る（並び順や他の商品の削除で変わらない）。
+    キャッシュと共有している商品は書き換えず、付け直すものだけ作り直す。
+    """
+    ids = [[it.id for it in items] for items in menus]
+    taken = {item_id for row in ids for item_id in row}
+    seen = set()
+    out = []
+    for items, row in zip(menus, ids):
+        fixed = []
+        for it, item_id in zip(items, row):
+            if item_id in seen:
+                item_id = unique_item_id(item_id, taken)
+                taken.add(item_id)
+                it = type(it).from_dict({**it.to_dict(), "id": item_id})
+            seen.add(item_id)
+            fixed.append(it)
+        out.append(fixed)
+    return tuple(out)
+
+def _write_snapshot(menus, revision: int):
+    """menus.json を書き直してジャーナルを空にする（file_lock(DATA_FILE) の中で呼ぶこと）"""
+    foods, drinks, desserts = _unique_ids(menus)
     data = {
-        "foods": [
-            {"name": f.name, "price": f.price, "calorie": getattr(f, "calorie", 0)}
-            for f in foods
-        ],
-        "drinks": [
-            {"name": d.name, "price": d.price, "volume_ml": getattr(d, "volume_ml", 0), "sugar_g": getattr(d, "sugar_g", 0)}
-            for d in drinks
-        ],
-        "desserts": [
-            {"name": s.name, "price": s.price, "sugar_g": getattr(s, "sugar_g", 0)}
-            for s in desserts
-        ],
+        "version": revision,
+        "foods": [_item_dict(f) for f in foods],
+        "drinks": [_item_dict(d) for d in drinks],
+        "desserts": [_item_dict(s) for s in desserts],
     }
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+    with span("storage_write"):
+        atomic_write_json(DATA_FILE, data)
+    # menus.json を先に置き換えるので、ここで落ちても古いジャーナルは版で読み飛ばされる
+    try:
+        os.remove(JOURNAL_FILE)
+    except FileNotFoundError:
+        pass
+    invalidate_menu_cache()
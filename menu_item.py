@@ -1,23 +1,81 @@
+import hashlib
+
+# 価格やカロリーは同じ値が多いので、同じ値の int を1つにまとめて使い回す
+# （257 以上の int は値ごとに別オブジェクト = 1つ 28 バイト。10万件なら数 MB になる）
+_INTS = {}
+_INTS_MAX = 65536
+
+
+def _int(value) -> int:
+    value = int(value)
+    if len(_INTS) < _INTS_MAX:
+        return _INTS.setdefault(value, value)
+    return _INTS.get(value, value)
+
+
+_ID_PREFIX = {"Food": "F", "Drink": "D", "Dessert": "S"}
+
+
+def make_item_id(category: str, name: str) -> str:
+    """カテゴリと名前から決まる ID（新しい商品や、menus.json に id が無い古いデータ用）"""
+    return f"{_ID_PREFIX.get(category, 'M')}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}"
+
+
+def unique_item_id(item_id: str, taken) -> str:
+    """taken に無い ID。重なれば -2, -3 ... を付ける（保存するときに付け、以後は変えない）"""
+    if item_id not in taken:
+        return item_id
+    n = 2
+    while f"{item_id}-{n}" in taken:
+        n += 1
+    return f"{item_id}-{n}"
+
+
 class MenuItem:
-    def __init__(self, name, price):
+    # __slots__ で属性を固定し、1件あたりのメモリを減らす（10万件規模のメニュー向け）
+    # ID の文字列は make_item_id() と違うとき（改名した・同名の2件目）だけ _id に持つ
+    __slots__ = ("_id", "name", "price")
+    CATEGORY = "Item"
+
+    def __init__(self, name, price, item_id=None):
         self.name = name
-        self.price = int(price)
+        self.price = _int(price)
+        # id は一度保存されたら変わらない（名前や価格を変えても同じ商品として扱える）
+        self._id = item_id or None
+
+    @property
+    def id(self) -> str:
+        return self._id or make_item_id(self.CATEGORY, self.name)
+
+    @id.setter
+    def id(self, value):
+        self._id = value
+
+    def id_hash(self) -> int:
+        """hash(self.id)（Catalog の索引用）。持っている ID が名前から決まるものと同じなら手放す"""
+        derived = make_item_id(self.CATEGORY, self.name)
+        if self._id == derived:
+            self._id = None
+        return hash(self._id or derived)
 
     def info(self):
         return f"{self.name}: ¥{self.price}"
 
     def to_dict(self):
-        return {"name": self.name, "price": self.price}
+        return {"id": self.id, "name": self.name, "price": self.price}
 
     @classmethod
     def from_dict(cls, d: dict):
-        return cls(d["name"], d["price"])
+        return cls(d["name"], d["price"], item_id=d.get("id"))
 
 
 class Food(MenuItem):
-    def __init__(self, name, price, calorie):
-        super().__init__(name, price)
-        self.calorie = int(calorie)
+    __slots__ = ("calorie",)
+    CATEGORY = "Food"
+
+    def __init__(self, name, price, calorie, item_id=None):
+        super().__init__(name, price, item_id)
+        self.calorie = _int(calorie)
 
     def info(self):
         return f"{self.name}: ¥{self.price}（{self.calorie}kcal）"
@@ -29,13 +87,17 @@ class Food(MenuItem):
 
     @classmethod
     def from_dict(cls, d):
-        return cls(d["name"], d["price"], d.get("calorie", 0))
+        return cls(d["name"], d["price"], d.get("calorie", 0), item_id=d.get("id"))
 
 
 class Drink(MenuItem):
-    def __init__(self, name, price, volume_ml):
-        super().__init__(name, price)
-        self.volume_ml = int(volume_ml)
+    __slots__ = ("volume_ml", "sugar_g")
+    CATEGORY = "Drink"
+
+    def __init__(self, name, price, volume_ml, sugar_g=0, item_id=None):
+        super().__init__(name, price, item_id)
+        self.volume_ml = _int(volume_ml)
+        self.sugar_g = _int(sugar_g or 0)
 
     def info(self):
         return f"{self.name}: ¥{self.price}（{self.volume_ml}ml）"
@@ -43,17 +105,22 @@ class Drink(MenuItem):
     def to_dict(self):
         base = super().to_dict()
         base["volume_ml"] = self.volume_ml
+        base["sugar_g"] = self.sugar_g
         return base
 
     @classmethod
     def from_dict(cls, d):
-        return cls(d["name"], d["price"], d.get("volume_ml", 0))
+        return cls(d["name"], d["price"], d.get("volume_ml", 0), d.get("sugar_g", 0), item_id=d.get("id"))
 
 
 class Dessert(MenuItem):
-    def __init__(self, name, price, sugar_g):
-        super().__init__(name, price)
-        self.sugar_g = int(sugar_g)
+    __slots__ = ("sugar_g", "calorie")
+    CATEGORY = "Dessert"
+
+    def __init__(self, name, price, sugar_g, calorie=0, item_id=None):
+        super().__init__(name, price, item_id)
+        self.sugar_g = _int(sugar_g)
+        self.calorie = _int(calorie or 0)
 
     def info(self):
         return f"{self.name}: ¥{self.price}（糖質 {self.sugar_g}g）"
@@ -61,8 +128,9 @@ class Dessert(MenuItem):
     def to_dict(self):
         base = super().to_dict()
         base["sugar_g"] = self.sugar_g
+        base["calorie"] = self.calorie
         return base
 
     @classmethod
     def from_dict(cls, d):
-        return cls(d["name"], d["price"], d.get("sugar_g", 0))
\ No newline at end of file
+        return cls(d["name"], d["price"], d.get("sugar_g", 0), d.get("calorie", 0), item_id=d.get("id"))
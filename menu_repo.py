@@ -0,0 +1,154 @@
+# menu_repo.py
+# メニューを1品ずつ編集するリポジトリ（/admin, app.py, app_gui.py の追加・変更・削除）
+#
+#   repo = get_menu_repository()
+#   v = repo.version()                               # 今の版番号
+#   repo.add(Food("カレー", 800, 650))                # 追加（ID は item.id に入る）
+#   repo.update("F-1a2b3c4d", price=850, expected_version=v)
+#   repo.delete("F-1a2b3c4d")
+#   repo.changes_since(v)                            # v より後の変更（キャッシュの差分更新用）
+#
+# - 編集のたびに版番号が1つ進む。expected_version を渡すと、版が違えば VersionConflict
+#   （画面を開いてから保存するまでの間に他の人が編集していた）
+# - json バックエンド: menus.json は書き直さず、data/menus.journal.jsonl に1行追記する。
+#   ジャーナルが COMPACT_BYTES を超えたら menus.json にまとめて空にする
+# - sqlite バックエンド: menu_items の1行だけを更新し、menu_changes に変更を残す
+import os, json
+
+import config
+from catalog import CATEGORIES
+from menu_item import unique_item_id
+from menu_io import load_catalog, read_journal, note_local_edit, _item_dict, _write_snapshot, DATA_FILE, JOURNAL_FILE
+from storage import file_lock
+from metrics import span, inc
+
+
+class VersionConflict(Exception):
+    """expected_version と今の版が違う"""
+
+    def __init__(self, expected: int, actual: int):
+        super().__init__(f"メニューが他で更新されています（想定 v{expected} / 現在 v{actual}）")
+        self.expected = expected
+        self.actual = actual
+
+
+def _check_version(expected, actual):
+    if expected is not None and int(expected) != actual:
+        raise VersionConflict(int(expected), actual)
+
+
+class MenuRepository:
+    """メニュー編集の共通インターフェース。_commit() をバックエンドごとに実装する"""
+
+    def version(self) -> int:
+        return load_catalog().revision
+
+    def catalog(self):
+        return load_catalog()
+
+    def add(self, item, expected_version=None) -> int:
+        """商品を末尾に追加して新しい版を返す。ID が既存と重なれば連番を付ける"""
+        if item.CATEGORY not in CATEGORIES:
+            raise ValueError(f"未対応のカテゴリ: {item.CATEGORY}")
+
+        def build(catalog):
+            # 同じカテゴリに同名の商品があると ID が重なるので連番を付けて区別する
+            item.id = unique_item_id(item.id, catalog)
+            return {"op": "add", "cat": item.CATEGORY, "id": item.id, "item": item}
+        with span("storage_write"):
+            return self._commit(build, expected_version)
+
+    def update(self, item_id: str, expected_version=None, **fields) -> int:
+        """name / price / calorie / volume_ml / sugar_g を変更する。無い ID なら KeyError"""
+        def build(catalog):
+            old = catalog.get(item_id)
+            if old is None:
+                raise KeyError(item_id)
+            new = type(old).from_dict({**old.to_dict(), **fields, "id": old.id})
+            return {"op": "update", "cat": old.CATEGORY, "id": old.id, "item": new}
+        with span("storage_write"):
+            return self._commit(build, expected_version)
+
+    def delete(self, item_id: str, expected_version=None) -> int:
+        """無い ID なら KeyError"""
+        def build(catalog):
+            old = catalog.get(item_id)
+            if old is None:
+                raise KeyError(item_id)
+            return {"op": "delete", "cat": old.CATEGORY, "id": old.id}
+        with span("storage_write"):
+            return self._commit(build, expected_version)
+
+    def changes_since(self, version: int) -> list | None:
+        """version より後の変更を古い順に。履歴が残っていなければ None（丸ごと読み直すこと）"""
+        raise NotImplementedError
+
+    def _commit(self, build, expected_version) -> int:
+        """排他の中で今の Catalog を build() に渡し、返ってきた変更を次の版として保存する"""
+        raise NotImplementedError
+
+
+class JsonMenuRepository(MenuRepository):
+    COMPACT_BYTES = 256 * 1024
+
+    def _commit(self, build, expected_version):
+        with file_lock(DATA_FILE):
+            catalog = load_catalog()
+            _check_version(expected_version, catalog.revision)
+            change = build(catalog)
+            change["v"] = catalog.revision + 1
+            self._append(change)
+            note_local_edit()
+            if os.path.getsize(JOURNAL_FILE) > self.COMPACT_BYTES:
+                self.compact()
+        return change["v"]
+
+    def _append(self, change):
+        rec = {k: v for k, v in change.items() if k != "item"}
+        if "item" in change:
+            rec["item"] = _item_dict(change["item"])
+        line = (json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        os.makedirs(os.path.dirname(JOURNAL_FILE) or ".", exist_ok=True)
+        with open(JOURNAL_FILE, "a+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                # 前回が書きかけで落ちていたら、その行を切り捨ててから足す
+                f.seek(max(0, size - 65536))
+                tail = f.read()
+                if not tail.endswith(b"\n"):
+                    f.truncate(size - len(tail) + tail.rfind(b"\n") + 1)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        inc("file_written_bytes", len(line))
+
+    def compact(self) -> int:
+        """ジャーナルを menus.json にまとめる。まとめた版を返す"""
+        with file_lock(DATA_FILE):
+            catalog = load_catalog()
+            _write_snapshot(catalog.menus(), catalog.revision)
+            return catalog.revision
+
+    def changes_since(self, version):
+        current = load_catalog().revision
+        if version >= current:
+            return []
+        changes, _ = read_journal(0, after=version)
+        if not changes or changes[0]["v"] != version + 1:
+            return None   # その版より前にまとめられている
+        return changes
+
+
+_repo = None
+
+
+def get_menu_repository() -> MenuRepository:
+    """設定に応じたメニューリポジトリ（プロセス内で1つ）"""
+    global _repo
+    if _repo is None:
+        if config.STORAGE_BACKEND == "sqlite":
+            import sqlite_store
+            _repo = sqlite_store.SqliteMenuRepository()
+        else:
+            _repo = JsonMenuRepository()
+    return _repo
@@ -0,0 +1,101 @@
+# menu_search.py
+# GUI のメニュー検索（表示文字列の部分一致）を作っておいた索引で引く
+#
+#   index = get_search_index(catalog)       # Catalog ごとに1回だけ作る（同じ Catalog なら使い回す）
+#   items = index.search("Drink", "ｺｰﾗ")     # カテゴリ内で部分一致する商品（並び順はメニューのまま）
+#   index.label(item)                       # 一覧に出す文字列（item.info() を作っておいたもの）
+#
+# - 全角 / 半角・大文字 / 小文字は NFKC + lower でそろえ、カタカナはひらがなに寄せて比べる
+#   （"ｺｰﾗ" "コーラ" "こーら" が同じ。漢字はそのまま文字で比べる）
+# - 索引はカテゴリごとに、正規化した info()（名前で始まる）を改行でつないだ1本の文字列と各行の開始位置。
+#   検索は str.find で当たった位置から行（= 商品）を二分探索で引くので、当たらない商品には Python の処理が走らない
+# - 直前の検索語を含む検索語（打ち足したとき）は、直前の結果が少なければその中だけを探す
+import bisect
+import threading
+import unicodedata
+from itertools import accumulate
+
+# カタカナ（ァ..ヶ）→ ひらがな（ぁ..ゖ）
+_KATA_TO_HIRA = {c: c - 0x60 for c in range(ord("ァ"), ord("ヶ") + 1)}
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).lower().translate(_KATA_TO_HIRA)
+
+
+class _CategoryText:
+    __slots__ = ("text", "keys", "starts")
+
+    def __init__(self, labels):
+        # 1件ずつ正規化するより、つないでからまとめて正規化するほうが速い（改行は NFKC で変わらない）
+        self.text = normalize("\n".join(labels))
+        self.keys = self.text.split("\n")
+        if len(self.keys) != len(labels):
+            # 正規化で改行が増減した（まず無い）ときは1件ずつ
+            self.keys = [normalize(label) for label in labels]
+            self.text = "\n".join(self.keys)
+        self.starts = [0, *accumulate(len(k) + 1 for k in self.keys)][:-1]
+
+    def scan(self, q: str) -> list:
+        """q を含む行の番号（q は改行を含まないので行をまたいで当たることはない）"""
+        text, starts, keys = self.text, self.starts, self.keys
+        # 当たりが多い検索語（1文字など）は1件ずつ二分探索するより残りを順に見るほうが速い
+        dense = max(len(keys) // 16, 64)
+        out = []
+        i = text.find(q)
+        while i != -1:
+            pos = bisect.bisect_right(starts, i) - 1
+            out.append(pos)
+            if len(out) > dense:
+                out.extend(p for p in range(pos + 1, len(keys)) if q in keys[p])
+                break
+            if pos + 1 >= len(starts):
+                break
+            i = text.find(q, starts[pos + 1])
+        return out
+
+
+class SearchIndex:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._labels = {}   # 商品 -> info() の文字列（ID を求めると sha1 を計算するので商品そのもので引く）
+        self._text = {}     # カテゴリ -> _CategoryText（商品の並びと同じ行順）
+        self._last = None   # (カテゴリ, 正規化した検索語, 行番号のリスト)
+        for cat, items in catalog.by_category.items():
+            labels = [it.info().replace("\n", " ") for it in items]
+            self._labels.update(zip(items, labels))
+            self._text[cat] = _CategoryText(labels)
+
+    def label(self, item) -> str:
+        return self._labels.get(item) or item.info()
+
+    def search(self, category: str, query: str) -> list:
+        """category の商品のうち、表示文字列に query を含むもの"""
+        items = self.catalog.category(category)
+        q = normalize(query.strip())
+        if not q:
+            return items
+        ct = self._text.get(category)
+        if ct is None:
+            return []
+        last = self._last
+        if last is not None and last[0] == category and last[1] in q and len(last[2]) * 8 < len(items):
+            # 打ち足した検索語の結果は直前の結果に含まれる。直前が少なければその中だけ確かめる
+            positions = [p for p in last[2] if q in ct.keys[p]]
+        else:
+            positions = ct.scan(q)
+        self._last = (category, q, positions)
+        return [items[p] for p in positions]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_search_index(catalog) -> SearchIndex:
+    """catalog の索引。Catalog が入れ替わったときだけ作り直す"""
+    global _index
+    with _lock:
+        if _index is None or _index.catalog is not catalog:
+            _index = SearchIndex(catalog)
+        return _index
@@ -0,0 +1,117 @@
+# menu_watch.py
+# メニューの変更をプロセスに知らせる（Web のワーカー / GUI 用）
+#
+#   watcher = get_menu_watcher()       # 初回でバックグラウンドの監視を始める
+#   watcher.current()                  # 最新の Catalog（リクエストごとに stat しない）
+#   watcher.subscribe(fn)              # 変わったら fn(catalog) を監視スレッドから呼ぶ
+#   watcher.refresh()                  # 今すぐ確かめる
+#
+# このプロセス自身の編集（menu_repo / save_menus）は周期を待たず、次の current() で反映する。
+# menu_io.menu_version()（menus.json / ジャーナルの stat、sqlite なら meta の版）を
+# config.MENU_POLL_SECONDS ごとに見る。変わったら MENU_DEBOUNCE_SECONDS の間
+# 版が落ち着くのを待ってから load_catalog() する（連続した編集を1回の入れ替えにまとめる）。
+# load_catalog() は増えた差分だけを当てるので、全ワーカーが同時に気づいても全件の読み直しにはならない。
+# 間隔には ±20% の揺らぎを入れ、ワーカーどうしが同じ瞬間に読みに行かないようにする。
+import os, sys, time, random, threading
+
+import config
+from menu_io import load_catalog, menu_version, local_edit_count
+
+
+class MenuWatcher:
+    def __init__(self, interval: float | None = None, debounce: float | None = None):
+        self.interval = interval if interval is not None else config.MENU_POLL_SECONDS
+        self.debounce = debounce if debounce is not None else config.MENU_DEBOUNCE_SECONDS
+        self._local_edits = local_edit_count()
+        self._catalog = load_catalog()
+        self._subscribers = []
+        self._lock = threading.RLock()     # refresh() の同時実行を防ぐ（通知先からの subscribe も可）
+        self._wake = threading.Event()
+        self._stopped = False
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="menu-watcher", daemon=True)
+        self._thread.start()
+
+    def current(self):
+        """最新の Catalog。入れ替えは参照の付け替え1回なので、読み手は途中の状態を見ない"""
+        if local_edit_count() != self._local_edits:
+            return self.refresh()
+        return self._catalog
+
+    def version(self) -> str:
+        return self._catalog.version
+
+    def subscribe(self, fn):
+        """変更時に fn(catalog) を呼ぶ（監視スレッドから）。解除用の関数を返す"""
+        with self._lock:
+            self._subscribers.append(fn)
+
+        def unsubscribe():
+            with self._lock:
+                if fn in self._subscribers:
+                    self._subscribers.remove(fn)
+        return unsubscribe
+
+    def refresh(self):
+        """版を今すぐ確かめ、変わっていれば入れ替える。最新の Catalog を返す"""
+        with self._lock:
+            self._local_edits = local_edit_count()
+            if menu_version() != self._catalog.version:
+                self._publish(load_catalog())
+        return self._catalog
+
+    def _publish(self, catalog):
+        # self._lock の中で呼ぶこと
+        if catalog is self._catalog:
+            return
+        self._catalog = catalog
+        for fn in list(self._subscribers):
+            try:
+                fn(catalog)
+            except Exception as e:
+                print(f"[menu_watch] 通知先でエラー: {e!r}", file=sys.stderr)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval * random.uniform(0.8, 1.2))
+            self._wake.clear()
+            if self._stopped:
+                return
+            try:
+                seen = menu_version()
+                if seen == self._catalog.version:
+                    continue
+                # 編集が続いている間は待つ
+                while True:
+                    time.sleep(self.debounce)
+                    now = menu_version()
+                    if now == seen:
+                        break
+                    seen = now
+                self.refresh()
+            except Exception as e:
+                # 保存の途中などで読めなかったときは次の周期でやり直す
+                print(f"[menu_watch] メニューを読めませんでした: {e!r}", file=sys.stderr)
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def get_menu_watcher() -> MenuWatcher:
+    """プロセス内で1つの MenuWatcher（fork 後は作り直す）"""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None or _watcher._pid != os.getpid():
+            _watcher = MenuWatcher()
+        return _watcher
+
+
+def current_catalog():
+    """get_menu_watcher().current() の省略形"""
+    return get_menu_watcher().current()
@@ -0,0 +1,257 @@
+# metrics.py
+# 計測（Web の /metrics に Prometheus のテキスト形式で出す）
+#
+#   with span("storage_read"):            # 処理段階ごとの時間。今のリクエストのルート名ごとに集計
+#       ...
+#   inc("file_read_bytes", len(data))     # カウンタ（ラベルはキーワード引数: inc("x", 1, result="hit")）
+#   begin_request("/cart") / end_request(token, "GET", 200)   # ルートごとの応答時間（app_web / app_asgi が呼ぶ）
+#   render()                              # /metrics の本文
+#   time_templates(app.jinja_env)         # テンプレートの描画を phase="render" で計る
+#
+#   p = Profiler(); p.start(); ...; p.stop()   # サンプリングプロファイラ
+#   p.write("profile.folded")                  # flamegraph.pl / speedscope に渡せる collapsed 形式
+#
+# 段階（phase）の名前: storage_read / storage_write / catalog_build / render / lock_wait。
+# 値はプロセスごと（gunicorn / uvicorn の複数ワーカーでは、ワーカーごとの値をそれぞれ返す）。
+# MENU_APP_PROFILE=パス を付けて起動すると、プロセスが終わるまでプロファイルを取り続けてそこに書く
+# （複数ワーカーならパスに {pid} を入れる: MENU_APP_PROFILE=data/profile-{pid}.folded）。
+import os, re, sys, time, atexit, threading, contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+import config
+
+PREFIX = "menu_app_"
+# 応答時間のバケツ（秒）
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "request_seconds": ("histogram", "ルートごとの応答時間"),
+    "phase_seconds": ("histogram", "処理段階ごとの時間（route はリクエストの外なら \"-\"）"),
+    "file_read_bytes": ("counter", "data/ から読んだバイト数"),
+    "file_written_bytes": ("counter", "data/ に書いたバイト数"),
+    "menu_page_cache": ("counter", "描画済みメニューページのヒット/ミス"),
+}
+
+# 今のリクエストのルート名（スレッド / asyncio のタスクごと）
+_route = contextvars.ContextVar("metrics_route", default="-")
+
+_lock = threading.Lock()
+_counters = Counter()     # (name, labels) -> 値
+_histograms = {}          # (name, labels) -> [バケツごとの件数..., 合計, 件数]
+
+
+def _labels(kw: dict) -> tuple:
+    return tuple(sorted(kw.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] += value
+
+
+def observe(name: str, seconds: float, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+                break
+        h[-2] += seconds
+        h[-1] += 1
+
+
+@contextmanager
+def span(phase: str):
+    """with の中の時間を phase_seconds{route, phase} に足す"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("phase_seconds", time.perf_counter() - t0, route=_route.get(), phase=phase)
+
+
+def begin_request(route: str):
+    """リクエストの始まり。end_request() に渡す値を返す"""
+    return _route.set(route), time.perf_counter()
+
+
+def end_request(token, method: str, status: int):
+    ctx_token, t0 = token
+    observe("request_seconds", time.perf_counter() - t0,
+            route=_route.get(), method=method, status=str(status))
+    try:
+        _route.reset(ctx_token)
+    except ValueError:
+        pass   # 別のコンテキストで終わった（ストリーミングの応答など）
+
+
+def time_templates(jinja_env):
+    """テンプレートの描画を phase="render" として計る（Flask / Quart の app.jinja_env に使う）"""
+    import jinja2
+
+    class TimedTemplate(jinja2.Template):
+        def render(self, *args, **kwargs):
+            with span("render"):
+                return super().render(*args, **kwargs)
+
+        async def render_async(self, *args, **kwargs):
+            with span("render"):
+                return await super().render_async(*args, **kwargs)
+
+    jinja_env.template_class = TimedTemplate
+
+
+def _builtin():
+    """各モジュールが自前で数えている統計: (名前, 種類, 説明, ラベル, 値)"""
+    from storage import lock_stats
+    from menu_io import cache_stats
+    out = []
+    locks = lock_stats()
+    out.append(("lock_acquired_total", "counter", "file_lock の取得回数", (), locks["acquired"]))
+    out.append(("lock_contended_total", "counter", "file_lock で待たされた回数", (), locks["contended"]))
+    out.append(("lock_wait_seconds_total", "counter", "file_lock で待った時間の合計", (), locks["wait_seconds"]))
+    for result, n in cache_stats().items():
+        out.append(("menu_cache_total", "counter", "load_catalog() のキャッシュ（hits / misses / deltas）",
+                    (("result", result),), n))
+    # 作られていないものは作らない（/metrics を見ただけで書き込みスレッド等が起動しないように）
+    writer = sys.modules.get("order_writer")
+    if writer is not None and writer._writer is not None:
+        s = writer._writer.stats()
+        out.append(("order_writer_orders_total", "counter", "書き込んだ注文数", (), s["orders"]))
+        out.append(("order_writer_batches_total", "counter", "書き込み回数（グループコミット）", (), s["batches"]))
+        out.append(("order_writer_errors_total", "counter", "書き込みの失敗回数", (), s["errors"]))
+        out.append(("order_writer_queued", "gauge", "書き込み待ちの注文数", (), s["queued"]))
+    kitchen = sys.modules.get("kitchen")
+    if kitchen is not None and kitchen._broker is not None:
+        s = kitchen._broker.stats()
+        out.append(("kitchen_subscribers", "gauge", "接続中のキッチン表示", (), s["subscribers"]))
+        out.append(("kitchen_dropped_total", "counter", "追いつけずに切った表示の数", (), s["dropped"]))
+    return out
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def render() -> str:
+    """Prometheus のテキスト形式（text/plain; version=0.0.4）"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+    lines = []
+    typed = set()
+
+    def header(name, kind, help_text):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name + "_total", "counter", HELP.get(name, ("counter", name))[1])
+        lines.append(f"{PREFIX}{name}_total{_fmt_labels(labels)} {value}")
+    for (name, labels), h in sorted(histograms.items()):
+        header(name, "histogram", HELP.get(name, ("histogram", name))[1])
+        cumulative = 0
+        for bound, n in zip(BUCKETS, h):
+            cumulative += n
+            lines.append(f"{PREFIX}{name}_bucket{_fmt_labels(labels + (('le', repr(bound)),))} {cumulative}")
+        lines.append(f"{PREFIX}{name}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {h[-1]}")
+        lines.append(f"{PREFIX}{name}_sum{_fmt_labels(labels)} {h[-2]}")
+        lines.append(f"{PREFIX}{name}_count{_fmt_labels(labels)} {h[-1]}")
+    for name, kind, help_text, labels, value in _builtin():
+        header(name, kind, help_text)
+        lines.append(f"{PREFIX}{name}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """全スレッドのスタックを一定間隔で数える（sys._current_frames を使うので追加の依存は無い）
+
+    待っているだけのスレッド（ロック / キュー / select / accept で止まっている）は数えない。
+    結果は「スレッド名;関数;関数... 回数」の collapsed 形式。
+    """
+    IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "socket.py", "socketserver.py")
+
+    def __init__(self, interval: float | None = None, exclude=()):
+        self.interval = interval or config.PROFILE_INTERVAL
+        self.exclude = set(exclude)   # 数えないスレッド（取り終わるのを待っている呼び出し元など）
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        skip = self.exclude | {threading.get_ident()}
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in skip or os.path.basename(frame.f_code.co_filename) in self.IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}")
+                    frame = frame.f_back
+                # 連番は落としてスレッドの種類ごとにまとめる（Thread-12 → Thread, web-io_3 → web-io）
+                stack.append(re.sub(r"[-_ ]?\d+.*$", "", names.get(ident, "thread")) or "thread")
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded())
+
+
+def profile_for(seconds: float, path: str | None = None) -> str:
+    """seconds 秒だけ取って collapsed 形式を返す（path があればそこにも書く）"""
+    p = Profiler(exclude={threading.get_ident()}).start()
+    time.sleep(seconds)
+    p.stop()
+    if path:
+        p.write(path)
+    return p.folded()
+
+
+_profiler = None
+
+
+def _start_env_profiler():
+    # MENU_APP_PROFILE=パス: プロセスの間ずっと取り、終了時に書く
+    global _profiler
+    if config.PROFILE_PATH and _profiler is None:
+        path = config.PROFILE_PATH.format(pid=os.getpid())
+        _profiler = Profiler().start()
+        atexit.register(lambda: _profiler.stop().write(path))
+
+
+_start_env_profiler()
@@ -0,0 +1,79 @@
+# order_ids.py
+# 注文番号の発行（app.py / app_gui.py / app_web.py で共通）
+#
+#   new_order_id()            # "01JB9Z3K4T7Q2M8XW5RCE0N6HF" のような 26 文字（ULID 形式）
+#   order_id_time(order_id)   # 発行時刻（datetime, UTC）
+#
+# 128bit = 時刻(ミリ秒, 48bit) + ワーカー(40bit) + 連番(40bit) を Crockford Base32 で表す。
+# - 文字列の大小 = 発行時刻の順（同じプロセス内では必ず単調増加）
+# - ワーカーはプロセスごとに決める（PID の下位16bit + 乱数24bit）。fork した子は選び直す
+# - プロセス間で共有するロックやファイルは使わない
+import os, time, base64, secrets, threading
+from datetime import datetime, timezone
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"   # Crockford Base32（I, L, O, U を除く）
+_SEQ_BITS = 40
+_WORKER_BITS = 40
+
+_lock = threading.Lock()
+_worker = 0
+_last_ms = 0
+_seq = 0
+
+
+def _new_worker():
+    global _worker, _last_ms, _seq, _lock
+    _worker = ((os.getpid() & 0xFFFF) << 24) | secrets.randbits(24)
+    _last_ms = 0
+    _seq = 0
+    _lock = threading.Lock()
+
+
+_new_worker()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_new_worker)
+
+
+# base64.b32encode（C 実装）の結果を Crockford の文字に置き換える。
+# 160bit（20バイト = 32文字）で符号化すると上位 30bit は 0 なので、下の 26 文字が 128bit 分になる
+_TO_CROCKFORD = bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", _ALPHABET.encode())
+
+
+def _encode(n: int) -> str:
+    return base64.b32encode(n.to_bytes(20, "big")).translate(_TO_CROCKFORD)[-26:].decode()
+
+
+def new_order_id_int() -> int:
+    """new_order_id() の数値版"""
+    global _last_ms, _seq
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            _seq = 0
+        else:
+            # 同じミリ秒（または時計が戻った）なら時刻を据え置いて連番を進める
+            _seq += 1
+            if _seq >> _SEQ_BITS:
+                _last_ms += 1
+                _seq = 0
+        return (_last_ms << (_WORKER_BITS + _SEQ_BITS)) | (_worker << _SEQ_BITS) | _seq
+
+
+def new_order_id() -> str:
+    """時刻順に並ぶ重複しない注文番号"""
+    return _encode(new_order_id_int())
+
+
+def order_id_time(order_id: str) -> datetime | None:
+    """new_order_id() の発行時刻。形式が違えば None（旧形式の "YYYYmmdd-HHMMSS" など）"""
+    if len(order_id) != 26:
+        return None
+    n = 0
+    for c in order_id.upper():
+        i = _ALPHABET.find(c)
+        if i < 0:
+            return None
+        n = (n << 5) | i
+    ms = n >> (_WORKER_BITS + _SEQ_BITS)
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
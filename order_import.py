@@ -0,0 +1,291 @@
+# order_import.py
+# キオスク / デリバリー事業者から届く注文ファイル（CSV / JSONL）を注文ストアに一括で取り込む
+#
+#   python app.py import-orders kiosk-0601.csv
+#   python app.py import-orders partner.jsonl --workers 8 --rejected rejected.jsonl
+#   python app.py import-orders partner.jsonl --dry-run        # 検証だけ（保存しない）
+#
+# 入力の形
+#   JSONL : 1行 = 1注文  {"ref": "K-1001", "ts": "2025-06-01T12:03:00", "items": [{"id": "F-1a2b3c4d", "qty": 2}, {"name": "コーラ", "qty": 1}]}
+#   CSV   : 1行 = 1明細。見出し行に order（または ref）, item, qty, ts（任意）
+#           order が同じ行が続いている間を1注文にまとめる。item は商品 ID か商品名
+#
+# - 商品は取り込み開始時のメニューの ID / 名前の索引で引き、価格もそのメニューで付け直す（入力の価格は使わない）
+# - ファイルを行のまとまり（チャンク）に分けて複数プロセスで検証・価格付け・JSON 化し、
+#   親プロセスがチャンクの順に注文ストアへまとめて追記する（append_encoded）
+# - 取り込めなかった行は理由と元の行を rejected ファイル（JSONL）に書く
+# - 注文ストアが json（orders.json）だとチャンクごとにファイル全体を書き直すので、大きなファイルは log / sqlite で取り込むこと
+import io, os, csv, json, time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from menu_io import load_catalog
+from order_ids import new_order_id
+from order_store import get_order_store
+
+CHUNK_LINES = 20000
+MAX_QTY = 1000
+
+# ワーカーごとに1回だけ受け取るメニューの索引
+_index = None
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_index(catalog) -> dict:
+    """{"by_id": {ID: (価格, 明細 JSON の前半, 後半)}, "by_name": {名前: ID}, "version": 版}
+
+    明細は Web の注文と同じ {"id","name","price","qty","cat"} の形。qty 以外は商品ごとに決まるので
+    JSON の文字列にしておき、1件ごとには数量だけを埋める（プロセス間でもそのまま渡せる）
+    """
+    by_id = {}
+    by_name = {}
+    for it in catalog:
+        head = _dumps({"id": it.id, "name": it.name, "price": it.price})[:-1] + ',"qty":'
+        by_id[it.id] = (it.price, head, ',"cat":' + _dumps(it.CATEGORY) + "}")
+        by_name.setdefault(it.name, it.id)   # 同名があれば最初の1件（Catalog.find と同じ）
+    return {"by_id": by_id, "by_name": by_name, "version": _dumps(catalog.version)}
+
+
+def _init_worker(index):
+    global _index
+    _index = index
+
+
+class Rejected(ValueError):
+    pass
+
+
+def _line_item(item_ref, qty):
+    if isinstance(item_ref, int) and not isinstance(item_ref, bool):
+        item_ref = str(item_ref)   # 数字だけの商品名
+    if not isinstance(item_ref, str):
+        raise Rejected(f"商品の指定が文字列ではありません: {item_ref!r}")
+    base = _index["by_id"].get(item_ref)
+    if base is None:
+        item_id = _index["by_name"].get(item_ref)
+        if item_id is None:
+            raise Rejected(f"商品が見つかりません: {item_ref}")
+        base = _index["by_id"][item_id]
+    try:
+        qty = int(qty)
+    except (TypeError, ValueError, OverflowError):
+        raise Rejected(f"数量が数値ではありません: {qty}") from None
+    if not 0 < qty <= MAX_QTY:
+        raise Rejected(f"数量が範囲外です: {qty}")
+    price, head, tail = base
+    return price * qty, f"{head}{qty}{tail}"
+
+
+def _check_ts(ts, default):
+    if ts in (None, ""):
+        return default
+    try:
+        datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        raise Rejected(f"日時が読めません: {ts}") from None
+    return ts
+
+
+def _encode_order(ref, ts, items, source, now):
+    """items は _line_item() の (小計, 明細 JSON) のリスト。Web の注文と同じ形の1行を返す"""
+    ts = _dumps(_check_ts(ts, now))
+    ref = "" if ref in (None, "") else ',"ref":' + _dumps(str(ref))
+    return (f'{{"id":"{new_order_id()}","items":[{",".join(j for _, j in items)}],'
+            f'"total":{sum(p for p, _ in items)},"ts":{ts},"menu_version":{_index["version"]},'
+            f'"source":{source}{ref}}}\n').encode("utf-8")
+
+
+def _jsonl_chunk(first_line, lines, source, now):
+    out, rejected = [], []
+    for n, raw in enumerate(lines, first_line):
+        if not raw.strip():
+            continue
+        try:
+            try:
+                d = json.loads(raw)
+            except ValueError:
+                raise Rejected("JSON として読めません") from None
+            if not isinstance(d, dict) or not isinstance(d.get("items"), list) or not d["items"]:
+                raise Rejected("items がありません")
+            items = []
+            for it in d["items"]:
+                if not isinstance(it, dict):
+                    raise Rejected("items の要素がオブジェクトではありません")
+                items.append(_line_item(it.get("id") or it.get("name"), it.get("qty", 1)))
+            out.append(_encode_order(d.get("ref"), d.get("ts") or d.get("timestamp"), items, source, now))
+        except Rejected as e:
+            rejected.append({"line": n, "reason": str(e), "raw": raw.decode("utf-8", "replace").rstrip("\n")})
+    return out, rejected
+
+
+def _csv_chunk(first_line, data, header, source, now):
+    out, rejected = [], []
+    cols = {name: i for i, name in enumerate(header)}
+    key_col = cols.get("order", cols.get("ref"))
+    group, group_key, group_lines = [], None, []
+
+    def close_group():
+        if not group_lines:
+            return
+        try:
+            bad = [r for r in group if isinstance(r, Rejected)]
+            if bad:
+                raise bad[0]
+            out.append(_encode_order(group_key, group[0][1], [it for it, _ in group], source, now))
+        except Rejected as e:
+            # 1明細でもおかしければ注文ごと取り込まない（一部だけの注文を作らない）
+            for n, raw in group_lines:
+                rejected.append({"line": n, "reason": str(e), "raw": raw})
+
+    # 引用符の中の改行（複数行のフィールド）も1行として読めるよう、チャンク全体を csv.reader に通す
+    physical = list(io.StringIO(data.decode("utf-8", "replace"), newline=""))
+    reader = csv.reader(physical)
+    start = 0
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            row = e     # 読めないレコードはその注文ごと取り込まない
+        n, text = first_line + start, "".join(physical[start:reader.line_num]).rstrip("\r\n")
+        start = reader.line_num
+        if isinstance(row, csv.Error):
+            close_group()
+            group, group_key, group_lines = [], None, []
+            rejected.append({"line": n, "reason": f"CSV として読めません: {row}", "raw": text})
+            continue
+        if not any(field.strip() for field in row):
+            continue
+        key = row[key_col] if len(row) > key_col else ""
+        if key != group_key or not key:
+            close_group()
+            group, group_key, group_lines = [], key, []
+        group_lines.append((n, text))
+        try:
+            if len(row) < len(header):
+                raise Rejected("列が足りません")
+            ts = row[cols["ts"]] if "ts" in cols else None
+            group.append((_line_item(row[cols["item"]], row[cols["qty"]]), ts))
+        except Rejected as e:
+            group.append(e)
+    close_group()
+    return out, rejected
+
+
+def process_chunk(fmt, header, first_line, data, source, now):
+    """チャンク1つ（行の bytes）を検証して (encode 済みの注文のリスト, rejected のリスト) を返す"""
+    if fmt == "csv":
+        return _csv_chunk(first_line, data, header, source, now)
+    return _jsonl_chunk(first_line, data.splitlines(keepends=True), source, now)
+
+
+def _csv_key(record: bytes, key_col: int):
+    row = next(csv.reader(io.StringIO(record.decode("utf-8", "replace"), newline="")), [])
+    return row[key_col] if len(row) > key_col else None
+
+
+def _csv_records(f):
+    """(行数, 1レコードの bytes)。引用符が閉じるまでの行（フィールド内の改行）を1レコードにまとめる"""
+    record, lines, quoted = [], 0, False
+    for line in f:
+        record.append(line)
+        lines += 1
+        # "" は引用符の中の " なので、数の偶奇だけで引用符の中かどうかが分かる
+        quoted ^= line.count(b'"') % 2 == 1
+        if not quoted:
+            yield lines, b"".join(record)
+            record, lines = [], 0
+    if record:
+        yield lines, b"".join(record)
+
+
+def iter_chunks(f, fmt, header, chunk_lines=CHUNK_LINES):
+    """(先頭の行番号, 行の bytes) を返す。CSV はレコードの途中や同じ注文の行の間では切らない"""
+    key_col = None
+    if fmt == "csv":
+        key_col = header.index("order") if "order" in header else header.index("ref")
+        records = _csv_records(f)
+    else:
+        records = ((1, line) for line in f)
+    line_no = 2 if fmt == "csv" else 1
+    buf, first, size = [], line_no, 0
+    last_key = None
+    for lines, record in records:
+        if size >= chunk_lines:
+            key = _csv_key(record, key_col) if key_col is not None else None
+            if key_col is None or key != last_key:
+                yield first, b"".join(buf)
+                buf, first, size = [], line_no, 0
+        buf.append(record)
+        size += lines
+        if key_col is not None and size >= chunk_lines:
+            last_key = _csv_key(record, key_col)
+        line_no += lines
+    if buf:
+        yield first, b"".join(buf)
+
+
+def detect_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def import_orders(path: str, fmt: str | None = None, workers: int | None = None,
+                  rejected_path: str | None = None, source: str | None = None,
+                  chunk_lines: int = CHUNK_LINES, dry_run: bool = False, store=None) -> dict:
+    """path の注文を取り込んで {"imported", "rejected", "seconds", "rejected_path"} を返す"""
+    fmt = fmt or detect_format(path)
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"未対応の形式: {fmt}")
+    workers = workers or os.cpu_count() or 1
+    rejected_path = rejected_path or path + ".rejected.jsonl"
+    source = _dumps(source or os.path.basename(path))
+    now = datetime.now().isoformat(timespec="seconds")
+    index = build_index(load_catalog())
+    store = store or (None if dry_run else get_order_store())
+
+    t0 = time.perf_counter()
+    imported = rejected = 0
+    with open(path, "rb") as f, open(rejected_path, "w", encoding="utf-8") as rej:
+        header = None
+        if fmt == "csv":
+            header = [h.strip().lower() for h in next(csv.reader([f.readline().decode("utf-8-sig")]), [])]
+            missing = {"item", "qty"} - set(header)
+            if missing or not {"order", "ref"} & set(header):
+                raise ValueError(f"CSV の見出しに order / item / qty が必要です（{header}）")
+
+        def commit(result):
+            nonlocal imported, rejected
+            lines, bad = result
+            if lines and not dry_run:
+                store.append_encoded(lines)
+            imported += len(lines)
+            rejected += len(bad)
+            for r in bad:
+                rej.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+        chunks = iter_chunks(f, fmt, header, chunk_lines)
+        if workers <= 1:
+            _init_worker(index)
+            for first, data in chunks:
+                commit(process_chunk(fmt, header, first, data, source, now))
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(index,)) as pool:
+                # 読み込みが先走ってメモリを使いすぎないよう、処理中のチャンクは workers*2 個まで
+                pending = []
+                for first, data in chunks:
+                    pending.append(pool.submit(process_chunk, fmt, header, first, data, source, now))
+                    if len(pending) >= workers * 2:
+                        commit(pending.pop(0).result())
+                for fut in pending:
+                    commit(fut.result())
+        if store is not None:
+            store.flush()
+
+    if not rejected:
+        os.remove(rejected_path)
+    return {"imported": imported, "rejected": rejected, "seconds": time.perf_counter() - t0,
+            "rejected_path": rejected_path if rejected else None}
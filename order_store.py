@@ -0,0 +1,574 @@
+# order_store.py
+# 注文履歴の保存先（差し替え可能）
+#
+#   store = get_order_store()
+#   store.append(record)      # 1件追記
+#   store.latest(1)           # 最新N件
+#   store.iter_records()      # 古い順に1件ずつ
+#
+# 既定は追記型ログ（AppendLogStore）。config.ORDER_STORE="json" で従来の orders.json。
+import os, json, time, glob, atexit, threading, itertools, textwrap
+from collections import deque
+
+import config
+from storage import file_lock, atomic_write_bytes
+from json_stream import iter_json_array, tail_json_array
+from metrics import span, inc
+
+DATA_DIR    = "data"
+LEGACY_FILE = os.path.join(DATA_DIR, "orders.json")
+LOG_DIR     = os.path.join(DATA_DIR, "orders")
+# migrate_legacy_json() の進み具合を表す行のキー（注文としては読まない）
+MIGRATION_KEY = "_migrated"
+
+
+class CursorExpired(Exception):
+    """read_since() に渡したカーソルがもう使えない（コンパクション等）。先頭から読み直す"""
+
+
+def record_time(record: dict) -> str:
+    """CLI/GUI形式(timestamp) と Web形式(ts) のどちらからでも日時を返す"""
+    return record.get("timestamp") or record.get("ts") or "-"
+
+
+class OrderStore:
+    """注文ストアの共通インターフェース"""
+    location = ""
+
+    def append(self, record: dict):
+        raise NotImplementedError
+
+    def append_many(self, records):
+        for r in records:
+            self.append(r)
+
+    def append_encoded(self, lines):
+        """encode 済み（JSON 1件 + 改行）の注文をまとめて追記する（一括取り込み用）"""
+        self.append_many([json.loads(line) for line in lines])
+
+    def iter_records(self):
+        """古い順に1件ずつ返す"""
+        raise NotImplementedError
+
+    def latest(self, n: int = 1) -> list:
+        """最新 n 件（古い順）"""
+        return list(deque(self.iter_records(), maxlen=n))
+
+    def read_since(self, cursor: dict | None):
+        """cursor より後の注文を (record, その直後のcursor) で返す。None なら先頭から
+
+        カーソルは JSON にそのまま保存できる dict。既定実装は件数で数える。
+        """
+        start = cursor["index"] if cursor else 0
+        for i, rec in enumerate(self.iter_records()):
+            if i >= start:
+                yield rec, {"index": i + 1}
+
+    def end_cursor(self) -> dict:
+        """今の末尾を指すカーソル（read_since() に渡すと、この後に入った注文だけが返る）
+
+        既定実装は件数を数えるので全件を読む。末尾が分かるストアは上書きすること
+        """
+        return {"index": sum(1 for _ in self.iter_records())}
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class JsonArrayStore(OrderStore):
+    """従来の orders.json（配列）
+
+    読み込みは json_stream で1件ずつ（全件をメモリに載せない）。
+    追記は既存の要素を一時ファイルへ流し写してから os.replace する。
+    """
+
+    def __init__(self, path: str = LEGACY_FILE):
+        self.path = path
+        self.location = path
+        self._lock = threading.Lock()
+
+    def _quarantine(self):
+        # 壊れたファイルは .broken に退避して、空の履歴として扱う
+        try:
+            os.replace(self.path, self.path + ".broken")
+        except Exception:
+            pass
+
+    def append(self, record: dict):
+        self.append_many([record])
+
+    def append_many(self, records):
+        with self._lock, file_lock(self.path):
+            try:
+                self._rewrite(self._iter_existing(), records)
+            except ValueError:
+                self._quarantine()
+                self._rewrite(iter(()), records)
+
+    def _iter_existing(self):
+        if os.path.exists(self.path):
+            yield from iter_json_array(self.path)
+
+    def _rewrite(self, existing, records):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                # json.dump(..., indent=2) と同じ見た目で1件ずつ書く
+                first = True
+                f.write("[")
+                for rec in itertools.chain(existing, records):
+                    f.write("\n" if first else ",\n")
+                    f.write(textwrap.indent(json.dumps(rec, ensure_ascii=False, indent=2), "  "))
+                    first = False
+                f.write("]" if first else "\n]")
+                f.flush()
+                os.fsync(f.fileno())
+                inc("file_written_bytes", f.tell())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def iter_records(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            yield from iter_json_array(self.path)
+        except ValueError:
+            return  # 壊れている以降は読めない（退避は次の追記時）
+
+    def latest(self, n: int = 1) -> list:
+        if not os.path.exists(self.path):
+            return []
+        try:
+            return tail_json_array(self.path, n)
+        except ValueError:
+            return []
+
+
+class AppendLogStore(OrderStore):
+    """1注文=1行の追記型ログ（JSON Lines）
+
+    - data/orders/orders-000001.jsonl, orders-000002.jsonl ... とセグメント分割
+    - セグメントが segment_bytes を超えたら次のファイルへローテーション
+    - fsync は fsync_every 件ごと / fsync_seconds 秒ごとにまとめて行う
+    """
+
+    PREFIX = "orders-"
+    SUFFIX = ".jsonl"
+
+    def __init__(self, directory: str = LOG_DIR,
+                 segment_bytes: int = config.ORDER_LOG_SEGMENT_BYTES,
+                 fsync_every: int = config.ORDER_LOG_FSYNC_EVERY,
+                 fsync_seconds: float = config.ORDER_LOG_FSYNC_SECONDS):
+        self.directory = directory
+        self.location = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_seconds = fsync_seconds
+        self._lock = threading.Lock()
+        self._lock_path = os.path.join(directory, "orders")
+        self._epoch_path = os.path.join(directory, "EPOCH")
+        self._fh = None
+        self._fh_path = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    # ----- セグメント管理 -----
+    def _segment_path(self, no: int) -> str:
+        return os.path.join(self.directory, f"{self.PREFIX}{no:06d}{self.SUFFIX}")
+
+    def _segment_no(self, path: str) -> int:
+        base = os.path.basename(path)
+        return int(base[len(self.PREFIX):-len(self.SUFFIX)])
+
+    def segments(self) -> list[str]:
+        """セグメントファイル（古い順）"""
+        paths = glob.glob(os.path.join(self.directory, f"{self.PREFIX}*{self.SUFFIX}"))
+        return sorted(paths, key=self._segment_no)
+
+    def _open_active(self):
+        os.makedirs(self.directory, exist_ok=True)
+        segs = self.segments()
+        path = segs[-1] if segs else self._segment_path(1)
+        # buffering=0: 1行を1回の write() で書く（O_APPEND で他プロセスと混ざらない）
+        self._fh = open(path, "ab", buffering=0)
+        self._fh_path = path
+
+    def _follow_rotation(self):
+        # 開いているセグメントが最新でなくなっていたら、最新を開き直す（ロック内で呼ぶ）
+        #  - 他プロセスが次のセグメントへ移った（次の番号のファイルがある）
+        #  - compact() で消された / まとめ先として置き換えられた（パスの inode が開いているものと違う）
+        # これを書く前に毎回確かめるので、消されたセグメント（unlink 済みの inode）に書き続けることはない
+        try:
+            st = os.stat(self._fh_path)
+            fst = os.fstat(self._fh.fileno())
+            stale = (st.st_ino, st.st_dev) != (fst.st_ino, fst.st_dev)
+        except FileNotFoundError:
+            stale = True
+        if stale or os.path.exists(self._segment_path(self._segment_no(self._fh_path) + 1)):
+            self._sync()
+            self._fh.close()
+            self._open_active()
+
+    def _rotate(self):
+        self._sync()
+        self._fh.close()
+        next_path = self._segment_path(self._segment_no(self._fh_path) + 1)
+        self._fh = open(next_path, "ab", buffering=0)
+        self._fh_path = next_path
+
+    def _sync(self):
+        if self._fh is not None and self._pending:
+            os.fsync(self._fh.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    # ----- 書き込み -----
+    @staticmethod
+    def encode(record: dict) -> bytes:
+        return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def append(self, record: dict):
+        self.append_many([record])
+
+    def append_many(self, records):
+        self.append_encoded([self.encode(r) for r in records])
+
+    def append_encoded(self, lines):
+        if not lines:
+            return
+        inc("file_written_bytes", sum(map(len, lines)))
+        with self._lock, file_lock(self._lock_path):
+            if self._fh is None:
+                self._open_active()
+            else:
+                self._follow_rotation()
+            # セグメントの境目までをまとめて1回で書く
+            size = os.fstat(self._fh.fileno()).st_size
+            buf = []
+            for line in lines:
+                if size and size + len(line) > self.segment_bytes:
+                    self._write_all(b"".join(buf))
+                    buf = []
+                    self._rotate()
+                    size = 0
+                buf.append(line)
+                size += len(line)
+                self._pending += 1
+            self._write_all(b"".join(buf))
+            if (self._pending >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_seconds):
+                self._sync()
+
+    def _write_all(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            view = view[self._fh.write(view):]
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    # ----- 読み込み -----
+    @staticmethod
+    def _decode_line(line: bytes):
+        # 書きかけ（改行なし）や壊れた行は読み飛ばす
+        if not line.endswith(b"\n"):
+            return None
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            return None
+        return rec if isinstance(rec, dict) else None
+
+    @classmethod
+    def _parse_line(cls, line: bytes):
+        # 移行の進み具合（MIGRATION_KEY の行）は注文ではないので返さない
+        rec = cls._decode_line(line)
+        return None if rec is None or MIGRATION_KEY in rec else rec
+
+    def _open_segment(self, path: str, epoch: int):
+        """セグメントを開き、開いたものが epoch の時点の中身か確かめる
+
+        compact() は EPOCH を進めてからファイルを置き換える。開いた後に EPOCH が同じなら、
+        手元のファイルは置き換え前の中身（消されても開いている間は読める）。
+        消えていた / EPOCH が進んでいたら CursorExpired。
+        """
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            raise CursorExpired(f"{path} はコンパクションで消えました") from None
+        if self._epoch() != epoch:
+            f.close()
+            raise CursorExpired(f"epoch {epoch} の途中でコンパクションされました")
+        return f
+
+    def _iter_epoch(self, epoch: int):
+        for path in self.segments():
+            read = 0
+            try:
+                with self._open_segment(path, epoch) as f:
+                    for line in f:
+                        read += len(line)
+                        rec = self._parse_line(line)
+                        if rec is not None:
+                            yield rec
+            finally:
+                inc("file_read_bytes", read)
+
+    def iter_records(self):
+        # コンパクションは壊れた行を除くだけで注文の並びは変えないので、
+        # 途中で並べ替えられたら、返した件数ぶん飛ばして新しいファイルから読み直す
+        done = 0
+        while True:
+            try:
+                for i, rec in enumerate(self._iter_epoch(self._epoch())):
+                    if i >= done:
+                        done += 1
+                        yield rec
+                return
+            except CursorExpired:
+                continue
+
+    def _epoch(self) -> int:
+        # コンパクションのたびに増える番号（古いカーソルを見分ける）
+        try:
+            with open(self._epoch_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def read_since(self, cursor: dict | None):
+        """カーソル = (epoch, セグメント番号, バイト位置)。続きの位置から読むだけなので速い
+
+        読んでいる途中でコンパクションされたら CursorExpired（それまでに返したカーソルも古い epoch になる）
+        """
+        epoch = self._epoch()
+        if cursor and cursor.get("epoch") != epoch:
+            raise CursorExpired(f"epoch {cursor.get('epoch')} -> {epoch}")
+        seg_no, offset = (cursor["segment"], cursor["offset"]) if cursor else (0, 0)
+        for path in self.segments():
+            no = self._segment_no(path)
+            if no < seg_no:
+                continue
+            pos = start = offset if no == seg_no else 0
+            try:
+                with self._open_segment(path, epoch) as f:
+                    f.seek(pos)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break  # 書きかけの行は次回に回す
+                        pos += len(line)
+                        rec = self._parse_line(line)
+                        if rec is not None:
+                            yield rec, {"epoch": epoch, "segment": no, "offset": pos}
+            finally:
+                inc("file_read_bytes", pos - start)
+
+    def end_cursor(self) -> dict:
+        """最新のセグメントの、最後に書き終えた行の直後（履歴の長さに関係なく末尾だけを見る）"""
+        while True:
+            epoch = self._epoch()
+            segs = self.segments()
+            if not segs:
+                return {"epoch": epoch, "segment": 0, "offset": 0}
+            try:
+                with self._open_segment(segs[-1], epoch) as f:
+                    offset = _last_line_end(f)
+            except CursorExpired:
+                continue   # 読んでいる途中でコンパクションされたので読み直す
+            return {"epoch": epoch, "segment": self._segment_no(segs[-1]), "offset": offset}
+
+    def latest(self, n: int = 1) -> list:
+        """末尾から逆向きに読むので履歴の長さに依存しない"""
+        with span("storage_read"):
+            while True:
+                try:
+                    return self._latest(n, self._epoch())
+                except CursorExpired:
+                    continue   # 読んでいる途中でコンパクションされたので読み直す
+
+    def _latest(self, n: int, epoch: int) -> list:
+        out = []
+        for path in reversed(self.segments()):
+            with self._open_segment(path, epoch) as f:
+                for line in _tail_lines(f, n - len(out)):
+                    rec = self._parse_line(line)
+                    if rec is not None:
+                        out.append(rec)
+            if len(out) >= n:
+                break
+        return list(reversed(out[:n]))
+
+    def migration_progress(self, name: str) -> int:
+        """migrate_legacy_json() が name から取り込み済みの件数（途中で止まったときの再開位置）"""
+        done = 0
+        key = MIGRATION_KEY.encode()
+        for path in self.segments():
+            with open(path, "rb") as f:
+                for line in f:
+                    if key in line:
+                        rec = self._decode_line(line)
+                        if rec and rec.get(MIGRATION_KEY) == name:
+                            done = rec["count"]
+        return done
+
+    # ----- メンテナンス -----
+    def compact(self) -> int:
+        """閉じたセグメントを1本にまとめ、壊れた行を取り除く。残した件数を返す"""
+        with self._lock, file_lock(self._lock_path):
+            if self._fh is not None:
+                self._follow_rotation()
+            # 最新のセグメントには触れない（書き手はロックを取ってから最新へ追いついて書くので、
+            # 書き込み中のセグメントは常に最新。古いセグメントを開いたままの書き手は、次の書き込みの前に
+            # _follow_rotation() が inode の違い / ファイルが無いことに気づいて開き直す）
+            segs = self.segments()[:-1]
+            if not segs:
+                return 0
+            target = segs[0]
+            tmp = target + ".tmp"
+            kept = 0
+            with open(tmp, "wb") as out:
+                for path in segs:
+                    with open(path, "rb") as f:
+                        for line in f:
+                            rec = self._decode_line(line)
+                            if rec is not None:
+                                out.write(line)
+                                kept += MIGRATION_KEY not in rec
+                out.flush()
+                os.fsync(out.fileno())
+            # EPOCH を先に進める。読み手はセグメントを開いた後に EPOCH を確かめるので、
+            # 置き換え後のファイルを古い epoch のカーソルで読むことはない（_open_segment）
+            atomic_write_bytes(self._epoch_path, str(self._epoch() + 1).encode())
+            os.replace(tmp, target)
+            for path in segs[1:]:
+                os.remove(path)
+            return kept
+
+
+def _last_line_end(f, block: int = 64 * 1024) -> int:
+    """開いたファイル f の最後の改行の直後の位置（書きかけの行は含めない）"""
+    pos = f.seek(0, os.SEEK_END)
+    while pos > 0:
+        step = min(block, pos)
+        pos -= step
+        f.seek(pos)
+        i = f.read(step).rfind(b"\n")
+        if i != -1:
+            return pos + i + 1
+    return 0
+
+
+def _tail_lines(f, n: int, block: int = 64 * 1024) -> list[bytes]:
+    """開いたファイル f の末尾 n 行を新しい順に返す（改行込み）"""
+    if n <= 0:
+        return []
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    buf = b""
+    # 改行が n+1 個見つかるまで（または先頭まで）後ろから読む
+    while pos > 0 and buf.count(b"\n") <= n:
+        step = min(block, pos)
+        pos -= step
+        f.seek(pos)
+        buf = f.read(step) + buf
+    inc("file_read_bytes", len(buf))
+    lines = buf.splitlines(keepends=True)
+    if pos > 0:
+        lines = lines[1:]  # 先頭は途中から読んだ行
+    return list(reversed(lines[-n:]))
+
+
+def migrate_legacy_json(src: str = LEGACY_FILE, store: AppendLogStore | None = None) -> int:
+    """orders.json（配列）を追記ログへ移行し、元ファイルを *.migrated にリネームする
+
+    1件ずつ流し込むので、巨大な orders.json でもメモリは一定。
+    1000件ごとに「ここまで取り込んだ」という行を注文と同じ書き込みでログに残すので、
+    リネームの前に止まっても、やり直したときは続きから取り込む（同じ注文を二重に入れない）。
+    """
+    if not os.path.exists(src):
+        return 0
+    store = store or AppendLogStore()
+    name = os.path.basename(src)
+    with file_lock(src):
+        if not os.path.exists(src):
+            return 0  # 他のプロセスが先に移行した
+        done = store.migration_progress(name)
+        count = 0
+        batch = []
+        suffix = ".migrated"
+
+        def write_batch():
+            nonlocal count, batch
+            count += len(batch)
+            if count > done:
+                store.append_many(batch[max(0, len(batch) - (count - done)):]
+                                  + [{MIGRATION_KEY: name, "count": count}])
+            batch = []
+
+        try:
+            for rec in iter_json_array(src):
+                batch.append(rec)
+                if len(batch) >= 1000:
+                    write_batch()
+        except ValueError:
+            suffix = ".broken"  # 読めたところまでは取り込み、残りは退避
+        write_batch()
+        store.flush()
+        os.replace(src, src + suffix)
+    return count - done
+
+
+_store = None
+
+def get_order_store() -> OrderStore:
+    """設定に応じた注文ストア（プロセス内で1つ）"""
+    global _store
+    if _store is None:
+        if config.ORDER_STORE == "json":
+            _store = JsonArrayStore()
+        elif config.ORDER_STORE == "sqlite":
+            import sqlite_store
+            _store = sqlite_store.SqliteOrderStore()
+        else:
+            _store = AppendLogStore()
+            # 初回だけ: ログが空で orders.json が残っていれば取り込む
+            if not _store.segments() and os.path.exists(LEGACY_FILE):
+                migrate_legacy_json(LEGACY_FILE, _store)
+        atexit.register(_store.close)
+    return _store
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="注文ログのメンテナンス")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("migrate", help="data/orders.json を追記ログへ移行")
+    sub.add_parser("compact", help="閉じたセグメントをまとめる")
+    args = parser.parse_args()
+
+    if args.cmd == "migrate":
+        n = migrate_legacy_json()
+        print(f"{n} 件を {LOG_DIR} へ移行しました")
+    elif args.cmd == "compact":
+        n = AppendLogStore().compact()
+        print(f"{n} 件を残してセグメントをまとめました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# order_writer.py
+# 注文の書き込みをバックグラウンドのスレッドにまとめる（Web のチェックアウト用）
+#
+#   writer = get_order_writer()
+#   writer.submit(order)      # 書き込み待ちの列に入れる（durability に応じて待つ）
+#
+# - 列（キュー）は上限付き。いっぱいなら submit() が空くまで待つ
+# - 書き込みスレッドは溜まっている注文をまとめて1回の append_many + flush で書く（グループコミット）
+# - durability（config.ORDER_DURABILITY）
+#     "fsync"   : ディスクに書けてから submit() が返る（デフォルト）
+#     "enqueue" : 列に入れた時点で返る。落ちると未書き込みの注文は失われうる
+# - add_listener(fn) で、書き終えた注文のまとまりごとに fn(records) を呼ぶ（キッチン表示など）
+# - 終了時（atexit）は列を空になるまで書いてから止まる
+import os, sys, json, time, queue, atexit, signal, threading
+
+import config
+from order_store import get_order_store, DATA_DIR
+from metrics import span
+
+# 書き込みに失敗し続けたまま終了するときの退避先（1注文=1行）
+UNSAVED_FILE = os.path.join(DATA_DIR, "orders.unsaved.jsonl")
+
+_STOP = object()
+
+
+class _Ticket:
+    """submit() 1回分。書き込みが終わる（または失敗する）と done が立つ"""
+    __slots__ = ("record", "done", "error")
+
+    def __init__(self, record):
+        self.record = record
+        self.done = threading.Event()
+        self.error = None
+
+
+class OrderWriter:
+    RETRY_SECONDS = 0.5
+
+    def __init__(self, store=None, durability: str | None = None,
+                 queue_size: int | None = None, max_batch: int | None = None):
+        self.store = store or get_order_store()
+        self.durability = durability or config.ORDER_DURABILITY
+        if self.durability not in ("fsync", "enqueue"):
+            raise ValueError(f"未対応の MENU_APP_ORDER_DURABILITY: {self.durability}")
+        self.max_batch = max_batch or config.ORDER_BATCH_MAX
+        self._queue = queue.Queue(queue_size or config.ORDER_QUEUE_SIZE)
+        self._closed = False
+        # _closed の確認と列への追加を close() と排他にする（_STOP の後ろに注文が入らないように）
+        self._submit_lock = threading.Lock()
+        self._stats = {"orders": 0, "batches": 0, "errors": 0}
+        self._listeners = []
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="order-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: dict, timeout: float | None = None):
+        """注文を書き込み待ちに入れる。fsync モードでは書き込みが終わるまで待ち、失敗すれば例外"""
+        ticket = _Ticket(record)
+        if not self._submit_lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise TimeoutError("注文を書き込み待ちに入れられませんでした")
+        try:
+            if self._closed:
+                raise RuntimeError("OrderWriter は停止しています")
+            self._queue.put(ticket, timeout=timeout)
+        finally:
+            self._submit_lock.release()
+        if self.durability == "fsync":
+            if not ticket.done.wait(timeout):
+                raise TimeoutError("注文の書き込みが時間内に終わりませんでした")
+            if ticket.error is not None:
+                raise ticket.error
+        return ticket
+
+    def add_listener(self, fn):
+        """書き終えた注文のまとまりごとに fn(records) を呼ぶ（書き込みスレッドから。待たせないこと）"""
+        self._listeners.append(fn)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            stop = False
+            # 待っている間に溜まった分をまとめて1回で書く
+            while len(batch) < self.max_batch:
+                try:
+                    t = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if t is _STOP:
+                    stop = True
+                    break
+                batch.append(t)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        records = [t.record for t in batch]
+        while True:
+            try:
+                with span("storage_write"):
+                    self.store.append_many(records)
+                    self.store.flush()
+                break
+            except Exception as e:
+                self._stats["errors"] += 1
+                if self.durability == "fsync":
+                    # 呼び出し側がエラーを受け取れるので、再試行せずに返す
+                    for t in batch:
+                        t.error = e
+                        t.done.set()
+                    return
+                # enqueue モードは呼び出し側にもう成功を返しているので、書けるまで粘る
+                print(f"[order_writer] 書き込みに失敗しました（再試行します）: {e}", file=sys.stderr)
+                if self._closed:
+                    self._save_unsaved(records)
+                    break
+                time.sleep(self.RETRY_SECONDS)
+        self._stats["orders"] += len(batch)
+        self._stats["batches"] += 1
+        for t in batch:
+            t.done.set()
+        for fn in list(self._listeners):
+            try:
+                fn(records)
+            except Exception as e:
+                print(f"[order_writer] 通知先でエラー: {e!r}", file=sys.stderr)
+
+    def _save_unsaved(self, records):
+        os.makedirs(os.path.dirname(UNSAVED_FILE) or ".", exist_ok=True)
+        with open(UNSAVED_FILE, "a", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        print(f"[order_writer] {len(records)} 件を {UNSAVED_FILE} に退避しました", file=sys.stderr)
+
+    def stats(self) -> dict:
+        """書いた注文数 / 書き込み回数 / 失敗回数（orders / batches が平均のまとめ数）"""
+        return dict(self._stats, queued=self._queue.qsize())
+
+    def close(self):
+        """列に残っている注文を書き切ってから止める"""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_order_writer() -> OrderWriter:
+    """プロセス内で1つの OrderWriter（fork 後は作り直す）"""
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer._pid != os.getpid():
+            _writer = OrderWriter()
+            # atexit は登録の逆順に動くので、注文ストアを閉じる前に列を書き切る
+            atexit.register(_writer.close)
+        return _writer
+
+
+def exit_on_sigterm():
+    """SIGTERM でも atexit が動くようにする（メインスレッドから呼ぶ）
+
+    SIGTERM の既定動作ではそのまま落ちて列に残った注文が書かれないので、通常の終了に変える。
+    gunicorn など既にハンドラを設定しているサーバーでは何もしない。
+    """
+    if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
@@ -0,0 +1,128 @@
+# sales_report.py
+# 注文履歴の売上集計（増分集計）
+#
+# data/sales_rollup.json に「ここまでの集計結果」と「どこまで読んだか（カーソル）」を保存し、
+# 次回は注文ストアの続きだけを読んで足し込む。履歴が何百万件あっても、毎回読むのは新着分だけ。
+#
+#   rollup = update_rollup()          # 新着分を取り込んで保存
+#   top_items(rollup, 5)              # 売上上位
+#   python app.py stats               # CLI から
+#   /admin/stats                      # Web から
+import os, json
+
+from order_store import get_order_store, record_time, CursorExpired
+from storage import file_lock, atomic_write_json, read_json
+
+DATA_DIR = "data"
+ROLLUP_FILE = os.path.join(DATA_DIR, "sales_rollup.json")
+ROLLUP_VERSION = 1
+
+
+def empty_rollup(store_location: str = "") -> dict:
+    return {
+        "version": ROLLUP_VERSION,
+        "store": store_location,
+        "cursor": None,
+        "orders": 0,
+        "revenue": 0,
+        "units": 0,
+        "items": {},    # 商品名 -> {"qty": 個数, "revenue": 売上}
+        "hourly": {},   # "00".."23" -> {"orders": 件数, "revenue": 売上}
+        "daily": {},    # "YYYY-MM-DD" -> {"orders": 件数, "revenue": 売上}
+    }
+
+
+def _add_order(rollup: dict, rec: dict):
+    items = rec.get("items", [])
+    revenue = rec.get("total")
+    if revenue is None:
+        revenue = sum(it.get("price", 0) * it.get("qty", 0) for it in items)
+
+    rollup["orders"] += 1
+    rollup["revenue"] += revenue
+    for it in items:
+        qty = it.get("qty", 0)
+        slot = rollup["items"].setdefault(it.get("name", "?"), {"qty": 0, "revenue": 0})
+        slot["qty"] += qty
+        slot["revenue"] += it.get("price", 0) * qty
+        rollup["units"] += qty
+
+    # ISO 形式の日時文字列から直接切り出す（datetime に変換しないぶん速い）
+    ts = record_time(rec)
+    if len(ts) >= 13:
+        for key, bucket in ((ts[11:13], "hourly"), (ts[:10], "daily")):
+            b = rollup[bucket].setdefault(key, {"orders": 0, "revenue": 0})
+            b["orders"] += 1
+            b["revenue"] += revenue
+
+
+def update_rollup(store=None, path: str = ROLLUP_FILE, rebuild: bool = False) -> dict:
+    """保存済みの集計に新着注文を足し込んで保存し、集計結果を返す"""
+    store = store or get_order_store()
+    with file_lock(path):
+        rollup = None if rebuild else read_json(path)
+        if (not rollup or rollup.get("version") != ROLLUP_VERSION
+                or rollup.get("store") != store.location):
+            rollup = empty_rollup(store.location)
+
+        try:
+            changed = _consume(rollup, store)
+        except CursorExpired:
+            # コンパクション等で続きの位置が分からなくなったので作り直す
+            rollup = empty_rollup(store.location)
+            changed = _consume(rollup, store)
+
+        if changed:
+            atomic_write_json(path, rollup, indent=None)
+    return rollup
+
+
+def _consume(rollup: dict, store) -> bool:
+    cursor = rollup["cursor"]
+    changed = cursor is None
+    for rec, cursor in store.read_since(cursor):
+        _add_order(rollup, rec)
+        changed = True
+    rollup["cursor"] = cursor
+    return changed
+
+
+def top_items(rollup: dict, n: int = 10, key: str = "revenue") -> list:
+    """[(商品名, {"qty", "revenue"}), ...] を key の大きい順に n 件"""
+    return sorted(rollup["items"].items(), key=lambda kv: kv[1][key], reverse=True)[:n]
+
+
+def hourly(rollup: dict) -> list:
+    """0〜23時の [(時, 件数, 売上), ...]（注文の無い時間帯も0で埋める）"""
+    out = []
+    for h in range(24):
+        b = rollup["hourly"].get(f"{h:02d}", {"orders": 0, "revenue": 0})
+        out.append((h, b["orders"], b["revenue"]))
+    return out
+
+
+def daily(rollup: dict, days: int | None = None) -> list:
+    """[(日付, 件数, 売上), ...]（新しい順。days を指定すると直近だけ）"""
+    rows = sorted(rollup["daily"].items(), reverse=True)
+    if days is not None:
+        rows = rows[:days]
+    return [(d, b["orders"], b["revenue"]) for d, b in rows]
+
+
+def print_report(rollup: dict, top: int = 10, days: int = 14):
+    print("\n====== 売上レポート ======")
+    print(f"注文数: {rollup['orders']} 件 / 売上: {rollup['revenue']} 円 / 販売数: {rollup['units']} 個")
+
+    print(f"\n--- 売上上位 {top} 品 ---")
+    for i, (name, s) in enumerate(top_items(rollup, top), 1):
+        print(f"{i:>2}. {name}  × {s['qty']}  ¥{s['revenue']}")
+
+    print("\n--- 時間帯別 ---")
+    for h, n, rev in hourly(rollup):
+        if n:
+            print(f"{h:02d}時  {n:>5} 件  ¥{rev}")
+
+    print(f"\n--- 日別（直近 {days} 日） ---")
+    for d, n, rev in daily(rollup, days):
+        print(f"{d}  {n:>5} 件  ¥{rev}")
+    print("_" * 50)
@@ -0,0 +1,417 @@
+# sqlite_store.py
+# SQLite バックエンド（config.STORAGE_BACKEND = "sqlite" のとき menu_io / order_store から使われる）
+#
+# - WAL モード。接続はワーカー（プロセス）×スレッドごとに1本を使い回す
+# - 注文は orders / order_items に正規化し、日時と商品名にインデックスを張る
+# - 既存データの取り込み: python sqlite_store.py import
+import os, json, sqlite3, threading, argparse
+
+import config
+from menu_item import Food, Drink, Dessert, make_item_id, unique_item_id
+from menu_repo import MenuRepository, _check_version
+from order_store import OrderStore, JsonArrayStore, AppendLogStore, CursorExpired, LEGACY_FILE, LOG_DIR
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS menu_items (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_id   TEXT,                -- 商品の固定 ID（menu_item.MenuItem.id）
+    category  TEXT    NOT NULL,
+    position  INTEGER NOT NULL,
+    name      TEXT    NOT NULL,
+    price     INTEGER NOT NULL,
+    calorie   INTEGER NOT NULL DEFAULT 0,
+    volume_ml INTEGER NOT NULL DEFAULT 0,
+    sugar_g   INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS menu_changes (
+    v       INTEGER PRIMARY KEY,   -- この変更で進んだ後の版（meta の menu_version）
+    op      TEXT    NOT NULL,      -- add / update / delete
+    cat     TEXT    NOT NULL,
+    item_id TEXT    NOT NULL,
+    item    TEXT                   -- 追加・更新後の商品（JSON）。削除なら NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    seq      INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT,
+    ts       TEXT    NOT NULL,
+    total    INTEGER NOT NULL,
+    style    TEXT    NOT NULL,   -- "cli": timestamp形式 / "web": id,ts,total形式
+    extra    TEXT                -- 上記以外のキー（JSON）
+);
+CREATE TABLE IF NOT EXISTS order_items (
+    seq      INTEGER NOT NULL REFERENCES orders(seq),
+    line     INTEGER NOT NULL,
+    item_id  TEXT,
+    category TEXT,
+    name     TEXT    NOT NULL,
+    qty      INTEGER NOT NULL,
+    price    INTEGER NOT NULL,
+    PRIMARY KEY (seq, line)
+);
+CREATE INDEX IF NOT EXISTS idx_orders_ts        ON orders(ts);
+CREATE INDEX IF NOT EXISTS idx_order_items_name ON order_items(name);
+"""
+
+CATEGORIES = (("Food", Food), ("Drink", Drink), ("Dessert", Dessert))
+
+_local = threading.local()
+
+
+def connect(path: str | None = None, schema: str | None = None) -> sqlite3.Connection:
+    """このプロセス・スレッド用の接続（fork 後は作り直す）。schema を渡すと別用途の DB として開く"""
+    path = path or config.SQLITE_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL はコミットごとには fsync しない（電源断で直前のコミットが消えうる）。
+        # 注文を「ディスクに書けてから返す」（ORDER_DURABILITY="fsync"）ときは FULL でコミットごとに fsync する
+        durable = schema is None and config.ORDER_DURABILITY == "fsync"
+        conn.execute(f"PRAGMA synchronous={'FULL' if durable else 'NORMAL'}")
+        conn.executescript(schema or SCHEMA)
+        if schema is None:
+            _upgrade(conn)
+        conns[path] = conn
+    return conn
+
+
+def _upgrade(conn):
+    # 古いスキーマで作られた DB に後から増えた列を足す
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(menu_items)")}
+    if "item_id" not in cols:
+        conn.execute("ALTER TABLE menu_items ADD COLUMN item_id TEXT")
+        conn.commit()
+    # item_id が空の行（ID 導入前に取り込んだメニュー）は、読み込み時と同じ規則で埋めておく
+    # （同名が重なれば menu_io と同じく -2, -3 ... を付けて、ここで固定する）
+    rows = conn.execute("SELECT id, category, name FROM menu_items WHERE item_id IS NULL ORDER BY id").fetchall()
+    if rows:
+        taken = {r[0] for r in conn.execute("SELECT item_id FROM menu_items WHERE item_id IS NOT NULL")}
+        updates = []
+        for rid, cat, name in rows:
+            item_id = unique_item_id(make_item_id(cat, name), taken)
+            taken.add(item_id)
+            updates.append((item_id, rid))
+        with conn:
+            conn.executemany("UPDATE menu_items SET item_id = ? WHERE id = ?", updates)
+
+
+# ========= メニュー =========
+def _revision(conn) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'menu_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def menu_revision(path: str | None = None) -> int:
+    """メニューの版番号（編集のたびに1つ進む）"""
+    return _revision(connect(path))
+
+
+def menu_version(path: str | None = None) -> str:
+    return f"db-{menu_revision(path)}"
+
+
+def load_menus(path: str | None = None):
+    rows = connect(path).execute(
+        "SELECT category, item_id, name, price, calorie, volume_ml, sugar_g"
+        " FROM menu_items ORDER BY category, position"
+    ).fetchall()
+    foods, drinks, desserts = [], [], []
+    for cat, item_id, name, price, calorie, volume_ml, sugar_g in rows:
+        if cat == "Food":
+            foods.append(Food(name, price, calorie, item_id=item_id))
+        elif cat == "Drink":
+            drinks.append(Drink(name, price, volume_ml, sugar_g, item_id=item_id))
+        elif cat == "Dessert":
+            desserts.append(Dessert(name, price, sugar_g, calorie, item_id=item_id))
+    return foods, drinks, desserts
+
+
+def save_menus(foods, drinks, desserts, path: str | None = None):
+    """メニューを丸ごと置き換えて版を1つ進める"""
+    conn = connect(path)
+    with conn:
+        conn.execute("DELETE FROM menu_items")
+        for (cat, _), items in zip(CATEGORIES, (foods, drinks, desserts)):
+            conn.executemany(
+                "INSERT INTO menu_items (item_id, category, position, name, price, calorie, volume_ml, sugar_g)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(it.id, cat, i, it.name, it.price, getattr(it, "calorie", 0),
+                  getattr(it, "volume_ml", 0), getattr(it, "sugar_g", 0)) for i, it in enumerate(items)],
+            )
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('menu_version', '1')"
+            " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+        # 丸ごと置き換えたので、それまでの差分からは追いつけない
+        conn.execute("DELETE FROM menu_changes")
+
+
+def menu_changes_since(after: int, upto: int | None = None, path: str | None = None) -> list | None:
+    """版 after より後の変更（menu_repo の形）。途中が欠けていれば None"""
+    import menu_io
+    rows = connect(path).execute(
+        "SELECT v, op, cat, item_id, item FROM menu_changes WHERE v > ? ORDER BY v", (after,)).fetchall()
+    if upto is not None and upto > after and (not rows or rows[-1][0] < upto):
+        return None
+    changes = []
+    expected = after + 1
+    for v, op, cat, item_id, item in rows:
+        if v != expected:
+            return None
+        ch = {"v": v, "op": op, "cat": cat, "id": item_id}
+        if item is not None:
+            ch["item"] = menu_io._parse_item(cat, json.loads(item))
+        changes.append(ch)
+        expected += 1
+    return changes
+
+
+class SqliteMenuRepository(MenuRepository):
+    """menu_items の1行だけを書き換え、変更を menu_changes に残す"""
+
+    KEEP_CHANGES = 1000   # menu_changes に残す件数（これより古い版からは丸ごと読み直し）
+
+    def __init__(self, path: str | None = None):
+        self.path = path or config.SQLITE_PATH
+
+    def _commit(self, build, expected_version):
+        import menu_io
+        conn = connect(self.path)
+        # 版の確認から書き込みまでを1つの書き込みトランザクションにする（他のワーカーはここで待つ）
+        conn.execute("BEGIN IMMEDIATE")
+        with conn:
+            revision = _revision(conn)
+            _check_version(expected_version, revision)
+            change = build(menu_io.load_catalog())
+            v = change["v"] = revision + 1
+            item = change.get("item")
+            if change["op"] == "add":
+                conn.execute(
+                    "INSERT INTO menu_items (item_id, category, position, name, price, calorie, volume_ml, sugar_g)"
+                    " VALUES (?, ?, (SELECT COALESCE(MAX(position) + 1, 0) FROM menu_items WHERE category = ?),"
+                    " ?, ?, ?, ?, ?)",
+                    (item.id, change["cat"], change["cat"], item.name, item.price, getattr(item, "calorie", 0),
+                     getattr(item, "volume_ml", 0), getattr(item, "sugar_g", 0)))
+            elif change["op"] == "update":
+                conn.execute(
+                    "UPDATE menu_items SET name = ?, price = ?, calorie = ?, volume_ml = ?, sugar_g = ?"
+                    " WHERE item_id = ?",
+                    (item.name, item.price, getattr(item, "calorie", 0), getattr(item, "volume_ml", 0),
+                     getattr(item, "sugar_g", 0), change["id"]))
+            else:
+                conn.execute("DELETE FROM menu_items WHERE item_id = ?", (change["id"],))
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('menu_version', ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value", (str(v),))
+            conn.execute(
+                "INSERT INTO menu_changes (v, op, cat, item_id, item) VALUES (?, ?, ?, ?, ?)",
+                (v, change["op"], change["cat"], change["id"],
+                 json.dumps(item.to_dict(), ensure_ascii=False) if item is not None else None))
+            conn.execute("DELETE FROM menu_changes WHERE v <= ?", (v - self.KEEP_CHANGES,))
+        menu_io.note_local_edit()
+        return v
+
+    def changes_since(self, version):
+        return menu_changes_since(version, menu_revision(self.path), self.path)
+
+
+# ========= 注文 =========
+_ORDER_KEYS = {"id", "ts", "timestamp", "total", "items"}
+
+
+def _record_to_row(rec: dict):
+    items = rec.get("items", [])
+    if "timestamp" in rec:
+        style, ts = "cli", rec["timestamp"]
+    else:
+        style, ts = "web", rec.get("ts", "")
+    total = rec.get("total")
+    if total is None:
+        total = sum(it.get("price", 0) * it.get("qty", 0) for it in items)
+    extra = {k: v for k, v in rec.items() if k not in _ORDER_KEYS}
+    row = (rec.get("id"), ts, total, style, json.dumps(extra, ensure_ascii=False) if extra else None)
+    lines = [(i, it.get("id"), it.get("cat"), it.get("name") or "", it.get("qty", 0), it.get("price", 0))
+             for i, it in enumerate(items)]
+    return row, lines
+
+
+def _row_to_record(row, item_rows) -> dict:
+    _, order_id, ts, total, style, extra = row
+    items = []
+    for item_id, cat, name, qty, price in item_rows:
+        it = {"name": name, "qty": qty, "price": price}
+        if item_id is not None: it["id"] = item_id
+        if cat is not None:     it["cat"] = cat
+        items.append(it)
+    if style == "cli":
+        rec = {"timestamp": ts, "items": items}
+        if order_id is not None:
+            rec["id"] = order_id
+    else:
+        rec = {"id": order_id, "items": items, "total": total, "ts": ts}
+    if extra:
+        rec.update(json.loads(extra))
+    return rec
+
+
+def _orders_epoch(conn) -> int:
+    # import --force で注文を入れ替えるたびに増える番号（古いカーソルを見分ける）
+    row = conn.execute("SELECT value FROM meta WHERE key = 'orders_epoch'").fetchone()
+    return int(row[0]) if row else 0
+
+
+class SqliteOrderStore(OrderStore):
+    """orders / order_items テーブルに保存する注文ストア"""
+
+    def __init__(self, path: str | None = None):
+        self.path = path or config.SQLITE_PATH
+        self.location = self.path
+
+    def append(self, record: dict):
+        self.append_many([record])
+
+    def append_many(self, records):
+        # ORDER_DURABILITY="fsync" なら接続が synchronous=FULL なので、コミットが返った時点でディスクにある
+        #（flush() ですることは無い）
+        conn = connect(self.path)
+        with conn:
+            _insert_records(conn, records)
+
+    def _items_for(self, conn, seqs):
+        by_seq = {s: [] for s in seqs}
+        if not seqs:
+            return by_seq
+        marks = ",".join("?" * len(seqs))
+        for seq, *cols in conn.execute(
+                f"SELECT seq, item_id, category, name, qty, price FROM order_items"
+                f" WHERE seq IN ({marks}) ORDER BY seq, line", seqs):
+            by_seq[seq].append(cols)
+        return by_seq
+
+    def read_since(self, cursor: dict | None, batch: int = 500):
+        """カーソル = (epoch, 最後に読んだ seq)。import --force で注文を入れ替えると epoch が進む"""
+        conn = connect(self.path)
+        epoch = _orders_epoch(conn)
+        if cursor and cursor.get("epoch", 0) != epoch:
+            raise CursorExpired(f"epoch {cursor.get('epoch', 0)} -> {epoch}")
+        last = cursor["seq"] if cursor else 0
+        while True:
+            rows = conn.execute(
+                "SELECT seq, order_id, ts, total, style, extra FROM orders WHERE seq > ? ORDER BY seq LIMIT ?",
+                (last, batch)).fetchall()
+            if not rows:
+                return
+            items = self._items_for(conn, [r[0] for r in rows])
+            for r in rows:
+                yield _row_to_record(r, items[r[0]]), {"epoch": epoch, "seq": r[0]}
+            last = rows[-1][0]
+
+    def end_cursor(self) -> dict:
+        conn = connect(self.path)
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM orders").fetchone()[0]
+        return {"epoch": _orders_epoch(conn), "seq": seq}
+
+    def iter_records(self, batch: int = 500):
+        """seq 順に batch 件ずつ読む（全件をメモリに載せない）"""
+        for rec, _ in self.read_since(None, batch):
+            yield rec
+
+    def latest(self, n: int = 1) -> list:
+        conn = connect(self.path)
+        rows = conn.execute(
+            "SELECT seq, order_id, ts, total, style, extra FROM orders ORDER BY seq DESC LIMIT ?", (n,)
+        ).fetchall()
+        rows.reverse()
+        items = self._items_for(conn, [r[0] for r in rows])
+        return [_row_to_record(r, items[r[0]]) for r in rows]
+
+    def count(self) -> int:
+        return connect(self.path).execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+
+def _insert_records(conn, records) -> int:
+    """注文を orders / order_items に入れる（トランザクションは呼び出し側）。件数を返す"""
+    n = 0
+    for rec in records:
+        row, lines = _record_to_row(rec)
+        cur = conn.execute(
+            "INSERT INTO orders (order_id, ts, total, style, extra) VALUES (?, ?, ?, ?, ?)", row)
+        conn.executemany(
+            "INSERT INTO order_items (seq, line, item_id, category, name, qty, price)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(cur.lastrowid,) + line for line in lines])
+        n += 1
+    return n
+
+
+# ========= 既存データの取り込み =========
+def import_json(menus_file: str, orders_sources: list[str], path: str | None = None, force: bool = False):
+    """menus.json と orders.json / 追記ログを SQLite に取り込む。(メニュー件数, 注文件数) を返す
+
+    orders に既にデータがあれば何も書かずに止める。force なら注文を入れ替える
+    （削除と取り込みを1つのトランザクションで行うので、途中で失敗しても元のまま）。
+    """
+    import menu_io
+    # 書き込む前に確かめる（断られた取り込みでメニューだけ置き換わらないように）
+    if SqliteOrderStore(path).count() and not force:
+        raise SystemExit("orders テーブルに既にデータがあります（上書きで取り込むなら --force）")
+
+    n_menus = n_orders = 0
+    if os.path.exists(menus_file):
+        with open(menus_file, "r", encoding="utf-8") as f:
+            foods, drinks, desserts = menu_io._parse_menus(json.load(f))
+        save_menus(foods, drinks, desserts, path)
+        n_menus = len(foods) + len(drinks) + len(desserts)
+
+    conn = connect(path)
+    conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        if force:
+            conn.execute("DELETE FROM order_items")
+            conn.execute("DELETE FROM orders")
+            # seq は AUTOINCREMENT で続きから振られるので、集計のカーソルは epoch で無効にする
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('orders_epoch', '1')"
+                " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+        for src in orders_sources:
+            if os.path.isdir(src):
+                n_orders += _insert_records(conn, AppendLogStore(src).iter_records())
+            elif os.path.exists(src):
+                n_orders += _insert_records(conn, JsonArrayStore(src).iter_records())
+    return n_menus, n_orders
+
+
+def main():
+    import menu_io
+    parser = argparse.ArgumentParser(description="SQLite バックエンドの管理")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import", help="menus.json / orders.json / 追記ログを取り込む")
+    imp.add_argument("--menus", default=menu_io.DATA_FILE)
+    imp.add_argument("--orders", nargs="*", default=None,
+                     help="orders.json 形式のファイル、または追記ログのディレクトリ"
+                          "（省略時: 追記ログがあればそれ、無ければ orders.json）")
+    imp.add_argument("--db", default=config.SQLITE_PATH)
+    imp.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    if args.cmd == "import":
+        # 移行済みの orders.json.migrated はログと重複するので既定では読まない
+        sources = args.orders
+        if sources is None:
+            sources = [LOG_DIR] if AppendLogStore(LOG_DIR).segments() else [LEGACY_FILE]
+        n_menus, n_orders = import_json(args.menus, sources, args.db, args.force)
+        print(f"メニュー {n_menus} 件 / 注文 {n_orders} 件を {args.db} に取り込みました")
+        print("有効にするには MENU_APP_BACKEND=sqlite を設定してください")
+
+
+if __name__ == "__main__":
+    main()
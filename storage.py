@@ -0,0 +1,132 @@
+# storage.py
+# data/ 配下のファイルを複数プロセス（gunicorn の複数ワーカー / CLI / GUI）から
+# 安全に読み書きするための共通処理
+#
+#   with file_lock(path):            # path + ".lock" に対する advisory ロック
+#       data = read_json(path, [])
+#       ...
+#       atomic_write_json(path, data)  # 一時ファイルに書いて os.replace
+import os, json, time, threading, tempfile
+from contextlib import contextmanager
+
+from metrics import span, inc
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_stats_lock = threading.Lock()
+_lock_stats = {"acquired": 0, "contended": 0, "wait_seconds": 0.0}
+
+# 同じスレッド内での再入（save_menus を file_lock の内側で呼ぶ等）を許す
+_held = threading.local()
+
+
+def lock_stats() -> dict:
+    """ロック取得回数 / 待たされた回数 / 待ち時間の合計（秒）"""
+    with _stats_lock:
+        return dict(_lock_stats)
+
+
+def _try_lock(fd) -> bool:
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _lock_blocking(fd):
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while not _try_lock(fd):
+        time.sleep(0.005)
+
+
+def _unlock(fd):
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path: str):
+    """path に対する排他ロック（実体は path + ".lock"）"""
+    lock_path = os.path.abspath(path) + ".lock"
+    held = getattr(_held, "paths", None)
+    if held is None:
+        held = _held.paths = {}
+    if lock_path in held:
+        held[lock_path] += 1
+        try:
+            yield
+        finally:
+            held[lock_path] -= 1
+        return
+
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        waited = 0.0
+        contended = not _try_lock(fd)
+        if contended:
+            t0 = time.perf_counter()
+            with span("lock_wait"):
+                _lock_blocking(fd)
+            waited = time.perf_counter() - t0
+        with _stats_lock:
+            _lock_stats["acquired"] += 1
+            if contended:
+                _lock_stats["contended"] += 1
+                _lock_stats["wait_seconds"] += waited
+        held[lock_path] = 1
+        try:
+            yield
+        finally:
+            del held[lock_path]
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """同じディレクトリの一時ファイルに書いて fsync → os.replace（途中の状態を見せない）"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        inc("file_written_bytes", len(data))
+        os.chmod(tmp, 0o644)  # mkstemp は 0600 で作るので通常のファイルと揃える
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: str, obj, indent=2):
+    atomic_write_bytes(path, json.dumps(obj, ensure_ascii=False, indent=indent).encode("utf-8"))
+
+
+def read_json(path: str, default=None):
+    """JSON を読む。ファイルが無ければ default"""
+    if not os.path.exists(path):
+        return default
+    with open(path, "rb") as f:
+        data = f.read()
+    inc("file_read_bytes", len(data))
+    return json.loads(data)
@@ -0,0 +1,88 @@
+# tools/check_order_ids.py
+# 複数プロセス×複数スレッドで注文番号を一斉に発行し、重複が無いことを確かめる
+#
+#   python tools/check_order_ids.py                       # 4プロセス×4スレッド×25万件 = 400万件
+#   python tools/check_order_ids.py --procs 8 --threads 2 --per-thread 500000
+#
+# あわせて、スレッドごとに発行順 = 文字列の順（単調増加）になっていることも確かめる。
+# 重複や逆順があれば終了コード 1。
+import argparse, multiprocessing, os, sys, tempfile, threading, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _worker(path, n_threads, per_thread, start_evt):
+    from order_ids import new_order_id_int
+    out = [None] * n_threads
+    errors = []
+
+    def run(k):
+        ids = [new_order_id_int() for _ in range(per_thread)]
+        if any(a >= b for a, b in zip(ids, ids[1:])):
+            errors.append(k)
+        out[k] = ids
+
+    start_evt.wait()
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(n_threads)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    with open(path, "wb") as f:
+        for ids in out:
+            f.write(b"".join(n.to_bytes(16, "big") for n in ids))
+    if errors:
+        raise SystemExit(f"{os.getpid()}: スレッド {errors} で発行順と番号の順が一致しません")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="注文番号の重複チェック")
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--per-thread", type=int, default=250000)
+    parser.add_argument("--start", default="fork" if hasattr(os, "fork") else "spawn",
+                        choices=("fork", "spawn"), help="子プロセスの起動方法（fork 後の選び直しも確かめる）")
+    args = parser.parse_args()
+
+    from order_ids import new_order_id
+    new_order_id()   # fork で引き継がれた状態から子が選び直すことも確かめる
+
+    tmpdir = tempfile.mkdtemp(prefix="order-ids-")
+    ctx = multiprocessing.get_context(args.start)
+    start_evt = ctx.Event()
+    paths = [os.path.join(tmpdir, f"{i}.bin") for i in range(args.procs)]
+    procs = [ctx.Process(target=_worker, args=(p, args.threads, args.per_thread, start_evt)) for p in paths]
+    for p in procs: p.start()
+    time.sleep(0.5)
+    t0 = time.perf_counter()
+    start_evt.set()
+    for p in procs: p.join()
+    elapsed = time.perf_counter() - t0
+
+    failed = any(p.exitcode != 0 for p in procs)
+    seen = set()
+    total = 0
+    try:
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            for i in range(0, len(data), 16):
+                seen.add(data[i:i + 16])
+            total += len(data) // 16
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(tmpdir)
+
+    expected = args.procs * args.threads * args.per_thread
+    dup = total - len(seen)
+    print(f"{args.procs} procs x {args.threads} threads: {total} 件 / {elapsed:.2f}s ({total / elapsed:,.0f} ids/s)")
+    print(f"期待: {expected} / 重複: {dup}")
+    if failed or dup or total != expected:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+# tools/loadtest.py
+# 昼のピークを想定した負荷テスト（メニュー閲覧 → カートに追加 → 数量変更 → チェックアウト）
+#
+#   python tools/loadtest.py                                    # app_web を一時ディレクトリで起動して 30 秒
+#   python tools/loadtest.py --server asgi --workers 4 --concurrency 200 --rate 150
+#   python tools/loadtest.py --url http://127.0.0.1:5001 --workdir .   # 起動済みのサーバーに（workdir は data/ のある場所）
+#
+# - 1 visit = GET / → POST /add を1〜3回 → （ときどき）数量変更 → GET /cart → POST /checkout
+#   （--abandon の割合でチェックアウトせずに離脱）。リダイレクトはブラウザと同じく辿り、cookie は visit ごとに持つ
+# - --rate R を付けると R visits/s のポアソン到着（オープンモデル）。同時に進む visit は --concurrency まで。
+#   visit の時間は「予定の到着時刻から」数えるので、サーバーが詰まって待たされた分も見える
+#   --rate なしは --concurrency 人が休みなく visit を繰り返す（クローズドモデル）
+# - 終わったら注文ストアを開始時点のカーソルから読み、完了画面で受け取った注文番号と突き合わせて
+#   欠落（完了画面が出たのに保存されていない）/ 重複 / 想定外（エラーになったのに保存された）を数える
+#
+# MENU_APP_* の環境変数は起動するサーバーにもそのまま渡る（MENU_APP_ORDER_DURABILITY=enqueue など）。
+# 負荷をかける側も Python のスレッドなので、ワーカー数を見積もるときは別のマシン（か別のコア）から流すこと。
+# 欠落か重複があれば終了コード 1。
+import argparse, http.client, json, math, os, random, re, shutil, signal, socket, subprocess
+import sys, tempfile, threading, time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STEPS = ("menu", "add", "update", "cart", "checkout", "visit")
+ITEM_ID_RE = re.compile(r'name="id" value="([^"]+)"')
+ORDER_ID_RE = re.compile(r"注文番号：<strong>([^<]+)</strong>")
+
+
+class Histogram:
+    """応答時間の記録（秒）。表示は 0.5ms から倍々のバケツ"""
+    BOUNDS = [0.0005 * 2 ** i for i in range(17)]   # 0.5ms 〜 約33s
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        s = sorted(self.samples)
+        if not s:
+            return 0.0
+        return s[min(len(s) - 1, max(0, math.ceil(p / 100 * len(s)) - 1))]
+
+    def buckets(self):
+        counts = Counter()
+        for v in self.samples:
+            for i, b in enumerate(self.BOUNDS):
+                if v <= b:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.BOUNDS)] += 1
+        return [(self.BOUNDS[i] if i < len(self.BOUNDS) else math.inf, counts[i])
+                for i in range(len(self.BOUNDS) + 1)]
+
+    def summary(self) -> dict:
+        n = len(self.samples)
+        return {"count": n,
+                "mean_ms": round(sum(self.samples) / n * 1000, 2) if n else 0.0,
+                **{f"p{p}_ms": round(self.percentile(p) * 1000, 2) for p in (50, 90, 99)},
+                "max_ms": round(max(self.samples) * 1000, 2) if n else 0.0}
+
+
+class Results:
+    def __init__(self):
+        self.latency = {step: Histogram() for step in STEPS}
+        self.start_delay = Histogram()   # 予定の到着時刻から visit を始められるまで（オープンモデル）
+        self.errors = Counter()
+        self.requests = Counter()
+        self.confirmed = []              # 完了画面で受け取った注文番号
+        self.failed_checkouts = 0        # チェックアウトがエラーになった回数（保存されていてもよい）
+        self.visits = 0
+        self._lock = threading.Lock()
+
+    def add(self, **kw):
+        with self._lock:
+            for k, v in kw.items():
+                setattr(self, k, getattr(self, k) + v)
+
+
+class StepError(Exception):
+    pass
+
+
+class Client:
+    """visit 1回ぶんのブラウザ（cookie を持ち、リダイレクトを辿る）"""
+
+    def __init__(self, host, port, results):
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookies = {}
+        self.results = results
+
+    def step(self, name, method, path, form=None) -> str:
+        t0 = time.perf_counter()
+        try:
+            for _ in range(5):
+                status, location, body = self._request(method, path, form)
+                if status in (301, 302, 303) and location:
+                    method, path, form = "GET", urlsplit(location).path or "/", None
+                    continue
+                break
+            if status >= 400:
+                raise StepError(f"{name}: HTTP {status}")
+            return body
+        except (OSError, http.client.HTTPException) as e:
+            self.conn.close()
+            raise StepError(f"{name}: {method} {path}: {e!r}") from e
+        finally:
+            self.results.latency[name].record(time.perf_counter() - t0)
+            with self.results._lock:
+                self.results.requests[name] += 1
+
+    def _request(self, method, path, form):
+        headers = {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        self.conn.request(method, path, body=body, headers=headers)
+        resp = self.conn.getresponse()
+        data = resp.read().decode("utf-8", "replace")
+        for header in resp.headers.get_all("Set-Cookie") or []:
+            name, _, value = header.split(";", 1)[0].partition("=")
+            self.cookies[name.strip()] = value.strip()
+        return resp.status, resp.headers.get("Location"), data
+
+    def close(self):
+        self.conn.close()
+
+
+def visit(host, port, args, rng, results, due=None):
+    """due は予定の到着時刻（オープンモデル）。visit の時間はそこから数える"""
+    client = Client(host, port, results)
+    t0 = due if due is not None else time.perf_counter()
+    try:
+        page = client.step("menu", "GET", "/")
+        ids = ITEM_ID_RE.findall(page)
+        if not ids:
+            raise StepError("menu: 商品がありません")
+        picked = rng.sample(ids, min(len(ids), rng.randint(1, 3)))
+        for item_id in picked:
+            think(rng, args.think)
+            client.step("add", "POST", "/add", {"id": item_id, "qty": rng.randint(1, 2)})
+        if rng.random() < args.update:
+            think(rng, args.think)
+            client.step("update", "POST", "/cart",
+                        {"action": "update", "id": rng.choice(picked), "qty": rng.randint(1, 4)})
+        else:
+            client.step("cart", "GET", "/cart")
+        if rng.random() < args.abandon:
+            return
+        think(rng, args.think)
+        try:
+            page = client.step("checkout", "POST", "/checkout")
+        except StepError:
+            results.add(failed_checkouts=1)
+            raise
+        m = ORDER_ID_RE.search(page)
+        if m:
+            with results._lock:
+                results.confirmed.append(m.group(1))
+    except StepError as e:
+        with results._lock:
+            results.errors[str(e).split(":", 1)[0]] += 1
+        if args.verbose:
+            print(f"  エラー: {e}", file=sys.stderr)
+    finally:
+        client.close()
+        results.latency["visit"].record(time.perf_counter() - t0)
+        results.add(visits=1)
+
+
+def think(rng, mean):
+    if mean > 0:
+        time.sleep(rng.expovariate(1 / mean))
+
+
+def run_closed(host, port, args, results):
+    stop_at = time.perf_counter() + args.duration
+    remaining = [args.visits] if args.visits else None
+    lock = threading.Lock()
+
+    def user(n):
+        rng = random.Random(args.seed * 100003 + n)
+        while time.perf_counter() < stop_at:
+            if remaining is not None:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+            visit(host, port, args, rng, results)
+
+    threads = [threading.Thread(target=user, args=(n,), daemon=True) for n in range(args.concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+
+def run_open(host, port, args, results):
+    rng = random.Random(args.seed)
+    pool = ThreadPoolExecutor(args.concurrency, thread_name_prefix="visit")
+    t_start = time.perf_counter()
+    due = t_start
+    n = 0
+
+    def scheduled(at, seed):
+        results.start_delay.record(time.perf_counter() - at)
+        visit(host, port, args, random.Random(seed), results, due=at)
+
+    while due - t_start < args.duration and (not args.visits or n < args.visits):
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pool.submit(scheduled, due, args.seed * 100003 + n)
+        n += 1
+        due += rng.expovariate(args.rate)
+    pool.shutdown(wait=True)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare_workdir(source_data) -> str:
+    workdir = tempfile.mkdtemp(prefix="menu-load-")
+    os.makedirs(os.path.join(workdir, "data"))
+    shutil.copy(os.path.join(source_data, "menus.json"), os.path.join(workdir, "data"))
+    return workdir
+
+
+def start_server(kind, workdir, port, workers):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    if kind == "asgi":
+        env.update(MENU_APP_WEB_HOST="127.0.0.1", MENU_APP_WEB_PORT=str(port), MENU_APP_WEB_WORKERS=str(workers))
+        cmd = [sys.executable, os.path.join(ROOT, "app_asgi.py")]
+    else:
+        # debug=True の自動リロードは使わない（子プロセスが増えて計測がぶれる）
+        cmd = [sys.executable, "-c",
+               "import app_web; app_web.exit_on_sigterm(); "
+               f"app_web.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    # ログはファイルに流す（パイプのままだと読まれずに詰まり、サーバーが止まる）
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            with open(log_path, encoding="utf-8", errors="replace") as f:
+                raise SystemExit(f"サーバーが起動しませんでした:\n{f.read()}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("サーバーが 30 秒以内に応答しませんでした")
+
+
+def stop_server(proc):
+    # SIGTERM で止めると、書き込み待ちの注文を書き切ってから終わる（order_writer の atexit）
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def store_cursor():
+    from order_store import get_order_store
+    return get_order_store().end_cursor()
+
+
+def stored_ids(cursor) -> list:
+    import order_store
+    store = order_store.get_order_store()
+    try:
+        return [rec.get("id") for rec, _ in store.read_since(cursor)]
+    except order_store.CursorExpired:
+        print("注文ストアがまとめ直されたため、全件から数えます", file=sys.stderr)
+        return [rec.get("id") for rec, _ in store.read_since(None)]
+
+
+def print_report(args, results, elapsed, diff):
+    total_req = sum(results.requests.values())
+    total_err = sum(results.errors.values())
+    model = f"オープン {args.rate:g} visits/s" if args.rate else "クローズド"
+    print(f"\n== {model} / 同時 {args.concurrency} / {elapsed:.1f}s ==")
+    print(f"visit: {results.visits}（{results.visits / elapsed:.1f}/s）  "
+          f"リクエスト: {total_req}（{total_req / elapsed:.1f}/s）  "
+          f"注文: {len(results.confirmed)}（{len(results.confirmed) / elapsed:.1f}/s）")
+    print(f"エラー: {total_err} visit（{total_err / max(1, results.visits):.2%}） {dict(results.errors)}")
+    if args.rate:
+        d = results.start_delay.summary()
+        print(f"開始遅れ: p50 {d['p50_ms']}ms / p99 {d['p99_ms']}ms"
+              "（大きければ --concurrency か負荷をかける側が足りていない）")
+
+    print(f"\n{'step':<9}{'件数':>7}{'平均':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'最大':>10}  (ms)")
+    for step in STEPS:
+        s = results.latency[step].summary()
+        if s["count"]:
+            print(f"{step:<9}{s['count']:>7}{s['mean_ms']:>9}{s['p50_ms']:>9}"
+                  f"{s['p90_ms']:>9}{s['p99_ms']:>9}{s['max_ms']:>10}")
+
+    for step in ("menu", "checkout"):
+        hist = results.latency[step]
+        if not hist.samples:
+            continue
+        print(f"\n{step} の応答時間の分布")
+        buckets = hist.buckets()
+        peak = max(c for _, c in buckets) or 1
+        lo = 0.0
+        for bound, count in buckets:
+            if count:
+                label = f"{lo * 1000:.1f}-{bound * 1000:.1f}ms" if bound != math.inf else f">{lo * 1000:.0f}ms"
+                print(f"  {label:>16} {count:>7} {'#' * max(1, round(40 * count / peak))}")
+            lo = bound
+
+    if diff is not None:
+        print(f"\n注文ストア: 保存 {diff['stored']} / 完了画面 {diff['confirmed']} / "
+              f"欠落 {diff['lost']} / 重複 {diff['duplicated']} / 想定外 {diff['unexpected']}"
+              f"（エラーになったチェックアウト {results.failed_checkouts}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app_web の負荷テスト（昼のピークを再現）")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask",
+                        help="一時ディレクトリで起動するサーバー（--url を付けたら起動しない）")
+    parser.add_argument("--workers", type=int, default=1, help="--server asgi のワーカー数")
+    parser.add_argument("--url", help="起動済みのサーバー（例 http://127.0.0.1:5001）")
+    parser.add_argument("--workdir", help="--url のサーバーの作業ディレクトリ（data/ を突き合わせに使う）")
+    parser.add_argument("--concurrency", type=int, default=20, help="同時に進む visit の上限")
+    parser.add_argument("--rate", type=float, help="到着率 visits/s（省略時はクローズドモデル）")
+    parser.add_argument("--duration", type=float, default=30, help="秒")
+    parser.add_argument("--visits", type=int, help="visit の総数（duration より先に達したら終わる）")
+    parser.add_argument("--think", type=float, default=0.0, help="操作の間の平均待ち時間（秒、指数分布）")
+    parser.add_argument("--update", type=float, default=0.3, help="数量を変更する visit の割合")
+    parser.add_argument("--abandon", type=float, default=0.2, help="チェックアウトせずに離脱する割合")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="結果を JSON で書き出す先")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    # 作業ディレクトリに移るので、相対パスは起動したときの場所で解決しておく
+    args.json = args.json and os.path.abspath(args.json)
+    args.workdir = args.workdir and os.path.abspath(args.workdir)
+
+    if args.server == "asgi" and args.workers > 1 and not args.url:
+        # ワーカー間でカートを共有し、キッチン表示も全ワーカーの注文を見る設定にする
+        os.environ.setdefault("MENU_APP_CART_STORE", "sqlite")
+        os.environ.setdefault("MENU_APP_KITCHEN_SOURCE", "store")
+
+    proc = None
+    own_workdir = not args.url
+    workdir = prepare_workdir(os.path.join(ROOT, "data")) if own_workdir else args.workdir
+    try:
+        if workdir:
+            os.chdir(workdir)
+            import config
+            if own_workdir and config.STORAGE_BACKEND == "sqlite":
+                import sqlite_store
+                sqlite_store.import_json(os.path.join("data", "menus.json"), [])
+            cursor = store_cursor()
+        if args.url:
+            u = urlsplit(args.url)
+            host, port = u.hostname, u.port or 80
+        else:
+            host, port = "127.0.0.1", free_port()
+            proc = start_server(args.server, workdir, port, args.workers)
+
+        results = Results()
+        print(f"{host}:{port} に {args.duration:g} 秒間 負荷をかけます ...")
+        t0 = time.perf_counter()
+        (run_open if args.rate else run_closed)(host, port, args, results)
+        elapsed = time.perf_counter() - t0
+
+        diff = None
+        if proc is not None:
+            stop_server(proc)
+            proc = None
+        elif workdir:
+            time.sleep(1.0)   # enqueue モードの書き込み待ちが捌けるのを待つ
+        if workdir:
+            ids = stored_ids(cursor)
+            stored = Counter(ids)
+            confirmed = set(results.confirmed)
+            diff = {"stored": len(ids), "confirmed": len(results.confirmed),
+                    "lost": len(confirmed - set(stored)),
+                    "duplicated": sum(c - 1 for c in stored.values() if c > 1),
+                    "unexpected": len(set(stored) - confirmed)}
+        print_report(args, results, elapsed, diff)
+
+        if args.json:
+            out = {"args": vars(args), "elapsed": elapsed, "visits": results.visits,
+                   "requests": dict(results.requests), "errors": dict(results.errors),
+                   "orders": len(results.confirmed), "store": diff,
+                   "latency": {s: results.latency[s].summary() for s in STEPS},
+                   "start_delay": results.start_delay.summary()}
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(out, f, ensure_ascii=False, indent=2)
+        return 1 if diff and (diff["lost"] or diff["duplicated"]) else 0
+    finally:
+        if proc is not None:
+            stop_server(proc)
+        os.chdir(ROOT)
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
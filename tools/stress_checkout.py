@@ -0,0 +1,90 @@
+# tools/stress_checkout.py
+# 複数プロセスから同時にチェックアウトして、注文が1件も失われないことを確かめる
+#
+#   python tools/stress_checkout.py --procs 8 --orders 50
+#   MENU_APP_ORDER_STORE=json python tools/stress_checkout.py
+#
+# 一時ディレクトリに data/ をコピーして実行するので、本物の data/ は汚さない。
+# 失われた/重複した注文があれば終了コード 1。
+import argparse, multiprocessing, os, shutil, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _worker(workdir, worker_no, n_orders, start_evt, results):
+    os.chdir(workdir)
+    import app_web
+    client = app_web.app.test_client()
+    item = app_web.get_catalog()[0]
+    start_evt.wait()
+    for i in range(n_orders):
+        # 数量を注文ごとに一意にして、あとでどの注文が残ったかを照合する
+        qty = worker_no * n_orders + i + 1
+        client.post("/add", data={"id": item["id"], "qty": str(qty)})
+        resp = client.post("/checkout")
+        if resp.status_code != 200:
+            raise SystemExit(f"worker {worker_no}: checkout failed ({resp.status_code})")
+    app_web.get_order_writer().close()   # 書き込み待ちを書き切ってから
+    app_web.get_order_store().close()
+    from storage import lock_stats
+    results.put(lock_stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同時チェックアウトのストレステスト")
+    parser.add_argument("--procs", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=50, help="1プロセスあたりの注文数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="menu-stress-")
+    try:
+        os.makedirs(os.path.join(workdir, "data"))
+        shutil.copy(os.path.join(ROOT, "data", "menus.json"), os.path.join(workdir, "data"))
+        os.chdir(workdir)
+        import config
+        if config.STORAGE_BACKEND == "sqlite":
+            import sqlite_store
+            sqlite_store.import_json(os.path.join("data", "menus.json"), [])
+
+        ctx = multiprocessing.get_context("spawn")
+        start_evt = ctx.Event()
+        results = ctx.Queue()
+        procs = [ctx.Process(target=_worker, args=(workdir, w, args.orders, start_evt, results))
+                 for w in range(args.procs)]
+        for p in procs:
+            p.start()
+        time.sleep(1.0)  # 全員の import が終わるのを待ってから一斉に開始
+        t0 = time.perf_counter()
+        start_evt.set()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+        if any(p.exitcode != 0 for p in procs):
+            print("ワーカーが異常終了しました")
+            return 1
+        contention = {"acquired": 0, "contended": 0, "wait_seconds": 0.0}
+        for _ in procs:
+            for k, v in results.get().items():
+                contention[k] += v
+
+        import order_store
+        store = order_store.get_order_store()
+        qtys = [rec["items"][0]["qty"] for rec in store.iter_records()]
+        expected = set(range(1, args.procs * args.orders + 1))
+        lost = expected - set(qtys)
+        dup = len(qtys) - len(set(qtys))
+
+        print(f"{args.procs} procs x {args.orders} orders: {elapsed:.2f}s "
+              f"({len(expected) / elapsed:.0f} orders/s)")
+        print(f"保存: {len(qtys)} / 期待: {len(expected)} / 欠落: {len(lost)} / 重複: {dup}")
+        print(f"store: {store.location}  ロック取得 {contention['acquired']} 回 / "
+              f"競合 {contention['contended']} 回 / 待ち {contention['wait_seconds']:.2f}s")
+        return 1 if lost or dup else 0
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
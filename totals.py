@@ -0,0 +1,65 @@
+# totals.py
+# 注文・カートの合計（金額 / カロリー / ドリンク量 / 糖質）の計算（app.py / app_gui.py / app_web.py で共通）
+#
+#   t = summarize([(item, qty), ...])        # 商品と数量の組（数量ぶん展開しない）
+#   t.price, t.calorie, t.volume_ml, t.sugar_g
+#   price, cal, vol, sugar = t               # タプルとしても使える
+#   summarize_lines(cart, catalog)           # Web のカート明細 [{"id", "qty", ...}] から
+#
+#   running = RunningTotals()                # 変更のたびに差分だけ足し引きする（GUI のカート）
+#   running.add(item, 3); running.add(item, -1)
+#   running.totals
+#
+# 商品ごとに (価格, カロリー, 容量, 糖質) の列を作り、数量の列との内積で4つの合計をまとめて出す。
+# 計算量は明細の行数に比例し、数量の大きさには依存しない（数量 999 でも1行ぶん）。
+from operator import mul
+from typing import Iterable, NamedTuple
+
+# 合計する属性（無いカテゴリは 0 として扱う。Drink に calorie は無い 等）
+FIELDS = ("price", "calorie", "volume_ml", "sugar_g")
+
+
+class Totals(NamedTuple):
+    price: int = 0
+    calorie: int = 0
+    volume_ml: int = 0
+    sugar_g: int = 0
+
+
+def vector(item) -> tuple:
+    """商品1つの (価格, カロリー, 容量, 糖質)"""
+    return tuple(getattr(item, f, 0) for f in FIELDS)
+
+
+def summarize(order: Iterable) -> Totals:
+    """order: (商品, 数量) の組の列"""
+    rows = [(vector(it), qty) for it, qty in order if qty]
+    if not rows:
+        return Totals()
+    vectors, qtys = zip(*rows)
+    # 列ごとに数量との内積（zip(*vectors) で行 → 列に並べ替える）
+    return Totals(*(sum(map(mul, column, qtys)) for column in zip(*vectors)))
+
+
+def summarize_lines(lines: Iterable, catalog) -> Totals:
+    """Web のカート明細（app_web.resolve_cart() の結果）から。栄養の値は catalog の商品で引く"""
+    return summarize((catalog.get(line["id"]), line["qty"]) for line in lines)
+
+
+class RunningTotals:
+    """数量の増減ぶんだけ足し引きしていく合計（1回の変更が O(1)、全体を数え直さない）"""
+
+    def __init__(self):
+        self._sums = [0] * len(FIELDS)
+
+    def add(self, item, qty: int):
+        """item を qty 個ぶん足す（減らすときは qty を負に）"""
+        for i, v in enumerate(vector(item)):
+            self._sums[i] += v * qty
+
+    def clear(self):
+        self._sums = [0] * len(FIELDS)
+
+    @property
+    def totals(self) -> Totals:
+        return Totals(*self._sums)
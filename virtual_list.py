@@ -0,0 +1,158 @@
+# virtual_list.py
+# 何万件でも軽い一覧（Tk）。見えている行だけを Listbox に入れ、スクロールしたら入れ替える
+#
+#   lst = VirtualList(parent, on_activate=lambda item: ...)   # ダブルクリック / Enter で on_activate(item)
+#   lst.set_items(items, label=index.label)    # items は .id を持つもの。label(item) は見える行のぶんだけ呼ぶ
+#   lst.selected_item()                        # 選択中の商品（無ければ None）
+#   lst.selected_id                            # 選択は行番号ではなく商品 ID で持つ（絞り込み直しても残る）
+#   lst.select(item_id)
+#
+# - 行の高さはフォントから求め、ウィジェットの高さに入る行数だけを描く（数十行）
+# - スクロールバー・マウスホイール・↑↓ / PageUp / PageDown / Home / End で動かす
+import tkinter as tk
+from tkinter import ttk
+import tkinter.font as tkfont
+
+
+class VirtualList(ttk.Frame):
+    def __init__(self, master, on_activate=None, **kw):
+        super().__init__(master, **kw)
+        self.on_activate = on_activate
+        self._items = []
+        self._label = str
+        self._top = 0               # 一番上に見えている行の位置
+        self._rows = 1              # 見えている行数
+        self._sel = None            # 選択中の行の位置
+        self.selected_id = None
+
+        self.lb = tk.Listbox(self, activestyle="none", exportselection=False, selectmode="browse")
+        self.sb = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.sb.pack(side="right", fill="y")
+        self.lb.pack(side="left", fill="both", expand=True)
+
+        font = tkfont.Font(font=self.lb.cget("font"))
+        self._line = font.metrics("linespace") + 1   # Listbox の1行の高さ
+        self.lb.bind("<Configure>", self._on_configure)
+        self.lb.bind("<Button-1>", self._on_click)
+        self.lb.bind("<Double-Button-1>", lambda e: self._activate())
+        self.lb.bind("<Return>", lambda e: self._activate())
+        self.lb.bind("<MouseWheel>", lambda e: self._scroll(-1 if e.delta > 0 else 1) or "break")
+        self.lb.bind("<Button-4>", lambda e: self._scroll(-1) or "break")
+        self.lb.bind("<Button-5>", lambda e: self._scroll(1) or "break")
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "-page"), ("<Next>", "page"),
+                          ("<Home>", "home"), ("<End>", "end")):
+            self.lb.bind(key, lambda e, s=step: self._move(s) or "break")
+        # Listbox 自身の選択やドラッグの動きは使わない（行は入れ替わるので）
+        self.lb.bind("<B1-Motion>", lambda e: "break")
+
+    # ----- データ
+    def set_items(self, items, label=None):
+        """一覧を差し替える。選択中の商品が新しい一覧にもあれば選択を残す"""
+        self._items = items
+        if label is not None:
+            self._label = label
+        self._sel = None
+        if self.selected_id is not None:
+            self._sel = next((i for i, it in enumerate(items) if it.id == self.selected_id), None)
+            if self._sel is None:
+                self.selected_id = None
+        self._top = 0 if self._sel is None else self._top
+        self._clamp_top()
+        if self._sel is not None:
+            self._ensure_visible(self._sel)
+        self._render()
+
+    def selected_item(self):
+        return self._items[self._sel] if self._sel is not None else None
+
+    def select(self, item_id):
+        pos = next((i for i, it in enumerate(self._items) if it.id == item_id), None)
+        self._set_selection(pos)
+
+    def __len__(self):
+        return len(self._items)
+
+    # ----- 表示
+    def _render(self):
+        lb = self.lb
+        lb.delete(0, "end")
+        window = self._items[self._top:self._top + self._rows]
+        if window:
+            lb.insert("end", *(self._label(it) for it in window))
+        if self._sel is not None and self._top <= self._sel < self._top + self._rows:
+            lb.selection_set(self._sel - self._top)
+        n = len(self._items)
+        if n:
+            self.sb.set(self._top / n, min(1.0, (self._top + self._rows) / n))
+        else:
+            self.sb.set(0.0, 1.0)
+
+    def _clamp_top(self):
+        self._top = max(0, min(self._top, len(self._items) - self._rows))
+
+    def _ensure_visible(self, pos):
+        if pos < self._top:
+            self._top = pos
+        elif pos >= self._top + self._rows:
+            self._top = pos - self._rows + 1
+        self._clamp_top()
+
+    def _set_selection(self, pos):
+        self._sel = pos
+        self.selected_id = self._items[pos].id if pos is not None else None
+        if pos is not None:
+            self._ensure_visible(pos)
+        self._render()
+
+    # ----- 操作
+    def _on_configure(self, event):
+        rows = max(1, (event.height - 4) // self._line)
+        if rows != self._rows:
+            self._rows = rows
+            self._clamp_top()
+            self._render()
+
+    def _on_scrollbar(self, *args):
+        n = len(self._items)
+        if args[0] == "moveto":
+            self._top = int(float(args[1]) * n)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self._top += step * (self._rows if args[2] == "pages" else 1)
+        self._clamp_top()
+        self._render()
+
+    def _scroll(self, lines):
+        self._top += lines * 3
+        self._clamp_top()
+        self._render()
+
+    def _on_click(self, event):
+        self.lb.focus_set()
+        pos = self._top + self.lb.nearest(event.y)
+        if 0 <= pos < len(self._items):
+            self._set_selection(pos)
+        return "break"
+
+    def _move(self, step):
+        n = len(self._items)
+        if not n:
+            return
+        cur = self._sel if self._sel is not None else self._top - 1
+        if step == "home":
+            pos = 0
+        elif step == "end":
+            pos = n - 1
+        elif step == "page":
+            pos = cur + self._rows
+        elif step == "-page":
+            pos = cur - self._rows
+        else:
+            pos = cur + step
+        self._set_selection(max(0, min(pos, n - 1)))
+
+    def _activate(self):
+        item = self.selected_item()
+        if item is not None and self.on_activate is not None:
+            self.on_activate(item)
+        return "break"